@@ -2,4 +2,12 @@
 # -*- coding: UTF-8 -*-
 
 
-from .cefbrowser import *  # noqa: F401,F403
+__all__ = ["CEFBrowser", "cef_test_url"]
+
+
+def __getattr__(name):
+    # Importing the package must stay cheap, see cefbrowser/__init__.py
+    if name in __all__:
+        from . import cefbrowser
+        return getattr(cefbrowser, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -3,9 +3,20 @@
 
 import os
 from .version import __version__  # noqa: F401
-from .cefbrowser import CEFBrowser  # noqa: F401
+
+__all__ = ["CEFBrowser", "cef_test_url"]
 
 cef_test_url = "file://" + os.path.join(
     os.path.dirname(os.path.realpath(__file__)),
     "test.html",
 )
+
+
+def __getattr__(name):
+    # CEFBrowser needs Kivy's window and cefpython. Import it on first use, so
+    # e.g. readers of exported frames (cefshm) can import this package in a
+    # process without both.
+    if name == "CEFBrowser":
+        from .cefbrowser import CEFBrowser
+        return CEFBrowser
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -5,14 +5,15 @@ The CEFBrowser Widget actually displays the browser. It displays ONLY the
 browser. If you need controls or tabs, check out the `examples`
 """
 
-import ctypes
 from functools import partial
+import inspect
 import json
 import os
 import random
 import time
+import weakref
 
-from kivy.core.clipboard import Clipboard
+from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.graphics import Color, Rectangle
 from kivy.graphics.texture import Texture
@@ -22,22 +23,75 @@ from kivy.logger import Logger
 from kivy.properties import StringProperty
 from kivy.properties import NumericProperty
 from kivy.properties import BooleanProperty
+from kivy.properties import OptionProperty
 from kivy.properties import ReferenceListProperty
 from kivy import resources
 from kivy.uix.behaviors import FocusBehavior
 from kivy.uix.bubble import Bubble, BubbleButton
 from kivy.uix.widget import Widget
 
-from .cefpython import cefpython, cefpython_initialize
+from .cefcapture import CEFFrameCapture
+from .cefhibernation import CEFHibernatedState, CEFNavigationHistory
+from .cefinput import CEFInputCoalescer, CEFKineticScroller
+from .cefpython import CEFInitializer, cefpython, cefpython_pump
+from .cefrecorder import CEFRecorder
+from .cefregistry import CEFBrowserRegistry
 from .cefkeyboard import CEFKeyboardManager
+from .cefpaint import CEFFrameCoalescer, merge_rects, paint_buffer_view, \
+    rects_area, texture_pool, upload
+from .cefshm import CEFFrameRingWriter, default_path
+from .cefstats import CEFFrameStatistics
 
 
 class CEFAlreadyInitialized(Exception):
     pass
 
 
+_kv_loaded = False
+
+
+def load_kv():
+    """ Loads the kv rules of the dialogs and widgets of cefbrowser.kv on
+    first use"""
+    global _kv_loaded
+    if not _kv_loaded:
+        Builder.load_file(os.path.join(
+            os.path.realpath(os.path.dirname(__file__)),
+            "cefbrowser.kv",
+        ))
+        _kv_loaded = True
+
+
+class CEFBrowserDialog:
+    """ A class attribute holding the dialog `factory_name` (see
+    cefbrowser.kv), which is created when it is used for the first time"""
+
+    def __init__(self, factory_name):
+        self.factory_name = factory_name
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        load_kv()
+        dialog = getattr(Factory, self.factory_name)()
+        for cls in owner.__mro__:
+            if cls.__dict__.get(self.name) is self:
+                setattr(cls, self.name, dialog)  # Replaces the descriptor
+        return dialog
+
+
 class CEFBrowser(Widget, FocusBehavior):
-    """Displays a Browser"""
+    """Displays a Browser
+    Besides the properties and handlers below, the constructor takes:
+    - `browser`: A CEF browser to adopt instead of creating one
+    - `browser_pool`: A CEFBrowserPool to take the CEF browser from (or a
+      CEFRemoteHost to run the CEF browser in its host process)
+    - `lazy`: Whether to create the CEF browser (and its texture) only when
+      the widget is added to the widget tree for the first time. Setting
+      `url` and calls like `go_back()` are replayed then, `js.*` calls when
+      the page has loaded."""
     # Class Variables
     certificate_error_handler = None
     """The value of the `certificate_error_handler` class variable is a
@@ -50,6 +104,10 @@ class CEFBrowser(Widget, FocusBehavior):
     If `certificate_error_handler` is None or cannot be executed, the default
     is False."""
     _cefpython_initialized = False
+    _cefpython_initializer = None
+    """The CEFInitializer, see `initialize_async()`"""
+    _cefpython_waiting = []
+    """What to call when cefpython is initialized"""
     _flags = {}
     """Flags for CEFBrowser"""
     _command_line_switches = {
@@ -63,6 +121,10 @@ class CEFBrowser(Widget, FocusBehavior):
     _cookies_path = None
     _logs_path = None
     _cookie_manager = None
+    _js_alert = CEFBrowserDialog("CEFBrowserJSAlert")
+    _js_confirm = CEFBrowserDialog("CEFBrowserJSConfirm")
+    _js_prompt = CEFBrowserDialog("CEFBrowserJSPrompt")
+    _auth_dialog = CEFBrowserDialog("CEFBrowserAuthDialog")
 
     # Instance Variables
     url = StringProperty("")
@@ -76,6 +138,45 @@ class CEFBrowser(Widget, FocusBehavior):
     title = StringProperty("")
     """The title of the currently displayed content
     (e.g. for tab/window title)"""
+    is_hibernated = BooleanProperty(False)
+    """Whether the CEF browser is closed to save memory (see `hibernate()`)"""
+    renderer_rss = NumericProperty(0)
+    """The memory (RSS in bytes) of the renderer processes of the browser,
+    sampled while a CEFMemoryMonitor tracks it"""
+    renderer_pss = NumericProperty(0)
+    """Like `renderer_rss`, but counting memory shared with other processes
+    proportionally (PSS)"""
+    frame_coalescing = BooleanProperty(False)
+    """Whether paints are collected and uploaded to the GPU once per Kivy frame
+    (just before drawing) instead of on every paint of CEF"""
+    coalesced_frames = NumericProperty(0)
+    """The number of paints that were merged into a later upload"""
+    dropped_frames = NumericProperty(0)
+    """The number of paints that never got uploaded, because the view was
+    resized in the meantime"""
+    input_coalescing = BooleanProperty(True)
+    """Whether mouse move and drag-over events are sent once per Kivy frame
+    (at the latest position of each touch) instead of on every motion event.
+    Clicks, drops and the like are always sent right away, in order."""
+    kinetic_scrolling = BooleanProperty(True)
+    """Whether two-finger scrolling goes on after the fingers are lifted,
+    slowing down by `scroll_friction`"""
+    scroll_friction = NumericProperty(.05)
+    """The part of the scroll velocity lost per 1/60 s after the fingers are
+    lifted (like the `friction` of Kivy's ScrollView effects)"""
+    render_scale = NumericProperty(1.)
+    """The resolution at which CEF renders the page, relative to the size of
+    the widget. With e.g. 0.5, CEF rasterizes a quarter of the pixels and the
+    GPU scales the texture up to the widget size."""
+    frame_rate = NumericProperty(60)
+    """The maximum rate (in frames per second) at which CEF paints the
+    browser. The `frame_rate_policy` may lower it."""
+    capture_mode = OptionProperty("off", options=("off", "single", "double"))
+    """Whether a copy of the latest paint is kept for `capture()`:
+    - "off": No copy (and no cost)
+    - "single": A captured frame changes with the next paint
+    - "double": A captured frame stays unchanged until the next `capture()`
+    Only the dirty rects of each paint are copied."""
     popup_policy = None
     """The value of the `popup_policy` variable is a function that handles
     the policy whether to allow or block popups.
@@ -116,12 +217,31 @@ class CEFBrowser(Widget, FocusBehavior):
     If `close_handler` is None, cannot be executed or doesn't remove `browser`
     from the widget tree, the default is to just leave the keyboard widget
     where it is."""
+    frame_rate_policy = None
+    """The value of the `frame_rate_policy` variable is a function that
+    decides at which rate CEF paints the browser.
+    It takes 1 argument:
+    - `browser`: The browser whose frame rate is (re-)evaluated
+    It should return the frame rate (usually at most `browser.frame_rate`)
+    It is re-evaluated whenever the frame rate, focus, parent, size or
+    position changes and on user interaction.
+    If `frame_rate_policy` is None or cannot be executed, the default is
+    `browser.frame_rate`."""
+    interaction_timeout = 3
+    """How long (in seconds) a browser counts as being interacted with after
+    the last touch or key event"""
+    tiny_area = 320 * 240
+    """Browsers smaller than this (in pixels) are considered previews"""
+    resize_delay = .1
+    """How long (in seconds) the size has to be stable before CEF is asked
+    to re-layout. Meanwhile the last texture is stretched to the new size."""
     _touches = []
     _browser = None
     _popup = None
     _texture = None
 
     def __init__(self, url="", *largs, **dargs):
+        load_kv()
         self.url = url
         self.popup_policy = dargs.pop(
             "popup_policy", CEFBrowser.always_block_popups)
@@ -131,32 +251,100 @@ class CEFBrowser(Widget, FocusBehavior):
             "close_handler", CEFBrowser.do_nothing)
         self.keyboard_position = dargs.pop(
             "keyboard_position", CEFBrowser.keyboard_position_optimal)
+        self.frame_rate_policy = dargs.pop(
+            "frame_rate_policy", CEFBrowser.fixed_frame_rate)
         self._browser = dargs.pop("browser", None)
+        self._browser_pool = dargs.pop("browser_pool", None)
+        lazy = dargs.pop("lazy", False)
+        self._deferred = []
+        self._deferred_js = []
+        self.history = CEFNavigationHistory()
+        """The URLs visited, also across hibernation"""
+        self.hibernated_state = None
+        """What is kept while hibernated (see `hibernate()`)"""
+        self._history_restored = False
+        self.renderer_pids = []
+        """The PIDs of the renderer processes (see `renderer_rss`)"""
         self._popup = CEFBrowserPopup(self)
         self._selection_bubble = CEFBrowserCutCopyPasteBubble(self)
         self.__rect = None
         self.__keyboard_state = {}
+        self._coalescer = CEFFrameCoalescer()
+        self._flush_paints_trigger = Clock.create_trigger(
+            self._flush_paints, -1)
+        self.stats = CEFFrameStatistics()
+        self.input_stats = CEFInputCoalescer()
+        """The pending move events and the input event rates (see
+        `input_coalescing`)"""
+        self._flush_input_trigger = Clock.create_trigger(
+            self._flush_input, -1)
+        self.scroller = CEFKineticScroller(self._on_scroll)
+        """Sums up the two-finger scrolling into one wheel event per frame
+        and flings (see `kinetic_scrolling`)"""
+        self._log_fps_trigger = Clock.create_trigger(self._log_fps, 1)
+        self._frame_export = None
+        self._capture = None
+        self._recorder = None
+        self._applied_frame_rate = None
+        self._hidden_repaint = False
+        self._last_interaction = 0
+        self._frame_rate_trigger = Clock.create_trigger(
+            self._apply_frame_rate)
+        self._frame_rate_decay_trigger = Clock.create_trigger(
+            self._apply_frame_rate, self.interaction_timeout + .1)
         self.js = CEFBrowserJSProxy(self)
 
-        super(CEFBrowser, self).__init__(**dargs)
-
         self.register_event_type("on_load_start")
         self.register_event_type("on_load_end")
         self.register_event_type("on_load_error")
         self.register_event_type("on_js_dialog")
         self.register_event_type("on_before_unload_dialog")
+        self.register_event_type("on_paint")
+
+        super(CEFBrowser, self).__init__(**dargs)
 
-        self._texture = Texture.create(
-            size=self.size, colorfmt="rgba", bufferfmt="ubyte")
-        self._texture.flip_vertical()
         with self.canvas:
             Color(1, 1, 1)
-            self.__rect = Rectangle(
-                pos=self.pos, size=self.size, texture=self._texture)
+            self.__rect = Rectangle(pos=self.pos, size=self.size)
+        self._realign_trigger = Clock.create_trigger(
+            self._realign, self.resize_delay)
 
-        if not CEFBrowser._cefpython_initialized:
-            cefpython_initialize(CEFBrowser)
-            CEFBrowser._cefpython_initialized = True
+        self.bind(size=self._on_size)
+        self.bind(pos=self._on_pos)
+        self.bind(parent=self._on_parent)
+        self.bind(focus=self._on_focus)
+        self.bind(
+            size=self._frame_rate_trigger,
+            pos=self._frame_rate_trigger,
+            parent=self._frame_rate_trigger,
+            focus=self._frame_rate_trigger,
+        )
+        self.html5_drag_representation = Factory.HTML5DragIcon()
+        self.history.visit(self.url)
+        if not lazy or self._browser or self.parent:
+            self._create_browser()
+
+    def _create_browser(self):
+        """ Creates the CEF browser (or adopts the one given as `browser` or
+        from the `browser_pool`) and its texture, then replays the calls
+        made in the meantime (see `lazy`)."""
+        # The browsers of a CEFRemoteHost don't need CEF in this process
+        remote = getattr(self._browser or self._browser_pool, "is_remote",
+                         False)
+        if not remote and not CEFBrowser._cefpython_initialized and \
+                CEFBrowser._cefpython_initializer and \
+                CEFBrowser._cefpython_initializer.is_running:
+            # Initializing asynchronously, show the placeholder until done
+            if self._attach not in CEFBrowser._cefpython_waiting:
+                CEFBrowser._cefpython_waiting.append(self._attach)
+            return
+        if not self._browser and self._browser_pool:
+            self._browser = self._browser_pool.acquire()
+        self._texture = texture_pool.acquire(self.view_size)
+        self._update_rect()
+
+        if not remote:
+            CEFBrowser.initialize_cefpython()
         if not self._browser:
             # On x11 input provider we have the window-id (handle)
             window_id = 0
@@ -169,18 +357,135 @@ class CEFBrowser(Widget, FocusBehavior):
             window_info.SetAsOffscreen(window_id)
             self._browser = cefpython.CreateBrowserSync(
                 window_info,
-                {"windowless_frame_rate": 60},
+                {"windowless_frame_rate": int(self.frame_rate)},
                 navigateUrl=self.url,
             )
+            self._applied_frame_rate = int(self.frame_rate)
+        else:
+            # Adopted (a popup or from a CEFBrowserPool)
+            self._browser.WasHidden(False)
+            if self.url and self.url != self._browser.GetUrl():
+                self._browser.Navigate(self.url)
+                cefpython_pump.schedule_work()
         self._browser.SetClientHandler(client_handler)
-        client_handler.browser_widgets[self._browser] = self
+        client_handler.registry.register(self._browser, self)
         self._browser.WasResized()
-        self.bind(size=self._realign)
-        self.bind(pos=self._realign)
-        self.bind(parent=self._on_parent)
-        self.bind(focus=self._on_focus)
-        self.html5_drag_representation = Factory.HTML5DragIcon()
+        self._frame_rate_trigger()
         self.js._inject()
+        if self.hibernated_state:
+            # CEF's own history is lost, go back and forth by `history`
+            self._history_restored = True
+            self.hibernated_state = None
+            self.is_hibernated = False
+        deferred, self._deferred = self._deferred, []
+        for call in deferred:
+            call()
+
+    def hibernate(self, snapshot_factor=1, frame=None):
+        """ Closes the CEF browser (and with it its renderer process and
+        texture) to save memory. Only the url, title, `history` and a
+        snapshot downscaled by `snapshot_factor` are kept. The snapshot is
+        `frame` (BGRA of the shape (height, width, 4)) or, if paints are
+        captured (see `capture_mode`), the last paint. It is shown until the
+        CEF browser is recreated by `wake()` or when the widget is added to
+        the widget tree again.
+        Returns the `hibernated_state`."""
+        if not self._browser:
+            return self.hibernated_state
+        if frame is None and self._capture:
+            frame = self._capture.capture()
+        self.hibernated_state = CEFHibernatedState(
+            self.url, self.title, self.history, frame, snapshot_factor)
+        browser, self._browser = self._browser, None
+        self.stop_export()
+        self.stop_recording()
+        self._coalescer.reset()
+        if self._capture:
+            self._capture.reset()
+        texture_pool.release(self._texture)
+        self._texture = self.hibernated_state.texture
+        self._update_rect()
+        self._applied_frame_rate = None
+        browser.WasHidden(True)
+        browser.CloseBrowser(True)  # DoClose() leaves the widget alone
+        cefpython_pump.schedule_work()
+        self.is_hibernated = True
+        return self.hibernated_state
+
+    def wake(self):
+        """ Recreates the CEF browser of a hibernated (or lazy) browser"""
+        if not self._browser:
+            self._create_browser()
+
+    def _attach(self):
+        """ Creates the CEF browser once cefpython is initialized (see
+        `initialize_async()`)"""
+        if not self._browser:
+            self._create_browser()
+
+    def _defer(self, fn, *largs):
+        """ Calls `fn` right away or, if the CEF browser is not created yet
+        (see `lazy`), once it is"""
+        if self._browser:
+            fn(*largs)
+        else:
+            self._deferred.append(partial(fn, *largs))
+
+    @property
+    def is_created(self):
+        """ Whether the CEF browser exists. With `lazy=True`, it is created
+        when the widget is added to the widget tree for the first time."""
+        return self._browser is not None
+
+    @classmethod
+    def initialize_cefpython(cls):
+        """ Initializes cefpython with the settings made so far. This
+        happens on creating the first CEFBrowser (or CEFBrowserPool), unless
+        `initialize_async()` was called before."""
+        if CEFBrowser._cefpython_initialized:
+            return
+        if not CEFBrowser._cefpython_initializer:
+            CEFBrowser._cefpython_initializer = CEFInitializer(CEFBrowser)
+        CEFBrowser._cefpython_initializer.run(
+            CEFBrowser._on_cefpython_initialized)
+
+    @classmethod
+    def initialize_async(cls, callback=None):
+        """ Starts initializing cefpython with the settings made so far in
+        the background, overlapped with building the UI (so call it as early
+        as possible, e.g. at the start of `App.build()`). CEFBrowsers created
+        meanwhile show a placeholder and get their CEF browser when it is
+        done. Then `callback()` is called and `initialization_timings` tells
+        how long the phases took."""
+        if callback:
+            CEFBrowser._cefpython_waiting.append(callback)
+        if CEFBrowser._cefpython_initialized:
+            return CEFBrowser._on_cefpython_initialized()
+        if not CEFBrowser._cefpython_initializer:
+            CEFBrowser._cefpython_initializer = CEFInitializer(CEFBrowser)
+        CEFBrowser._cefpython_initializer.start(
+            CEFBrowser._on_cefpython_initialized)
+
+    @classmethod
+    def initialization_timings(cls):
+        """ Returns the seconds the phases of initializing cefpython took
+        (see CEFInitializer.timings)"""
+        if not CEFBrowser._cefpython_initializer:
+            return {}
+        return dict(CEFBrowser._cefpython_initializer.timings)
+
+    @classmethod
+    def _on_cefpython_initialized(cls):
+        if not CEFBrowser._cefpython_initialized:
+            cefpython.SetGlobalClientCallback(
+                "OnAfterCreated", client_handler._OnAfterCreated)
+            cefpython.SetGlobalClientCallback(
+                "OnCertificateError", client_handler._OnCertificateError)
+            CEFBrowser._cefpython_initialized = True
+        waiting, CEFBrowser._cefpython_waiting = \
+            CEFBrowser._cefpython_waiting, []
+        for callback in waiting:
+            callback()
 
     @classmethod
     def update_flags(cls, d):
@@ -193,7 +498,7 @@ class CEFBrowser(Widget, FocusBehavior):
         """ Updates the command line switches for cefpython with the options
         given in the dict `d`.
         For possible keys and values, see the cefpython docs."""
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         CEFBrowser._command_line_switches.update(d)
         Logger.debug(
@@ -206,7 +511,7 @@ class CEFBrowser(Widget, FocusBehavior):
     def update_settings(cls, d):
         """ Updates the settings for cefpython with the options given in the dict `d`.
         For possible keys and values, see the cefpython docs."""
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         CEFBrowser._settings.update(d)
         Logger.debug("CEFBrowser: update_settings => %s", CEFBrowser._settings)
@@ -215,7 +520,7 @@ class CEFBrowser(Widget, FocusBehavior):
     def set_caches_path(cls, cp):
         """ The string `cp` is the path to a read- and writeable location
         where CEF can store its run-time caches."""
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         CEFBrowser._caches_path = cp
         Logger.debug(
@@ -229,7 +534,7 @@ class CEFBrowser(Widget, FocusBehavior):
     def set_cookies_path(cls, cp):
         """ The string `cp` is the path to a read- and writeable location
         where CEF can store its run-time cookies."""
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         CEFBrowser._cookies_path = cp
         Logger.debug(
@@ -243,7 +548,7 @@ class CEFBrowser(Widget, FocusBehavior):
     def set_logs_path(cls, lp):
         """ The string `lp` is the path to a read- and writeable location
         where CEF can write its log."""
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         CEFBrowser._logs_path = lp
         Logger.debug(
@@ -261,7 +566,7 @@ class CEFBrowser(Widget, FocusBehavior):
         - cookies to '`dp`/cookies'
         - logs to '`dp`/logs'
         """
-        if CEFBrowser._cefpython_initialized:
+        if CEFBrowser._cefpython_initializer:
             raise CEFAlreadyInitialized()
         if not os.path.isdir(dp):
             os.mkdir(dp, 0o700)
@@ -275,20 +580,47 @@ class CEFBrowser(Widget, FocusBehavior):
             CEFBrowser._logs_path,
         )
 
+    @property
+    def view_size(self):
+        """ The size of the view CEF renders (see `render_scale`)"""
+        return (
+            max(1, int(round(self.width * self.render_scale))),
+            max(1, int(round(self.height * self.render_scale))),
+        )
+
+    def _on_size(self, *largs):
+        """ Stretches the current texture to the new size right away, but
+        resizes the view only once the size stopped changing"""
+        if self.__rect:
+            self.__rect.size = self.size
+        self._realign_trigger.cancel()
+        self._realign_trigger()
+
+    def _on_pos(self, *largs):
+        """ Moving the widget does not concern CEF"""
+        if self.__rect:
+            self.__rect.pos = self.pos
+        try:
+            self._keyboard_update(**self.__keyboard_state)
+        except:
+            pass
+
     def _realign(self, *largs):
+        self._realign_trigger.cancel()
+        if not self._browser:  # Lazy or hibernated
+            if self.__rect:
+                self.__rect.pos = self.pos
+                self.__rect.size = self.size
+            return
         ts = self._texture.size
-        ss = self.size
+        ss = self.view_size
         schg = (ts[0] != ss[0] or ts[1] != ss[1])
         if schg:
-            self._texture = Texture.create(
-                size=self.size, colorfmt="rgba", bufferfmt="ubyte")
-            self._texture.flip_vertical()
+            texture_pool.release(self._texture)
+            self._texture = texture_pool.acquire(ss)
         if self.__rect:
-            with self.canvas:
-                Color(1, 1, 1)
-                self.__rect.pos = self.pos
-                if schg:
-                    self.__rect.size = self.size
+            self.__rect.pos = self.pos
+            self.__rect.size = self.size
             if schg:
                 self._update_rect()
         if self._browser:
@@ -300,6 +632,12 @@ class CEFBrowser(Widget, FocusBehavior):
             pass
 
     def _on_parent(self, obj, parent):
+        if not self._browser:
+            if not parent:
+                return
+            self._create_browser()
+            if not self._browser:
+                return  # Waiting for cefpython (see `initialize_async()`)
         self._browser.WasHidden(not parent)  # optimize the shit out of CEF
         try:
             self._keyboard_update(**self.__keyboard_state)
@@ -308,7 +646,7 @@ class CEFBrowser(Widget, FocusBehavior):
 
     def _on_focus(self, obj, focus):
         super(CEFBrowser, self)._on_focus(obj, focus)
-        if not focus and self.__keyboard_state["shown"]:
+        if not focus and self.__keyboard_state.get("shown") and self._browser:
             self._browser.GetMainFrame().ExecuteJavascript(
                 "__kivy__activeKeyboardElement.blur();")
 
@@ -316,25 +654,230 @@ class CEFBrowser(Widget, FocusBehavior):
         if self.__rect:
             self.__rect.texture = self._texture
 
+    def _flush_paints(self, *largs):
+        """ Uploads the paints collected since the last frame"""
+        for target in (self, self._popup):
+            coalescer = target._coalescer
+            if not coalescer.paints:
+                continue
+            if tuple(target._texture.size) != (
+                coalescer.width, coalescer.height,
+            ):
+                self.dropped_frames += coalescer.discard()
+                continue
+            since = coalescer.since
+            begin = time.time()
+            paints, nbytes = coalescer.flush(target._texture)
+            self.stats.record_upload(since, begin, time.time(), nbytes)
+            self.coalesced_frames += paints - 1
+            target._update_rect()
+
+    def _log_fps(self, *largs):
+        Logger.debug(
+            "CEFBrowser: FPS of %s: %f (%s)",
+            self.url, self.stats.paint_fps, self.stats.summary(),
+        )
+
+    def on_frame_coalescing(self, instance, value):
+        if not value:
+            self._flush_paints()
+            self._coalescer.reset()
+            self._popup._coalescer.reset()
+
+    def on_render_scale(self, instance, value):
+        if self.__rect:
+            self._realign()
+
+    def on_frame_rate(self, instance, value):
+        self._frame_rate_trigger()
+
+    def _on_interaction(self):
+        """ Called on every touch or key event"""
+        self._last_interaction = time.time()
+        if self._applied_frame_rate != int(self.frame_rate):
+            self._frame_rate_trigger()
+        self._frame_rate_decay_trigger()
+
+    def _apply_frame_rate(self, *largs):
+        """ Evaluates the `frame_rate_policy` and passes the result to CEF"""
+        if not self._browser:
+            return
+        rate = self.frame_rate
+        if hasattr(self.frame_rate_policy, "__call__"):
+            try:
+                rate = self.frame_rate_policy(self)
+            except Exception as err:
+                Logger.warning(
+                    "CEFBrowser: Frame rate policy failed with error: %s", err)
+        rate = max(1, int(rate))
+        if rate == self._applied_frame_rate:
+            return
+        try:
+            self._browser.SetWindowlessFrameRate(rate)
+        except AttributeError:
+            Logger.warning(
+                "CEFBrowser: This cefpython cannot change the frame rate")
+            return
+        Logger.debug("CEFBrowser: Frame rate of %s: %i", self.url, rate)
+        self._applied_frame_rate = rate
+
+    def visible_ratio(self):
+        """ Returns which part (0 to 1) of the browser lies within the
+        window"""
+        if not self.parent or not self.width or not self.height:
+            return 0
+        x0, y0 = self.to_window(self.x, self.y)
+        x1, y1 = self.to_window(self.right, self.top)
+        w = min(Window.width, max(x0, x1)) - max(0, min(x0, x1))
+        h = min(Window.height, max(y0, y1)) - max(0, min(y0, y1))
+        if w <= 0 or h <= 0:
+            return 0
+        return min(1, float(w * h) / (self.width * self.height))
+
+    def export_frames(self, path=None, slots=4, max_size=None):
+        """ Publishes every paint of the view into a ring buffer of `slots`
+        frames in shared memory, see `cefshm`. Frames larger than `max_size`
+        (default: the window or the view, whichever is larger) are skipped.
+        Returns the path of the ring, to be opened with `CEFFrameRingReader`.
+        """
+        self.stop_export()
+        if not path:
+            path = default_path("browser-%i" % id(self))
+        if not max_size:
+            max_size = (
+                max(self.view_size[0], int(Window.width*self.render_scale)),
+                max(self.view_size[1], int(Window.height*self.render_scale)),
+            )
+        self._frame_export = CEFFrameRingWriter(path, max_size, slots)
+        self.bind(on_paint=self._export_frame)
+        Logger.debug("CEFBrowser: Exporting frames of %s to %s", self.url,
+                     path)
+        return path
+
+    def stop_export(self):
+        """ Stops publishing paints and removes the ring buffer"""
+        if self._frame_export:
+            self.unbind(on_paint=self._export_frame)
+            self._frame_export.close()
+            self._frame_export = None
+
+    def _export_frame(self, instance, view, width, height, dirty_rects,
+                      timestamp):
+        self._frame_export.write(view, width, height, dirty_rects, timestamp)
+
+    def start_recording(self, path, **options):
+        """ Records the paints of the view into the file at `path` on a
+        background thread. For the formats and `options`, see `CEFRecorder`.
+        Returns the recorder, whose `summary()` tells how many paints were
+        dropped and what the recording cost the UI thread."""
+        self.stop_recording()
+        self._recorder = CEFRecorder(path, **options)
+        self.bind(on_paint=self._record_paint)
+        return self._recorder
+
+    def stop_recording(self, callback=None):
+        """ Stops the recording (if any) and returns its recorder. The file
+        is finished in the background, then `callback(summary)` is called
+        (see `CEFRecorder.stop()`)."""
+        if not self._recorder:
+            return None
+        self.unbind(on_paint=self._record_paint)
+        recorder, self._recorder = self._recorder, None
+        recorder.stop(callback)
+        return recorder
+
+    def _record_paint(self, instance, view, width, height, dirty_rects,
+                      timestamp):
+        self._recorder.record(view, width, height, timestamp)
+
+    def on_capture_mode(self, instance, value):
+        if value == "off":
+            if self._capture:
+                self.unbind(on_paint=self._capture_paint)
+                self._capture = None
+            return
+        if self._capture:
+            self._capture.double_buffered = value == "double"
+            return
+        self._capture = CEFFrameCapture(double_buffered=value == "double")
+        self.bind(on_paint=self._capture_paint)
+        self.invalidate()
+
+    def invalidate(self):
+        """ Asks CEF to paint the whole view again (e.g. to get a frame of a
+        page that doesn't change). A browser that is not displayed is shown
+        to CEF until it painted, because CEF doesn't paint hidden ones."""
+        if not self._browser:
+            return
+        if not self.parent:
+            self._hidden_repaint = True
+            self._browser.WasHidden(False)
+        try:
+            self._browser.Invalidate(cefpython.PET_VIEW)
+        except AttributeError:
+            pass  # The next frame comes with the next paint
+        cefpython_pump.schedule_work()
+
+    def _capture_paint(self, instance, view, width, height, dirty_rects,
+                       timestamp):
+        self._capture.record(view, width, height, dirty_rects, timestamp)
+
+    def capture(self):
+        """ Returns the latest paint of the view (without popups) in BGRA
+        layout as a NumPy array or a read-only memoryview of the shape
+        (height, width, 4), see `cefcapture`. It is taken from the paint
+        buffer of CEF, so it has the size of the view (see `render_scale`).
+        Returns None if `capture_mode` is "off" or nothing was painted yet.
+        """
+        if not self._capture:
+            Logger.warning("CEFBrowser: capture() needs a capture_mode")
+            return None
+        return self._capture.capture()
+
+    @property
+    def latest_frame(self):
+        """ The same as `capture()`"""
+        return self.capture()
+
     def go_back(self):
+        if not self._browser:
+            return self._defer(self.go_back)
+        if self._history_restored:
+            self.url = self.history.back() or self.url
+            return
         self._browser.GoBack()
+        cefpython_pump.schedule_work()
 
     def go_forward(self):
+        if not self._browser:
+            return self._defer(self.go_forward)
+        if self._history_restored:
+            self.url = self.history.forward() or self.url
+            return
         self._browser.GoForward()
+        cefpython_pump.schedule_work()
 
     def stop_loading(self):
+        if not self._browser:
+            return self._defer(self.stop_loading)
         self._browser.StopLoad()
 
     def reload(self, ignore_cache=True):
+        if not self._browser:
+            return self._defer(self.reload, ignore_cache)
         if ignore_cache:
             self._browser.ReloadIgnoreCache()
         else:
             self._browser.Reload()
+        cefpython_pump.schedule_work()
 
     def delete_cookie(self, url=""):
         """ Deletes the cookie with the given url. If url is empty all cookies
         get deleted.
         """
+        if getattr(self._browser, "is_remote", False):
+            self._browser.host.delete_cookies(url)
+            return
         cookie_manager = cefpython.CookieManager.GetGlobalManager()
         if cookie_manager:
             cookie_manager.DeleteCookies(url, "")
@@ -342,6 +885,7 @@ class CEFBrowser(Widget, FocusBehavior):
             Logger.warning("No cookie manager found!, Can't delete cookie(s)")
 
     def on_url(self, instance, value):
+        self.history.visit(value)
         if self._browser and value and value != self._browser.GetUrl():
             # print(
             #     "ON URL",
@@ -351,6 +895,7 @@ class CEFBrowser(Widget, FocusBehavior):
             #     self._browser.GetMainFrame().GetUrl(),
             # )
             self._browser.Navigate(self.url)
+            cefpython_pump.schedule_work()
 
     def on_js_dialog(
         self,
@@ -377,6 +922,12 @@ class CEFBrowser(Widget, FocusBehavior):
     def on_load_start(self, frame):
         pass
 
+    def on_paint(self, view, width, height, dirty_rects, timestamp):
+        """ Dispatched whenever CEF painted the view, before it is uploaded
+        to the texture. `view` holds the BGRA pixels (top-left origin) and is
+        only valid during the dispatch."""
+        pass
+
     def on_load_end(self, frame, http_status_code):
         pass
 
@@ -400,6 +951,8 @@ class CEFBrowser(Widget, FocusBehavior):
             "rect": rect,
             "attributes": attributes,
         }
+        if rect and self.render_scale != 1:
+            rect = [v / self.render_scale for v in rect]
         # print("KB", self.url, self.__keyboard_state, self.parent)
         if shown and self.parent:  # No orphaned keyboards
             self.focus = True
@@ -448,6 +1001,30 @@ class CEFBrowser(Widget, FocusBehavior):
             if keyboard_widget.y < 0:
                 keyboard_widget.y = 0
 
+    @classmethod
+    def fixed_frame_rate(cls, browser):
+        return browser.frame_rate
+
+    @classmethod
+    def throttled_frame_rate(cls, browser):
+        """ Full `frame_rate` while focused or interacted with. Otherwise half
+        of it, a quarter for tiny or mostly hidden browsers and 1 FPS for
+        browsers not in the widget tree."""
+        if not browser.parent:
+            return 1
+        rate = browser.frame_rate
+        if (
+            browser.focus or
+            time.time() - browser._last_interaction < cls.interaction_timeout
+        ):
+            return rate
+        if (
+            browser.width * browser.height < cls.tiny_area or
+            browser.visible_ratio() < .5
+        ):
+            return rate / 4
+        return rate / 2
+
     @classmethod
     def always_allow_popups(cls, browser, url):
         return True
@@ -482,29 +1059,49 @@ class CEFBrowser(Widget, FocusBehavior):
 
     def keyboard_on_key_down(self, *largs):
         # print("KEY DOWN", largs)
+        if not self._browser:
+            return  # Not created yet (see `initialize_async()`) or hibernated
         CEFKeyboardManager.kivy_on_key_down(self._browser, *largs)
+        cefpython_pump.schedule_work()
+        self._on_interaction()
 
     def keyboard_on_key_up(self, *largs):
         # print("KEY UP", largs)
+        if not self._browser:
+            return
         CEFKeyboardManager.kivy_on_key_up(self._browser, *largs)
+        cefpython_pump.schedule_work()
+        self._on_interaction()
 
     def keyboard_on_textinput(self, window, text):
+        if not self._browser:
+            return
         CEFKeyboardManager.kivy_keyboard_on_textinput(self._browser,
                                                       window, text)
+        cefpython_pump.schedule_work()
+        self._on_interaction()
 
     is_html5_drag = False  # Indicates if a html5 drag is happening
     is_html5_drag_leave = False  # Mouse leaves web view
     html5_drag_data = None
-    current_html5_drag_operation = cefpython.DRAG_OPERATION_NONE
+    current_html5_drag_operation = 0  # cefpython.DRAG_OPERATION_NONE
 
     def on_touch_down(self, touch, *kwargs):
         if not self.collide_point(*touch.pos):
             return
+        if not self._browser:
+            self.wake()  # Touching the snapshot of a hibernated browser
+            if not self._browser:
+                return True  # Still initializing (see `initialize_async()`)
+        cefpython_pump.schedule_work()
+        self._on_interaction()
 
         # Do not support more than two touches!
         if len(self._touches) > 2:
             return
 
+        self._flush_input()  # The moves of other touches come first
+        self.scroller.stop()  # Touching stops a fling
         touch.is_dragging = False
         touch.is_scrolling = False
         touch.is_right_click = False
@@ -516,6 +1113,8 @@ class CEFBrowser(Widget, FocusBehavior):
     def on_touch_move(self, touch, *kwargs):
         if touch.grab_current is not self:
             return
+        cefpython_pump.schedule_work()
+        self._on_interaction()
 
         x = touch.x - self.pos[0]
         y = self.height-touch.y + self.pos[1]
@@ -529,20 +1128,24 @@ class CEFBrowser(Widget, FocusBehavior):
                 if self.is_html5_drag:
                     if self.is_inside_window(touch.x, touch.y):
                         modifiers = cefpython.EVENTFLAG_LEFT_MOUSE_BUTTON
-                        self.cef_mouse_move(x, y, mouse_leave=False,
-                                            modifiers=modifiers)
+                        self._queue_input(
+                            ("move", touch.uid), self.cef_mouse_move,
+                            x, y, False, modifiers)
                         if self.is_html5_drag_leave:
-                            self.cef_drag_target_enter(
+                            self._send_input(
+                                self.cef_drag_target_enter,
                                 self.html5_drag_data, x, y,
                                 cefpython.DRAG_OPERATION_EVERY)
                             self.is_html5_drag_leave = False
-                        self.cef_drag_target_drag_over(
+                        self._queue_input(
+                            ("drag_over", touch.uid),
+                            self.cef_drag_target_drag_over,
                             x, y, cefpython.DRAG_OPERATION_EVERY)
                         self.update_drag_representation(touch.x, touch.y)
                     else:
                         if not self.is_html5_drag_leave:
                             self.is_html5_drag_leave = True
-                            self.cef_drag_target_drag_leave()
+                            self._send_input(self.cef_drag_target_drag_leave)
                 else:
                     if (
                         (abs(touch.dx) > 5 or abs(touch.dy) > 5) or
@@ -550,15 +1153,14 @@ class CEFBrowser(Widget, FocusBehavior):
                     ):
                         if touch.is_dragging:
                             modifiers = cefpython.EVENTFLAG_LEFT_MOUSE_BUTTON
-                            self.cef_mouse_move(
-                                x, y, mouse_leave=False,
-                                modifiers=modifiers,
-                            )
+                            self._queue_input(
+                                ("move", touch.uid), self.cef_mouse_move,
+                                x, y, False, modifiers)
                         else:
-                            self.cef_mouse_click(
+                            self._send_input(
+                                self.cef_mouse_click,
                                 x_start, y_start, cefpython.MOUSEBUTTON_LEFT,
-                                mouse_up=False, click_count=1,
-                            )
+                                False, 1)
                             touch.is_dragging = True
         elif len(self._touches) == 2:
             # Scroll only if a minimal distance passed (could be right click)
@@ -570,22 +1172,25 @@ class CEFBrowser(Widget, FocusBehavior):
                 for _touch in self._touches:
                     if _touch.is_dragging:
                         # End the drag event by releasing the mouse button
-                        self.cef_mouse_click(
+                        self._send_input(
+                            self.cef_mouse_click,
                             _touch.ppos[0], _touch.ppos[1],
-                            cefpython.MOUSEBUTTON_LEFT, mouse_up=True,
-                            click_count=1,
-                        )
+                            cefpython.MOUSEBUTTON_LEFT, True, 1)
                         _touch.is_dragging = False
                     # Set touch state to scrolling
                     _touch.is_scrolling = True
-                self.cef_mouse_wheel(
-                    touch.x, self.height-touch.pos[1], dx, -dy,
-                )
+                if not self.scroller.is_manual:
+                    self.scroller.begin()
+                self.scroller.position = (touch.x, self.height-touch.pos[1])
+                self.scroller.move(dx, -dy)
         return True
 
     def on_touch_up(self, touch, *kwargs):
         if touch.grab_current is not self:
             return
+        cefpython_pump.schedule_work()
+        self._on_interaction()
+        self._flush_input()  # The moves before the up event
 
         y = self.height-touch.pos[1] + self.pos[1]
         x = touch.x - self.pos[0]
@@ -629,6 +1234,10 @@ class CEFBrowser(Widget, FocusBehavior):
                         x, y, cefpython.MOUSEBUTTON_RIGHT,
                         mouse_up=True, click_count=1,
                     )
+                elif self.scroller.is_manual:
+                    self.scroller.end(
+                        self.scroll_friction if self.kinetic_scrolling
+                        else None)
             else:
                 if touch.is_dragging:
                     # Drag end (mouse up)
@@ -657,47 +1266,111 @@ class CEFBrowser(Widget, FocusBehavior):
         touch.ungrab(self)
         return True
 
+    def _queue_input(self, key, fn, *largs):
+        """ Sends a move event (`fn(*largs)`) with the next Kivy frame,
+        unless a later one with the same `key` replaces it"""
+        if not self.input_coalescing:
+            self.input_stats.send(fn, *largs)
+            return
+        self.input_stats.queue(key, fn, *largs)
+        self._flush_input_trigger()
+
+    def _send_input(self, fn, *largs):
+        """ Sends the pending move events and `fn(*largs)` right away"""
+        self.input_stats.send(fn, *largs)
+
+    def _flush_input(self, *largs):
+        self._flush_input_trigger.cancel()
+        if not self.input_stats:
+            return
+        if not self._browser:
+            self.input_stats.discard()
+            return
+        self.input_stats.flush()
+        cefpython_pump.schedule_work()
+
+    def _on_scroll(self):
+        self._queue_input("wheel", self._send_scroll)
+
+    def _send_scroll(self):
+        """ Sends what was scrolled since the last wheel event"""
+        dx, dy = self.scroller.take()
+        if not dx and not dy:
+            return
+        if self.scroller.is_flinging:
+            self._on_interaction()
+        self.cef_mouse_wheel(self.scroller.position[0],
+                             self.scroller.position[1], dx, dy)
+        self.stats.record_scroll(time.time())
+
     def cef_mouse_click(self, x, y, modifier, mouse_up, click_count):
         """ We do not call the functions of cefpython browser directly.
         This way we can overwrite this (cef_mouse_click) function to bind
         further actions (e.g. when a mouse click happens) in applications which
         use cefbrowser / garden.cefpython as a module.
+        Events for a widget without CEF browser (not created yet or
+        hibernated) are dropped.
         """
+        if not self._browser:
+            return
+        s = self.render_scale
         self._browser.SendMouseClickEvent(
-            x, y, modifier, mouseUp=mouse_up, clickCount=click_count)
+            x * s, y * s, modifier, mouseUp=mouse_up, clickCount=click_count)
 
     def cef_mouse_move(self, x, y, mouse_leave, modifiers):
         """ See cef_mouse_click """
-        self._browser.SendMouseMoveEvent(x, y, mouseLeave=mouse_leave,
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.SendMouseMoveEvent(x * s, y * s, mouseLeave=mouse_leave,
                                          modifiers=modifiers)
 
     def cef_mouse_wheel(self, x, y, dx, dy):
         """ See cef_mouse_click """
-        self._browser.SendMouseWheelEvent(x, y, dx, dy)
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.SendMouseWheelEvent(x * s, y * s, dx * s, dy * s)
 
     def cef_drag_target_enter(self, drag_data, x, y, operation):
         """ See cef_mouse_click """
-        self._browser.DragTargetDragEnter(drag_data, x, y,
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.DragTargetDragEnter(drag_data, x * s, y * s,
                                           operation)
 
     def cef_drag_target_drag_over(self, x, y, operation):
         """ See cef_mouse_click """
-        self._browser.DragTargetDragOver(x, y, operation)
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.DragTargetDragOver(x * s, y * s, operation)
 
     def cef_drag_target_drag_leave(self):
         """ See cef_mouse_click """
+        if not self._browser:
+            return
         self._browser.DragTargetDragLeave()
 
     def cef_drag_target_drop(self, x, y):
         """ See cef_mouse_click """
-        self._browser.DragTargetDrop(x, y)
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.DragTargetDrop(x * s, y * s)
 
     def cef_drag_source_ended_at(self, x, y, operation):
         """ See cef_mouse_click """
-        self._browser.DragSourceEndedAt(x, y, operation)
+        if not self._browser:
+            return
+        s = self.render_scale
+        self._browser.DragSourceEndedAt(x * s, y * s, operation)
 
     def cef_drag_source_system_drag_ended(self):
         """ See cef_mouse_click """
+        if not self._browser:
+            return
         self._browser.DragSourceSystemDragEnded()
 
     def is_inside_window(self, x, y):
@@ -742,20 +1415,24 @@ class CEFBrowserPopup(Widget):
     rx = NumericProperty(0)
     ry = NumericProperty(0)
     rpos = ReferenceListProperty(rx, ry)
+    view_width = NumericProperty(100)
+    view_height = NumericProperty(100)
+    view_size = ReferenceListProperty(view_width, view_height)
+    """The size of the popup as rendered by CEF (see `render_scale`)"""
 
     def __init__(self, browser_widget, *largs, **dargs):
         super(CEFBrowserPopup, self).__init__()
         self.browser_widget = browser_widget
         self.__rect = None
-        self._texture = Texture.create(
-            size=self.size, colorfmt="rgba", bufferfmt="ubyte")
-        self._texture.flip_vertical()
+        self._coalescer = CEFFrameCoalescer()
+        self._texture = texture_pool.acquire(self.view_size)
         with self.canvas:
             Color(1, 1, 1)
             self.__rect = Rectangle(
                 pos=self.pos, size=self.size, texture=self._texture)
         self.bind(rpos=self._realign)
         self.bind(size=self._realign)
+        self.bind(view_size=self._realign)
         browser_widget.bind(pos=self._realign)
         browser_widget.bind(size=self._realign)
 
@@ -764,18 +1441,14 @@ class CEFBrowserPopup(Widget):
         self.y = self.browser_widget.height - self.ry - self.height + \
             self.browser_widget.y
         ts = self._texture.size
-        ss = self.size
+        ss = self.view_size
         schg = (ts[0] != ss[0] or ts[1] != ss[1])
         if schg:
-            self._texture = Texture.create(
-                size=self.size, colorfmt="rgba", bufferfmt="ubyte")
-            self._texture.flip_vertical()
+            texture_pool.release(self._texture)
+            self._texture = texture_pool.acquire(ss)
         if self.__rect:
-            with self.canvas:
-                Color(1, 1, 1)
-                self.__rect.pos = self.pos
-                if schg:
-                    self.__rect.size = self.size
+            self.__rect.pos = self.pos
+            self.__rect.size = self.size
             if schg:
                 self._update_rect()
 
@@ -798,10 +1471,29 @@ class CEFBrowserJSFunctionProxy:
             js_code += json.dumps(arg)
             first = False
         js_code += ");"
+        if not self.browser_widget._browser:
+            # Replayed when the page has loaded (see `lazy`)
+            self.browser_widget._deferred_js.append(js_code)
+            return
         frame = self.browser_widget._browser.GetMainFrame()
         frame.ExecuteJavascript(js_code)
 
 
+def weak_function(fn):
+    """ Returns a function that calls the bound method `fn` without keeping
+    its object alive (the CEF browser keeps its JavaScript bindings, it must
+    not keep the widget alive, see CEFBrowserRegistry)"""
+    if not inspect.ismethod(fn):
+        return fn  # Not a bound method of a Python class (e.g. list.append)
+    ref = weakref.WeakMethod(fn)
+
+    def call(*largs):
+        method = ref()
+        if method is not None:
+            return method(*largs)
+    return call
+
+
 class CEFBrowserJSProxy:
     def __init__(self, browser_widget, *largs):
         self.browser_widget = browser_widget
@@ -821,11 +1513,14 @@ class CEFBrowserJSProxy:
         # after the call to Navigate() when OnLoadingStateChange()
         # is called with isLoading=False. Problem reported here:
         # http://www.magpcss.org/ceforum/viewtopic.php?f=6&t=11009
+        if not self.browser_widget._browser:
+            return  # Injected once the browser is created (see `lazy`)
         if not self.__js_bindings:
             self.__js_bindings = cefpython.JavascriptBindings(
                 bindToFrames=True, bindToPopups=True)
             for k in self.__js_bindings_dict:
-                self.__js_bindings.SetFunction(k, self.__js_bindings_dict[k])
+                self.__js_bindings.SetFunction(
+                    k, weak_function(self.__js_bindings_dict[k]))
             self.browser_widget._browser.SetJavascriptBindings(
                 self.__js_bindings)
         else:
@@ -878,6 +1573,8 @@ class CEFBrowserCutCopyPasteBubble(Bubble):
         # )
         if not self.browser_widget.parent:
             options["shown"] = False
+        if self.browser_widget.render_scale != 1:
+            rect = [v / self.browser_widget.render_scale for v in rect]
         self.pos = (
             self.browser_widget.x + rect[0] + (rect[2] - self.width) / 2,
             self.browser_widget.y + self.browser_widget.height - rect[1],
@@ -902,12 +1599,14 @@ class CEFBrowserCutCopyPasteBubble(Bubble):
         self.on_copy()
 
     def on_copy(self, *largs):
+        from kivy.core.clipboard import Clipboard
         Clipboard.put(self._text, "UTF8_STRING")
         Clipboard.put(self._text, "TEXT")
         Clipboard.put(self._text, "STRING")
         Clipboard.put(self._text, "text/plain")
 
     def on_paste(self, *largs):
+        from kivy.core.clipboard import Clipboard
         t = False
         for type in Clipboard.get_types():
             if type in ("UTF8_STRING", "TEXT", "STRING", "text/plain"):
@@ -920,24 +1619,26 @@ class CEFBrowserCutCopyPasteBubble(Bubble):
 
 
 class ClientHandler:
-    browser_widgets = {}
-    pending_popups = {}
-
     def __init__(self, *largs):
-        self.browser_widgets = {}
+        self.registry = CEFBrowserRegistry()
+        """The widgets of the browsers. Callbacks for browsers without a
+        widget (anymore) are ignored."""
 
     # DisplayHandler TODO: OnContentsSizeChange, OnFaviconURLChange,
     # OnNavStateChange
 
     def OnAddressChange(self, browser, frame, url):  # noqa: N802
-        if browser.GetMainFrame() == frame:
-            self.browser_widgets[browser].url = url
+        bw = self.registry.get(browser)
+        if bw and browser.GetMainFrame() == frame:
+            bw.url = url
         else:
             pass
             # print("TODO: Address changed in Frame")
 
     def OnTitleChange(self, browser, title):  # noqa: N802
-        self.browser_widgets[browser].title = title
+        bw = self.registry.get(browser)
+        if bw:
+            bw.title = title
 
     def OnTooltip(self, text_out):  # noqa: N802
         text_out.append("")
@@ -980,13 +1681,11 @@ class ClientHandler:
         callback,
         suppress_message_out,
     ):
+        # The dialogs are created on first use (see CEFBrowserDialog)
         dialog_types = {
-            cefpython.JSDIALOGTYPE_ALERT:
-                ["alert", CEFBrowser._js_alert],
-            cefpython.JSDIALOGTYPE_CONFIRM:
-                ["confirm", CEFBrowser._js_confirm],
-            cefpython.JSDIALOGTYPE_PROMPT:
-                ["prompt", CEFBrowser._js_prompt],
+            cefpython.JSDIALOGTYPE_ALERT: ["alert", "_js_alert"],
+            cefpython.JSDIALOGTYPE_CONFIRM: ["confirm", "_js_confirm"],
+            cefpython.JSDIALOGTYPE_PROMPT: ["prompt", "_js_prompt"],
         }
         # print(
         #     "OnJavascriptDialog",
@@ -1000,7 +1699,7 @@ class ClientHandler:
         #     suppress_message,
         #     largs,
         # )
-        p = dialog_types[dialog_type][1]
+        p = getattr(CEFBrowser, dialog_types[dialog_type][1])
         p.text = message_text
         p.js_continue = partial(self._js_continue, callback)
         p.default_prompt_text = default_prompt_text
@@ -1070,7 +1769,23 @@ class ClientHandler:
         Logger.debug("\tClient: %s", client)
         Logger.debug("\tBrowser Settings: %s", browser_settings_out)
         Logger.debug("\tNo JavaScript Access: %s", no_javascript_access_out)
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return True  # Block popups of closing browsers
+        if self._allow_popup(bw, target_url):
+            r = random.randint(1, 2**31-1)
+            wi = cefpython.WindowInfo()
+            wi.SetAsChild(0, [0, 0, 0, 0])
+            wi.SetAsOffscreen(r)
+            window_info_out.append(wi)
+            browser_settings_out.append({})
+            self.registry.add_popup(r, bw)
+            return False
+        else:
+            return True
+
+    def _allow_popup(self, bw, target_url):
+        """ Asks the `popup_policy` of `bw` whether to open `target_url`"""
         if hasattr(bw.popup_policy, "__call__"):
             try:
                 allow_popup = bw.popup_policy(bw, target_url)
@@ -1089,17 +1804,24 @@ class ClientHandler:
                 "Default is block.",
             )
             allow_popup = False
-        if allow_popup:
-            r = random.randint(1, 2**31-1)
-            wi = cefpython.WindowInfo()
-            wi.SetAsChild(0, [0, 0, 0, 0])
-            wi.SetAsOffscreen(r)
-            window_info_out.append(wi)
-            browser_settings_out.append({})
-            self.pending_popups[r] = browser
-            return False
+        return allow_popup
+
+    def _show_popup(self, bw, cb):
+        """ Lets the `popup_handler` of `bw` show the popup browser `cb`"""
+        if hasattr(bw.popup_handler, "__call__"):
+            try:
+                bw.popup_handler(bw, cb)
+            except Exception as err:
+                Logger.warning(
+                    "CEFBrowser: Popup handler failed with error: %s", err)
         else:
-            return True
+            Logger.info("CEFBrowser: No Popup handler detected.")
+        if not cb.parent:
+            Logger.warning(
+                "CEFBrowser: Popup handler did not add the " +
+                "popup_browser to the widget tree. Adding it to Window.",
+            )
+            Window.add_widget(cb)
 
     def _OnAfterCreated(self, browser):  # noqa: N802
         # print(
@@ -1113,28 +1835,13 @@ class ClientHandler:
         if browser.IsPopup():
             wh = browser.GetWindowHandle()
             cb = CEFBrowser(browser=browser)
-            bw = False
-            if wh in client_handler.pending_popups:
-                parent_browser = client_handler.pending_popups[wh]
-                if parent_browser in client_handler.browser_widgets:
-                    bw = client_handler.browser_widgets[parent_browser]
-            if not bw:
-                bw = client_handler.browser_widgets[
-                    client_handler.browser_widgets.iterkeys().next()]
-            if hasattr(bw.popup_handler, "__call__"):
-                try:
-                    bw.popup_handler(bw, cb)
-                except Exception as err:
-                    Logger.warning(
-                        "CEFBrowser: Popup handler failed with error: %s", err)
-            else:
-                Logger.info("CEFBrowser: No Popup handler detected.")
-            if not cb.parent:
-                Logger.warning(
-                    "CEFBrowser: Popup handler did not add the " +
-                    "popup_browser to the widget tree. Adding it to Window.",
-                )
-                Window.add_widget(cb)
+            bw = client_handler.registry.pop_popup(wh)
+            if bw is None:
+                # The opener is gone, let any other browser handle the popup
+                bw = next((
+                    widget for widget in client_handler.registry
+                    if widget is not cb), cb)
+            self._show_popup(bw, cb)
 
     """
     def RunModal(self, browser, *largs):  # noqa: N802
@@ -1144,7 +1851,11 @@ class ClientHandler:
         return False
     """
     def DoClose(self, browser):  # noqa: N802
-        bw = self.browser_widgets[browser]
+        bw = self.registry.unregister(browser)
+        if bw is None or bw._browser is not browser:
+            # Orphaned or hibernated, keep the widget
+            cefpython_pump.set_loading(browser.GetIdentifier(), False)
+            return False
         bw.focus = False
         if bw._selection_bubble.parent:
             bw._selection_bubble.parent.remove_widget(bw._selection_bubble)
@@ -1158,7 +1869,9 @@ class ClientHandler:
             bw.parent.remove_widget(bw)
         except:
             pass
-        del self.browser_widgets[browser]
+        cefpython_pump.set_loading(browser.GetIdentifier(), False)
+        bw.stop_export()
+        bw.stop_recording()
         return False
 
     def OnBeforeClose(self, browser):  # noqa: N802
@@ -1173,7 +1886,13 @@ class ClientHandler:
         can_go_back,
         can_go_forward,
     ):
-        bw = self.browser_widgets[browser]
+        cefpython_pump.set_loading(browser.GetIdentifier(), is_loading)
+        bw = self.registry.get(browser)
+        if bw is None or bw._browser is not browser:
+            return  # Closing or hibernated
+        if bw._history_restored:
+            can_go_back = bw.history.back() is not None
+            can_go_forward = bw.history.forward() is not None
         bw.is_loading = is_loading
         bw.can_go_back = can_go_back
         bw.can_go_forward = can_go_forward
@@ -1181,7 +1900,9 @@ class ClientHandler:
             bw.js._inject()
 
     def OnLoadStart(self, browser, frame):  # noqa: N802
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return
         bw.dispatch("on_load_start", frame)
         bw.focus = False
         if bw:
@@ -1374,7 +2095,13 @@ document.addEventListener("selectionchange", function (e) {
             frame.ExecuteJavascript(js_code)
 
     def OnLoadEnd(self, browser, frame, http_code):  # noqa: N802
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return
+        if bw._deferred_js and frame.IsMain():
+            deferred_js, bw._deferred_js = bw._deferred_js, []
+            for js_code in deferred_js:
+                frame.ExecuteJavascript(js_code)
         bw.dispatch("on_load_end", frame, http_code)
         # browser.SetZoomLevel(2.0) # this works at this point
 
@@ -1386,7 +2113,9 @@ document.addEventListener("selectionchange", function (e) {
         error_text_out,
         failed_url,
     ):
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return
         bw.dispatch(
             "on_load_error", frame, error_code, error_text_out, failed_url)
 
@@ -1396,7 +2125,11 @@ document.addEventListener("selectionchange", function (e) {
         return False
 
     def GetViewRect(self, browser, rect_out):  # noqa: N802
-        width, height = self.browser_widgets[browser]._texture.size
+        bw = self.registry.get(browser)
+        if bw is None or bw._browser is not browser:
+            rect_out.extend([0, 0, 1, 1])  # Closing, its paints are ignored
+            return True
+        width, height = bw._texture.size
         rect_out.append(0)
         rect_out.append(0)
         rect_out.append(width)
@@ -1416,15 +2149,21 @@ document.addEventListener("selectionchange", function (e) {
         return False
 
     def OnPopupShow(self, browser, show):  # noqa: N802
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return
         bw.remove_widget(bw._popup)
         if show:
             bw.add_widget(bw._popup)
 
     def OnPopupSize(self, browser, rect_out):  # noqa: N802
-        bw = self.browser_widgets[browser]
-        bw._popup.rpos = (rect_out[0], rect_out[1])
-        bw._popup.size = (rect_out[2], rect_out[3])
+        bw = self.registry.get(browser)
+        if bw is None:
+            return
+        s = bw.render_scale
+        bw._popup.view_size = (rect_out[2], rect_out[3])
+        bw._popup.rpos = (rect_out[0] / s, rect_out[1] / s)
+        bw._popup.size = (rect_out[2] / s, rect_out[3] / s)
 
     def OnPaint(  # noqa: N802
         self,
@@ -1436,51 +2175,42 @@ document.addEventListener("selectionchange", function (e) {
         height,
     ):
         # print("ON PAINT", browser, time.time())
-        if 'enable-fps' in CEFBrowser._flags:
-            if not hasattr(self, 'lastPaints'):
-                self.lastPaints = []
-            self.lastPaints.append(time.time())
-            while 10 < len(self.lastPaints):
-                self.lastPaints.pop(0)
-            if 1 < len(self.lastPaints):
-                Logger.debug(
-                    "CEFBrowser: FPS: %f",
-                    len(self.lastPaints) /
-                    (self.lastPaints[-1] - self.lastPaints[0]),
-                )
-        try:
-            pmvfm = ctypes.pythonapi.PyMemoryView_FromMemory
-            pmvfm.restype = ctypes.py_object
-            pmvfm.argtypes = (ctypes.c_void_p, ctypes.c_int64, ctypes.c_int)
-            view = pmvfm(paint_buffer.GetIntPointer(), width*height*4, 0x200)
-        except AttributeError:
-            """
-            # The following code gives a segmentation fault:
-            view = buffer('')
-            pbfi = ctypes.pythonapi.PyBuffer_FillInfo
-            pbfi.restype = ctypes.c_int
-            pbfi.argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
-                ctypes.c_ssize_t, ctypes.c_int, ctypes.c_int)
-            res = pbfi(
-                id(view), None, buf.GetIntPointer(), width*height*4, 0, 0)
-            print(pbfi, res)
-            """
-            view = paint_buffer.GetString(mode="bgra", origin="top-left")
-        bw = self.browser_widgets[browser]
+        paint_time = time.time()
+        cefpython_pump.schedule_work()  # Keep pumping while animating
+        view = paint_buffer_view(paint_buffer, width, height)
+        bw = self.registry.get(browser)
+        if bw is None or bw._browser is not browser:
+            return True  # Closing or hibernated
         if element_type != cefpython.PET_VIEW:
-            if (
-                bw._popup._texture.width * bw._popup._texture.height * 4 !=
-                width*height*4
-            ):
-                return True  # prevent segfault
-            bw._popup._texture.blit_buffer(
-                view, colorfmt="bgra", bufferfmt="ubyte")
-            bw._popup._update_rect()
-            return True
-        if bw._texture.width * bw._texture.height * 4 != width*height * 4:
+            target = bw._popup
+        else:
+            target = bw
+        if target._texture.width * target._texture.height != width*height:
+            bw.dropped_frames += 1
             return True  # prevent segfault
-        bw._texture.blit_buffer(view, colorfmt="bgra", bufferfmt="ubyte")
-        bw._update_rect()
+        rects = merge_rects(dirty_rects or [[0, 0, width, height]],
+                            width, height)
+        bw.stats.record_paint(
+            paint_time, float(rects_area(rects)) / max(1, width*height))
+        if 'enable-fps' in CEFBrowser._flags:
+            bw._log_fps_trigger()
+        if target is bw:
+            bw.dispatch("on_paint", view, width, height, rects, paint_time)
+            if bw._hidden_repaint:
+                # Painted for invalidate(), hide it again
+                bw._hidden_repaint = False
+                if not bw.parent and bw._browser is browser:
+                    browser.WasHidden(True)
+        if bw.frame_coalescing:
+            bw.dropped_frames += target._coalescer.record(
+                view, width, height, rects, paint_time)
+            bw._flush_paints_trigger()
+            return True
+        begin = time.time()
+        nbytes = upload(target._texture, view, width, height, rects,
+                        merged=True)
+        bw.stats.record_upload(paint_time, begin, time.time(), nbytes)
+        target._update_rect()
         return True
 
     def OnCursorChange(self, browser, cursor):  # noqa: N802
@@ -1506,18 +2236,23 @@ document.addEventListener("selectionchange", function (e) {
         -   DragSourceEndedAt - on mouse up
         -   DragSourceSystemDragEnded - on mouse up"""
         # Logger.debug("~~ StartDragging")
-        bw = self.browser_widgets[browser]
+        bw = self.registry.get(browser)
+        if bw is None:
+            return False
         bw._browser.DragTargetDragEnter(
             drag_data, x, y, cefpython.DRAG_OPERATION_EVERY)
         bw.is_html5_drag = True
         bw.is_html5_drag_leave = False
         bw.html5_drag_data = drag_data
         bw.current_html5_drag_operation = cefpython.DRAG_OPERATION_NONE
-        bw.update_drag_representation(x, y)
+        bw.update_drag_representation(
+            x / bw.render_scale, y / bw.render_scale)
         return True
 
     def UpdateDragCursor(self, browser, operation):  # noqa: N802
-        self.browser_widgets[browser].current_drag_operation = operation
+        bw = self.registry.get(browser)
+        if bw:
+            bw.current_drag_operation = operation
 
     # RequestHandler
 
@@ -1671,26 +2406,8 @@ document.addEventListener("selectionchange", function (e) {
 client_handler = ClientHandler()
 
 
-cefpython.SetGlobalClientCallback(
-    "OnAfterCreated", client_handler._OnAfterCreated)
-
-cefpython.SetGlobalClientCallback(
-    "OnCertificateError", client_handler._OnCertificateError)
-
-Builder.load_file(os.path.join(
-    os.path.realpath(os.path.dirname(__file__)),
-    "cefbrowser.kv",
-))
-CEFBrowser._js_alert = Factory.CEFBrowserJSAlert()
-CEFBrowser._js_confirm = Factory.CEFBrowserJSConfirm()
-CEFBrowser._js_prompt = Factory.CEFBrowserJSPrompt()
-CEFBrowser._auth_dialog = Factory.CEFBrowserAuthDialog()
-
-
 if __name__ == "__main__":
-    import os
     from kivy.app import App
-    from kivy.clock import Clock
     from kivy.uix.button import Button
     from kivy.uix.textinput import TextInput
     cef_test_url = "file://"+os.path.join(
@@ -1733,8 +2450,8 @@ if __name__ == "__main__":
             def popup_handler(self, popup_browser):
                 print("POPUP HANDLER", popup_browser)
                 pw = None
-                for key in client_handler.browser_widgets:
-                    pw = client_handler.browser_widgets[key].parent
+                for widget in client_handler.registry:
+                    pw = widget.parent
                     if pw:
                         break
                 popup_browser.pos = (Window.width/4, Window.height/4)
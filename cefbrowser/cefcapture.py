@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Frame Capture.
+Keeps a copy of the latest paint of a CEFBrowser in main memory, so its pixels
+can be inspected (visual checks, OCR, ...) without reading the texture back
+from the GPU. Only the dirty rects of each paint are copied.
+
+Captured frames are NumPy arrays if NumPy is installed, else read-only
+memoryviews. Both have the shape (height, width, 4) in BGRA layout with the
+top-left origin and expose `shape` and `strides`.
+'''
+
+from .cefpaint import copy_rect
+
+_numpy = []
+
+
+def load_numpy():
+    """ Returns the numpy module or None if it is not installed. It is
+    imported on first use, as importing it takes long."""
+    if not _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy.append(numpy)
+    return _numpy[0]
+
+
+def frame_array(buf, width, height):
+    """ Returns a read-only (height, width, 4) view of the BGRA frame `buf`
+    (no copy)"""
+    view = memoryview(buf).toreadonly()
+    numpy = load_numpy()
+    if numpy is not None:
+        return numpy.frombuffer(view, numpy.uint8).reshape(height, width, 4)
+    return view.cast("B", (height, width, 4))
+
+
+class CEFFrameCapture:
+    """ The copy of the latest paint.
+    Single-buffered, a captured frame is updated in place by the next paint.
+    With `double_buffered`, paints following a `capture()` go to a second
+    buffer (brought up to date with one full copy), so the captured frame
+    stays unchanged until the next `capture()`."""
+
+    def __init__(self, double_buffered=False):
+        self.double_buffered = double_buffered
+        self.width = 0
+        self.height = 0
+        self.timestamp = 0
+        """When the captured paint happened"""
+        self.paints = 0
+        self._buffers = []
+        self._current = 0
+        self._handed_out = None
+
+    def record(self, view, width, height, dirty_rects, timestamp):
+        self.paints += 1
+        self.timestamp = timestamp
+        if not self._buffers or (width, height) != (self.width, self.height):
+            # (Re)allocating: The view holds the whole frame, not just the
+            # dirty rects. Frames handed out keep their old buffers alive.
+            self._buffers = [bytearray(view)]
+            self._current = 0
+            self._handed_out = None
+            self.width, self.height = width, height
+            return
+        if self._handed_out == self._current:
+            if len(self._buffers) < 2:
+                self._buffers.append(bytearray(self._buffers[0]))
+            else:
+                self._buffers[1 - self._current][:] = \
+                    self._buffers[self._current]
+            self._current = 1 - self._current
+        current = self._buffers[self._current]
+        for rect in dirty_rects:
+            copy_rect(current, view, width, rect)
+
+    def capture(self):
+        """ Returns the latest frame or None if there was no paint yet"""
+        if not self._buffers:
+            return None
+        if self.double_buffered:
+            self._handed_out = self._current
+        return frame_array(
+            self._buffers[self._current], self.width, self.height)
+
+    def reset(self):
+        self._buffers = []
+        self._handed_out = None
+        self.width = self.height = 0
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Headless Rendering.
+Renders pages to PNG without a Kivy window: A number of offscreen browsers
+run concurrently (optionally in several worker processes), each page is
+written once it finished loading and did not paint for `quiet_period`
+seconds.
+
+    python -m cefbrowser.cefheadless jobs.json --concurrency 4
+
+where jobs.json is a list of {"url": ..., "size": [width, height],
+"path": ...}. From Python, use `CEFHeadlessRenderer(...).render(jobs)` or
+`render_batch(jobs, processes=...)`.
+'''
+
+import os
+import struct
+import sys
+import time
+import zlib
+
+if __name__ == '__main__':
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+from kivy.logger import Logger  # noqa: E402
+
+from .cefcapture import CEFFrameCapture  # noqa: E402
+from .cefpaint import bgra_to_rgba, merge_rects, \
+    paint_buffer_view  # noqa: E402
+from .cefpython import cefpython, cefpython_start  # noqa: E402
+
+
+def encode_png(view, width, height, level=6):
+    """ Returns the BGRA frame `view` (top-left origin) as PNG"""
+    rgba = bgra_to_rgba(view)
+    stride = width * 4
+    raw = b"".join(
+        b"\x00" + bytes(rgba[y * stride:(y + 1) * stride])
+        for y in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(
+            ">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw, level)),
+        chunk(b"IEND", b""),
+    ])
+
+
+class CEFHeadlessPage:
+    """ A page to be rendered (and the state of rendering it)"""
+
+    def __init__(self, url, size, path):
+        self.url = url
+        self.size = tuple(int(v) for v in size)
+        self.path = path
+        self.browser = None
+        self.capture = CEFFrameCapture()
+        self.started = 0
+        self.loaded = 0
+        """When the main frame finished loading (0 while loading)"""
+        self.last_paint = 0
+        self.http_code = None
+        self.error = None
+
+    def result(self):
+        return {
+            "url": self.url,
+            "path": self.path,
+            "ok": self.error is None,
+            "error": self.error,
+            "http_code": self.http_code,
+            "seconds": time.time() - self.started,
+        }
+
+
+class CEFHeadlessHandler:
+    """ The client handler of the headless browsers: Reports their view
+    size and collects their paints like the ClientHandler of CEFBrowser, but
+    without widgets."""
+
+    def __init__(self):
+        self.pages = {}
+        self.closing = set()
+        """Identifiers of the browsers closed but not destroyed yet"""
+
+    def GetRootScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetViewRect(self, browser, rect_out):  # noqa: N802
+        page = self.pages.get(browser.GetIdentifier())
+        if not page:
+            return False  # Closing
+        width, height = page.size
+        rect_out.extend([0, 0, width, height])
+        return True
+
+    def GetScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetScreenPoint(  # noqa: N802
+        self,
+        browser,
+        view_x,
+        view_y,
+        screen_coordinates_out,
+    ):
+        return False
+
+    def OnPaint(  # noqa: N802
+        self,
+        browser,
+        element_type,
+        dirty_rects,
+        paint_buffer,
+        width,
+        height,
+    ):
+        page = self.pages.get(browser.GetIdentifier())
+        if not page or element_type != cefpython.PET_VIEW:
+            return True
+        view = paint_buffer_view(paint_buffer, width, height)
+        page.last_paint = time.time()
+        page.capture.record(
+            view, width, height,
+            merge_rects(dirty_rects or [[0, 0, width, height]],
+                        width, height),
+            page.last_paint)
+        return True
+
+    def OnLoadStart(self, browser, frame):  # noqa: N802
+        page = self.pages.get(browser.GetIdentifier())
+        if page and frame.IsMain():
+            page.loaded = 0
+
+    def OnLoadEnd(self, browser, frame, http_code):  # noqa: N802
+        page = self.pages.get(browser.GetIdentifier())
+        if page and frame.IsMain():
+            page.loaded = time.time()
+            page.http_code = http_code
+
+    def OnLoadError(  # noqa: N802
+        self,
+        browser,
+        frame,
+        error_code,
+        error_text_out,
+        failed_url,
+    ):
+        page = self.pages.get(browser.GetIdentifier())
+        if page and frame.IsMain():
+            page.error = "%s (%s)" % (error_text_out, error_code)
+
+    def OnBeforePopup(self, browser, *largs):  # noqa: N802
+        return True  # Block popups
+
+    def DoClose(self, browser):  # noqa: N802
+        return False  # Let CEF close the browser
+
+    def OnBeforeClose(self, browser):  # noqa: N802
+        self.closing.discard(browser.GetIdentifier())
+
+
+class CEFHeadlessRenderer:
+    """ Renders pages with up to `concurrency` offscreen browsers"""
+    _settings = {}
+    """Settings for cefpython"""
+    _command_line_switches = {
+        "disable-gpu": "",
+        "disable-gpu-compositing": "",
+    }
+    """Command line switches for cefpython"""
+    _caches_path = None
+    _cookies_path = None
+    _logs_path = None
+    _cookie_manager = None
+    _cefpython_initialized = False
+    close_timeout = 5.
+    """How long `shutdown()` waits for the browsers to close"""
+
+    def __init__(self, concurrency=4, quiet_period=1., timeout=30.,
+                 frame_rate=30, settings=None, switches=None, data_path=None):
+        self.concurrency = concurrency
+        self.quiet_period = quiet_period
+        """How long a page must not have painted after loading"""
+        self.timeout = timeout
+        """How long a page may take at most"""
+        self.frame_rate = frame_rate
+        self.handler = CEFHeadlessHandler()
+        if settings:
+            self._settings = dict(self._settings, **settings)
+        if switches:
+            self._command_line_switches = dict(
+                self._command_line_switches, **switches)
+        if data_path:
+            if not os.path.isdir(data_path):
+                os.mkdir(data_path, 0o700)
+            self._caches_path = os.path.join(data_path, "caches")
+            self._cookies_path = os.path.join(data_path, "cookies")
+            self._logs_path = os.path.join(data_path, "logs")
+
+    def initialize(self):
+        if not CEFHeadlessRenderer._cefpython_initialized:
+            cefpython_start(self)
+            CEFHeadlessRenderer._cefpython_initialized = True
+
+    def shutdown(self):
+        """ Shuts CEF down once the closed browsers are destroyed (or after
+        `close_timeout` seconds)"""
+        if not CEFHeadlessRenderer._cefpython_initialized:
+            return
+        end = time.time() + self.close_timeout
+        while self.handler.closing and time.time() < end:
+            cefpython.MessageLoopWork()
+            time.sleep(0.002)
+        if self.handler.closing:
+            Logger.warning(
+                "CEFHeadless: Shutting down with %i browsers not closed",
+                len(self.handler.closing))
+        cefpython.Shutdown()
+        CEFHeadlessRenderer._cefpython_initialized = False
+
+    def render(self, jobs):
+        """ Renders `jobs` (dicts with "url", "size" and "path") and returns
+        a result dict for each of them"""
+        self.initialize()
+        pending = [
+            CEFHeadlessPage(job["url"], job["size"], job["path"])
+            for job in jobs]
+        results = [None] * len(pending)
+        order = dict((id(page), i) for i, page in enumerate(pending))
+        pending.reverse()
+        active = []
+        while pending or active:
+            while pending and len(active) < self.concurrency:
+                page = pending.pop()
+                self._open(page)
+                active.append(page)
+            cefpython.MessageLoopWork()
+            now = time.time()
+            for page in list(active):
+                if page.error is None and not self._is_done(page, now):
+                    if now - page.started < self.timeout:
+                        continue
+                    page.error = "Timeout"
+                if page.error is None:
+                    self._write(page)
+                self._close(page)
+                active.remove(page)
+                result = results[order[id(page)]] = page.result()
+                Logger.info("CEFHeadless: %s", result)
+            time.sleep(0.002)
+        return results
+
+    def _is_done(self, page, now):
+        return page.loaded and page.capture.paints and \
+            self.quiet_period <= now - max(page.loaded, page.last_paint)
+
+    def _open(self, page):
+        page.started = time.time()
+        window_info = cefpython.WindowInfo()
+        window_info.SetAsOffscreen(0)
+        page.browser = cefpython.CreateBrowserSync(
+            window_info,
+            {"windowless_frame_rate": int(self.frame_rate)},
+            navigateUrl=page.url,
+        )
+        self.handler.pages[page.browser.GetIdentifier()] = page
+        page.browser.SetClientHandler(self.handler)
+        page.browser.WasResized()
+
+    def _write(self, page):
+        try:
+            with open(page.path, "wb") as f:
+                f.write(encode_png(
+                    page.capture.capture(),
+                    page.capture.width, page.capture.height))
+        except Exception as err:
+            page.error = "Writing %s failed: %s" % (page.path, err)
+
+    def _close(self, page):
+        identifier = page.browser.GetIdentifier()
+        del self.handler.pages[identifier]
+        self.handler.closing.add(identifier)
+        page.browser.CloseBrowser(True)
+        page.browser = None
+
+
+def _render_worker(jobs, options):
+    renderer = CEFHeadlessRenderer(**options)
+    try:
+        return renderer.render(jobs)
+    finally:
+        renderer.shutdown()
+
+
+def render_batch(jobs, processes=1, **options):
+    """ Renders `jobs` (see `CEFHeadlessRenderer.render`) in `processes`
+    worker processes, each with its own CEF and `options` (see
+    `CEFHeadlessRenderer`). Returns the results in the order of `jobs`."""
+    jobs = list(jobs)
+    if processes <= 1:
+        return _render_worker(jobs, options)
+    import multiprocessing
+    # CEF does not survive fork(), every worker starts afresh. The workers
+    # must not let Kivy parse the command line of spawn.
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    context = multiprocessing.get_context("spawn")
+    chunks = [jobs[i::processes] for i in range(processes)]
+    with context.Pool(processes) as pool:
+        chunk_results = pool.starmap(
+            _render_worker, [(chunk, options) for chunk in chunks])
+    results = [None] * len(jobs)
+    for i, chunk_result in enumerate(chunk_results):
+        results[i::processes] = chunk_result
+    return results
+
+
+def main(argv):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("jobs", help="JSON file with the pages to render")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--quiet-period", type=float, default=1.)
+    parser.add_argument("--timeout", type=float, default=30.)
+    parser.add_argument("--data-path")
+    args = parser.parse_args(argv)
+    with open(args.jobs) as f:
+        jobs = json.load(f)
+    results = render_batch(
+        jobs, args.processes, concurrency=args.concurrency,
+        quiet_period=args.quiet_period, timeout=args.timeout,
+        data_path=args.data_path)
+    print(json.dumps(results, indent=2))
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Tab Hibernation.
+Every CEFBrowser keeps a renderer process and a texture of its size alive,
+even when it is not displayed. A CEFHibernationManager closes the CEF browser
+of tracked browsers that have not been displayed for `idle_timeout` seconds or
+that are not among the `max_active` most recently displayed ones (see
+`CEFBrowser.hibernate`). A hibernated browser keeps its url, title, history
+and a snapshot of its last frame, and is recreated when it is added to the
+widget tree again. The snapshot is taken from a paint CEF is asked for right
+before hibernating, so the browsers don't need to capture their paints.
+
+    hibernation = CEFHibernationManager(max_active=4, idle_timeout=600)
+    hibernation.track(browser)
+'''
+
+from functools import partial
+import sys
+import time
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from .cefpaint import create_texture, upload
+from .cefthumbnail import downscale
+
+
+class CEFNavigationHistory:
+    """ The main frame URLs a browser visited. CEF doesn't expose its
+    navigation entries to Python, so they are told from the URL changes: A
+    change to the previous (next) entry counts as going back (forward), any
+    other URL as a new entry."""
+    max_entries = 50
+
+    def __init__(self, entries=None, index=-1):
+        self.entries = list(entries or [])
+        self.index = index
+
+    def copy(self):
+        return CEFNavigationHistory(self.entries, self.index)
+
+    def visit(self, url):
+        if not url or self.current() == url:
+            return
+        if self.back() == url:
+            self.index -= 1
+        elif self.forward() == url:
+            self.index += 1
+        else:
+            del self.entries[self.index + 1:]
+            self.entries.append(url)
+            del self.entries[:-self.max_entries]
+            self.index = len(self.entries) - 1
+
+    def current(self):
+        if 0 <= self.index < len(self.entries):
+            return self.entries[self.index]
+        return None
+
+    def back(self):
+        """ Returns the URL going back leads to or None"""
+        if 0 < self.index:
+            return self.entries[self.index - 1]
+        return None
+
+    def forward(self):
+        """ Returns the URL going forward leads to or None"""
+        if self.index + 1 < len(self.entries):
+            return self.entries[self.index + 1]
+        return None
+
+
+class CEFHibernatedState:
+    """ What is left of a hibernated browser"""
+
+    def __init__(self, url, title, history, frame=None, snapshot_factor=1):
+        self.url = url
+        self.title = title
+        self.history = history.copy()
+        self.timestamp = time.time()
+        """When the browser was hibernated"""
+        self.texture = None
+        """The snapshot of the last frame (None if paints weren't
+        captured)"""
+        if frame is not None:
+            pixels, width, height = downscale(frame, snapshot_factor)
+            self.texture = create_texture((width, height))
+            upload(self.texture, pixels, width, height,
+                   [[0, 0, width, height]])
+
+    @property
+    def nbytes(self):
+        """Main memory the state takes (about)"""
+        return sys.getsizeof(self) + sys.getsizeof(self.url) + \
+            sys.getsizeof(self.title) + \
+            sum(sys.getsizeof(url) for url in self.history.entries)
+
+    @property
+    def texture_nbytes(self):
+        """GPU memory the snapshot takes"""
+        if not self.texture:
+            return 0
+        return self.texture.width * self.texture.height * 4
+
+
+class CEFHibernationManager:
+    """ Hibernates the tracked browsers that are not displayed"""
+    snapshot_timeout = 1.
+    """Seconds to wait for the paint of the snapshot, before hibernating
+    without one"""
+
+    def __init__(self, max_active=8, idle_timeout=300, snapshot_factor=2,
+                 check_interval=5):
+        self.max_active = max_active
+        """How many tracked browsers may have a CEF browser at most (the
+        displayed ones are never hibernated)"""
+        self.idle_timeout = idle_timeout
+        """Seconds a browser may not be displayed before it is hibernated"""
+        self.snapshot_factor = snapshot_factor
+        """How much the snapshots are downscaled"""
+        self.check_interval = check_interval
+        self.hibernations = 0
+        self.wakes = 0
+        self._tracked = {}
+        """The tracked browsers and when they were displayed last"""
+        self._snapshots = {}
+        """The browsers waiting for the paint of their snapshot (and the
+        event that hibernates them)"""
+        self._check_trigger = Clock.create_trigger(self.check)
+        self._check_event = Clock.schedule_interval(
+            self.check, check_interval)
+
+    def track(self, browser):
+        """ Hibernates `browser` when due"""
+        if browser in self._tracked:
+            return
+        self._tracked[browser] = time.time()
+        browser.bind(parent=self._on_parent)
+        browser.bind(is_hibernated=self._on_is_hibernated)
+        self._check_trigger()
+
+    def untrack(self, browser):
+        if self._tracked.pop(browser, None) is None:
+            return
+        self._cancel_snapshot(browser)
+        browser.unbind(parent=self._on_parent)
+        browser.unbind(is_hibernated=self._on_is_hibernated)
+
+    def close(self):
+        self._check_event.cancel()
+        self._check_trigger.cancel()
+        for browser in list(self._tracked):
+            self.untrack(browser)
+
+    def check(self, *largs):
+        """ Hibernates the browsers that are due"""
+        now = time.time()
+        active = []
+        for browser in self._tracked:
+            if browser.parent:
+                self._tracked[browser] = now
+            if browser.is_created and browser not in self._snapshots:
+                active.append(browser)
+        candidates = sorted(
+            (browser for browser in active if not browser.parent),
+            key=self._tracked.get)
+        for browser in candidates:
+            idle = now - self._tracked[browser]
+            if len(active) <= self.max_active and idle < self.idle_timeout:
+                continue
+            Logger.debug(
+                "CEFBrowser: Hibernating %s (not displayed for %.0fs)",
+                browser.url, idle)
+            self._hibernate(browser)
+            active.remove(browser)
+
+    def resident_size(self, browser):
+        """ Returns the main and GPU memory (in bytes) the hibernated
+        `browser` takes, (0, 0) if it is not hibernated"""
+        state = browser.hibernated_state
+        if not state:
+            return 0, 0
+        return state.nbytes, state.texture_nbytes
+
+    def stats(self):
+        hibernated = [
+            self.resident_size(browser)
+            for browser in self._tracked if browser.is_hibernated]
+        nbytes = sum(size[0] for size in hibernated)
+        texture_nbytes = sum(size[1] for size in hibernated)
+        return {
+            "tracked": len(self._tracked),
+            "active": sum(
+                1 for browser in self._tracked if browser.is_created),
+            "hibernated": len(hibernated),
+            "hibernations": self.hibernations,
+            "wakes": self.wakes,
+            "bytes": nbytes,
+            "texture_bytes": texture_nbytes,
+            "bytes_per_tab": nbytes // max(1, len(hibernated)),
+            "texture_bytes_per_tab": texture_nbytes // max(1, len(hibernated)),
+        }
+
+    def _hibernate(self, browser):
+        """ Hibernates `browser` with a snapshot of the paint CEF is asked
+        for (or right away, if it captures its paints anyway)"""
+        if browser.capture_mode != "off":
+            browser.hibernate(self.snapshot_factor)
+            return
+        browser.bind(on_paint=self._on_snapshot_paint)
+        self._snapshots[browser] = Clock.schedule_once(
+            partial(self._finish_hibernation, browser, None),
+            self.snapshot_timeout)
+        browser.invalidate()
+
+    def _on_snapshot_paint(self, browser, view, width, height, dirty_rects,
+                           timestamp):
+        # The view is only valid during the paint, and the browser can't be
+        # closed while it paints: Keep the snapshot, hibernate right after
+        pixels, width, height = downscale(
+            memoryview(view).cast("B", (height, width, 4)),
+            self.snapshot_factor)
+        self._cancel_snapshot(browser)
+        self._snapshots[browser] = Clock.schedule_once(partial(
+            self._finish_hibernation, browser,
+            memoryview(pixels).cast("B", (height, width, 4))))
+
+    def _finish_hibernation(self, browser, snapshot, *largs):
+        self._snapshots.pop(browser, None)
+        browser.unbind(on_paint=self._on_snapshot_paint)
+        if browser not in self._tracked or browser.parent:
+            return  # Displayed again in the meantime
+        if snapshot is None:
+            browser.hibernate(self.snapshot_factor)
+        else:
+            browser.hibernate(frame=snapshot)
+
+    def _cancel_snapshot(self, browser):
+        event = self._snapshots.pop(browser, None)
+        if event:
+            event.cancel()
+            browser.unbind(on_paint=self._on_snapshot_paint)
+
+    def _on_parent(self, browser, parent):
+        self._tracked[browser] = time.time()
+        if parent:
+            self._cancel_snapshot(browser)
+        self._check_trigger()
+
+    def _on_is_hibernated(self, browser, is_hibernated):
+        if is_hibernated:
+            self.hibernations += 1
+        else:
+            self.wakes += 1
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Input Coalescing.
+Touchscreens report several motion events per frame, and every event sent to
+CEF makes it hit-test the page. Move events only matter at their latest
+position, so they are queued per touch and sent at most once per frame.
+Events that must not be lost (clicks, drops, ...) are sent right away, after
+the pending ones, so CEF sees all events in order.
+Two-finger scrolling is summed up into one wheel event per frame and goes on
+after the fingers are lifted, slowing down like Kivy's ScrollView.
+'''
+
+from collections import OrderedDict
+import time
+
+from kivy.effects.kinetic import KineticEffect
+
+from .cefstats import CEFRingBuffer
+
+
+class CEFInputCoalescer:
+    """ Keeps the latest pending event per key (e.g. a move per touch) until
+    `flush()`. The statistics tell the rate of the events received from Kivy
+    and of the events sent to CEF."""
+
+    def __init__(self, size=240):
+        self._pending = OrderedDict()
+        self.received = 0
+        """Events queued or sent"""
+        self.sent = 0
+        """Events sent to CEF"""
+        self.merged = 0
+        """Events replaced by a later one before they were sent"""
+        self.flushes = 0
+        self._received_times = CEFRingBuffer(size)
+        self._sent_times = CEFRingBuffer(size)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def queue(self, key, fn, *largs):
+        """ Calls `fn(*largs)` on the next `flush()`, unless another event
+        with `key` is queued before. Keeps the position of the first pending
+        event with `key`."""
+        self._record_received()
+        if key in self._pending:
+            self.merged += 1
+        self._pending[key] = (fn, largs)
+
+    def send(self, fn, *largs):
+        """ Sends the pending events and calls `fn(*largs)`"""
+        self._record_received()
+        self.flush()
+        self._call(fn, largs)
+
+    def flush(self):
+        """ Sends the pending events in the order they were queued"""
+        if not self._pending:
+            return
+        pending = list(self._pending.values())
+        self._pending.clear()
+        self.flushes += 1
+        for fn, largs in pending:
+            self._call(fn, largs)
+
+    def discard(self):
+        self._pending.clear()
+
+    def reset(self):
+        self.discard()
+        self.received = self.sent = self.merged = self.flushes = 0
+        self._received_times.clear()
+        self._sent_times.clear()
+
+    def _call(self, fn, largs):
+        self.sent += 1
+        self._sent_times.append(time.time())
+        fn(*largs)
+
+    def _record_received(self):
+        self.received += 1
+        self._received_times.append(time.time())
+
+    @staticmethod
+    def _rate(times):
+        if len(times) < 2 or times.last() <= times.first():
+            return 0.
+        return (len(times) - 1) / (times.last() - times.first())
+
+    def stats(self):
+        """ Returns the counters and the recent rates (events per second)"""
+        return {
+            "received": self.received,
+            "sent": self.sent,
+            "merged": self.merged,
+            "flushes": self.flushes,
+            "pending": len(self._pending),
+            "received_rate": self._rate(self._received_times),
+            "sent_rate": self._rate(self._sent_times),
+        }
+
+
+class CEFKineticScroller:
+    """ Turns two-finger moves into wheel events: The deltas are summed up
+    until `take()` (once per frame), and after `end()` the scrolling goes on
+    with the velocity of the gesture, reduced by the friction every frame.
+    `on_scroll` is called whenever there is something to `take()`."""
+    min_velocity = 10
+    """Pixels per second below which a fling stops"""
+
+    def __init__(self, on_scroll):
+        self.on_scroll = on_scroll
+        self.position = (0, 0)
+        """Where the wheel events are sent (view coordinates)"""
+        self.flings = 0
+        self._effects = (KineticEffect(min_velocity=self.min_velocity),
+                         KineticEffect(min_velocity=self.min_velocity))
+        self._input = [0., 0.]
+        self._sent = [0, 0]
+        for effect in self._effects:
+            effect.bind(value=self._on_value)
+
+    @property
+    def is_manual(self):
+        """ Whether the fingers are on the screen"""
+        return self._effects[0].is_manual
+
+    @property
+    def is_flinging(self):
+        return not self.is_manual and \
+            any(effect.velocity for effect in self._effects)
+
+    def begin(self):
+        """ Starts a gesture (and stops a fling)"""
+        for i, effect in enumerate(self._effects):
+            effect.velocity = 0
+            self._input[i] = effect.value
+            effect.start(effect.value)
+
+    def move(self, dx, dy):
+        for i, delta in enumerate((dx, dy)):
+            self._input[i] += delta
+            self._effects[i].update(self._input[i])
+
+    def end(self, friction=None):
+        """ Ends the gesture, flinging with `friction` (the part of the
+        velocity lost per 1/60 s) or not at all if None"""
+        for i, effect in enumerate(self._effects):
+            if friction is None:
+                effect.is_manual = False
+                effect.velocity = 0
+                continue
+            effect.friction = friction
+            effect.std_dt = 1 / 60.
+            effect.stop(self._input[i])
+        if self.is_flinging:
+            self.flings += 1
+
+    def stop(self):
+        """ Stops a fling"""
+        if self.is_flinging:
+            for effect in self._effects:
+                effect.velocity = 0
+
+    def take(self):
+        """ Returns the whole pixels scrolled since the last call (dx, dy)"""
+        deltas = []
+        for i, effect in enumerate(self._effects):
+            delta = int(effect.value - self._sent[i])
+            self._sent[i] += delta
+            deltas.append(delta)
+        return tuple(deltas)
+
+    def _on_value(self, effect, value):
+        self.on_scroll()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Renderer Memory Monitor.
+Samples the memory (RSS and PSS) of the CEF renderer processes from /proc
+(Linux only) on a background thread and sets `renderer_rss` and
+`renderer_pss` of the tracked CEFBrowsers. When a browser or all renderers
+together cross a limit, events are dispatched, so the application can e.g.
+reload, throttle or hibernate the browser:
+
+    monitor = CEFMemoryMonitor(browser_limit=512 << 20)
+    monitor.track(browser)
+    monitor.bind(on_browser_limit=lambda monitor, browser, rss: ...)
+
+cefpython doesn't tell which renderer process belongs to which browser.
+A renderer process that appears is attributed to the tracked browser that
+started loading a page the longest ago without getting a renderer process
+yet (CEF starts a new renderer process for a new browser and on most
+navigations to another site). Renderer processes that can't be attributed
+are only counted in the totals.
+'''
+
+from functools import partial
+import os
+import threading
+import time
+
+from kivy.clock import Clock
+from kivy.event import EventDispatcher
+from kivy.logger import Logger
+from kivy.properties import NumericProperty
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def child_pids(root_pid):
+    """ Returns the PIDs of all descendants of `root_pid`"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % name, "rb") as f:
+                stat = f.read()
+        except (IOError, OSError):
+            continue  # Exited meanwhile
+        # The command may contain spaces and parentheses, the ppid follows
+        # the state after the last ")"
+        ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        children.setdefault(ppid, []).append(int(name))
+    pids = []
+    parents = [root_pid]
+    while parents:
+        for pid in children.get(parents.pop(), []):
+            pids.append(pid)
+            parents.append(pid)
+    return pids
+
+
+def renderer_pids(root_pid=None):
+    """ Returns the PIDs of the CEF renderer processes below `root_pid`
+    (this process by default)"""
+    pids = []
+    for pid in child_pids(root_pid or os.getpid()):
+        try:
+            with open("/proc/%i/cmdline" % pid, "rb") as f:
+                arguments = f.read().split(b"\0")
+        except (IOError, OSError):
+            continue
+        if b"--type=renderer" in arguments:
+            pids.append(pid)
+    return pids
+
+
+def process_memory(pid):
+    """ Returns the RSS and PSS of `pid` in bytes (the PSS is 0 if the
+    kernel doesn't report it) or None if the process is gone"""
+    try:
+        with open("/proc/%i/statm" % pid) as f:
+            rss = int(f.read().split()[1]) * PAGE_SIZE
+    except (IOError, OSError):
+        return None
+    pss = 0
+    try:
+        with open("/proc/%i/smaps_rollup" % pid) as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    pss = int(line.split()[1]) * 1024
+                    break
+    except (IOError, OSError):
+        pass
+    return rss, pss
+
+
+class CEFMemoryMonitor(EventDispatcher):
+    """ Samples the renderer processes every `interval` seconds"""
+    total_rss = NumericProperty(0)
+    """The RSS of all renderer processes (in bytes)"""
+    total_pss = NumericProperty(0)
+    """The PSS of all renderer processes (in bytes), which counts shared
+    memory only once"""
+    renderer_processes = NumericProperty(0)
+    browser_limit = NumericProperty(0)
+    """The RSS (in bytes) above which a browser dispatches
+    `on_browser_limit` (0 for no limit)"""
+    total_limit = NumericProperty(0)
+    """The RSS (in bytes) above which all renderer processes together
+    dispatch `on_total_limit` (0 for no limit)"""
+    attribution_timeout = 10
+    """How long (in seconds) a new renderer process may take to appear after
+    a browser started loading to be attributed to it"""
+
+    def __init__(self, interval=2., root_pid=None, **kwargs):
+        self.register_event_type("on_browser_limit")
+        self.register_event_type("on_total_limit")
+        super(CEFMemoryMonitor, self).__init__(**kwargs)
+        self.interval = interval
+        self.root_pid = root_pid or os.getpid()
+        self.samples = 0
+        self._pids = {}
+        """The renderer PIDs and the browsers they are attributed to"""
+        self._pending = []
+        """The browsers waiting for a renderer process, oldest first"""
+        self._tracked = set()
+        self._over_limit = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="CEFMemoryMonitor")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def track(self, browser):
+        if browser in self._tracked:
+            return
+        self._tracked.add(browser)
+        self._pending.append((time.time(), browser))
+        browser.bind(on_load_start=self._on_load_start)
+
+    def untrack(self, browser):
+        if browser not in self._tracked:
+            return
+        self._tracked.discard(browser)
+        self._over_limit.discard(browser)
+        browser.unbind(on_load_start=self._on_load_start)
+        self._pending = [
+            entry for entry in self._pending if entry[1] is not browser]
+        for pid in [p for p, b in self._pids.items() if b is browser]:
+            self._pids[pid] = None
+        browser.renderer_pids = []
+        browser.renderer_rss = browser.renderer_pss = 0
+
+    def stop(self):
+        self._stop.set()
+        for browser in list(self._tracked):
+            self.untrack(browser)
+
+    def stats(self):
+        return {
+            "samples": self.samples,
+            "renderer_processes": self.renderer_processes,
+            "unattributed": sum(1 for b in self._pids.values() if b is None),
+            "total_rss": self.total_rss,
+            "total_pss": self.total_pss,
+            "browsers": dict(
+                (browser.url, browser.renderer_rss)
+                for browser in self._tracked),
+        }
+
+    def on_browser_limit(self, browser, rss):
+        pass
+
+    def on_total_limit(self, rss):
+        pass
+
+    def _on_load_start(self, browser, frame):
+        if frame.IsMain() and not any(
+                b is browser for t, b in self._pending):
+            self._pending.append((time.time(), browser))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sample = {}
+                for pid in renderer_pids(self.root_pid):
+                    memory = process_memory(pid)
+                    if memory:
+                        sample[pid] = memory
+                Clock.schedule_once(partial(self._apply, sample))
+            except Exception as err:
+                Logger.warning(
+                    "CEFBrowser: Sampling renderer memory failed: %s", err)
+            self._stop.wait(self.interval)
+
+    def _apply(self, sample, *largs):
+        """ Attributes and publishes a `sample` (on the UI thread)"""
+        if self._stop.is_set():
+            return
+        self.samples += 1
+        now = time.time()
+        self._pending = [
+            entry for entry in self._pending
+            if now - entry[0] < self.attribution_timeout]
+        for pid in list(self._pids):
+            if pid not in sample:
+                del self._pids[pid]
+        for pid in sorted(sample):
+            if pid not in self._pids:
+                browser = None
+                if self._pending:
+                    browser = self._pending.pop(0)[1]
+                self._pids[pid] = browser
+        per_browser = dict((browser, []) for browser in self._tracked)
+        for pid, browser in self._pids.items():
+            if browser is not None:
+                per_browser[browser].append(pid)
+        for browser, pids in per_browser.items():
+            browser.renderer_pids = pids
+            browser.renderer_rss = sum(sample[pid][0] for pid in pids)
+            browser.renderer_pss = sum(sample[pid][1] for pid in pids)
+            self._check_limit(
+                browser, browser.renderer_rss, self.browser_limit,
+                "on_browser_limit", browser)
+        self.renderer_processes = len(sample)
+        self.total_rss = sum(memory[0] for memory in sample.values())
+        self.total_pss = sum(memory[1] for memory in sample.values())
+        self._check_limit(
+            self, self.total_rss, self.total_limit, "on_total_limit")
+
+    def _check_limit(self, key, rss, limit, event, *largs):
+        """ Dispatches `event` when `rss` crosses `limit` upwards"""
+        if not limit or rss <= limit:
+            self._over_limit.discard(key)
+            return
+        if key in self._over_limit:
+            return
+        self._over_limit.add(key)
+        Logger.warning(
+            "CEFBrowser: Renderer memory limit exceeded (%i > %i bytes): %s",
+            rss, limit, getattr(key, "url", "all renderers"))
+        self.dispatch(event, *(largs + (rss,)))
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Paint Manager.
+CEF tells us in every OnPaint which parts of the view changed. Uploading only
+these parts to the texture is outsourced to this file.
+'''
+
+import ctypes
+
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+
+FULL_UPLOAD_RATIO = 0.6
+"""When the merged dirty rects cover at least this ratio of the view, the
+whole buffer is uploaded in one go (which needs no intermediate copy)."""
+MAX_DIRTY_RECTS = 8
+"""When more rects remain after merging, their bounding rect is uploaded."""
+
+_texture_colorfmt = None
+
+
+def texture_colorfmt():
+    """ Returns the color format for the textures: "bgra" (as painted by CEF)
+    if the GL context takes BGRA uploads natively, else "rgba". This is
+    detected once, on the first call (which needs a GL context)."""
+    global _texture_colorfmt
+    if _texture_colorfmt is None:
+        try:
+            from kivy.graphics.opengl_utils import \
+                gl_has_texture_native_format
+            native = gl_has_texture_native_format("bgra")
+        except Exception as e:
+            Logger.warning("CEFBrowser: Could not detect BGRA support: %s", e)
+            native = False
+        _texture_colorfmt = "bgra" if native else "rgba"
+        Logger.info(
+            "CEFBrowser: Using %s textures (native BGRA: %s)",
+            _texture_colorfmt, bool(native))
+    return _texture_colorfmt
+
+
+def create_texture(size):
+    """ Creates a texture for the paints of CEF"""
+    texture = Texture.create(
+        size=size, colorfmt=texture_colorfmt(), bufferfmt="ubyte")
+    texture.flip_vertical()
+    return texture
+
+
+def paint_buffer_view(paint_buffer, width, height):
+    """ Returns the BGRA pixels of the `paint_buffer` CEF passes to OnPaint:
+    A memoryview of CEF's memory (no copy, only valid during OnPaint) or, if
+    that is not possible, a copy."""
+    try:
+        pmvfm = ctypes.pythonapi.PyMemoryView_FromMemory
+        pmvfm.restype = ctypes.py_object
+        pmvfm.argtypes = (ctypes.c_void_p, ctypes.c_int64, ctypes.c_int)
+        return pmvfm(paint_buffer.GetIntPointer(), width*height*4, 0x200)
+    except AttributeError:
+        """
+        # The following code gives a segmentation fault:
+        view = buffer('')
+        pbfi = ctypes.pythonapi.PyBuffer_FillInfo
+        pbfi.restype = ctypes.c_int
+        pbfi.argtypes = (ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p,
+            ctypes.c_ssize_t, ctypes.c_int, ctypes.c_int)
+        res = pbfi(
+            id(view), None, buf.GetIntPointer(), width*height*4, 0, 0)
+        print(pbfi, res)
+        """
+        return paint_buffer.GetString(mode="bgra", origin="top-left")
+
+
+def bgra_to_rgba(view):
+    """ Returns a copy of the BGRA buffer `view` with blue and red swapped.
+    Extended slices do the swap in C, not per pixel in Python."""
+    out = bytearray(view)
+    out[0::4], out[2::4] = out[2::4], out[0::4]
+    return out
+
+
+def clip_rect(rect, width, height):
+    """ Returns `rect` ([x, y, w, h]) clipped to a view of `width` x `height`
+    or None if nothing of it is inside the view."""
+    x0 = max(0, int(rect[0]))
+    y0 = max(0, int(rect[1]))
+    x1 = min(width, int(rect[0]) + int(rect[2]))
+    y1 = min(height, int(rect[1]) + int(rect[3]))
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+def union_rect(a, b):
+    x0 = min(a[0], b[0])
+    y0 = min(a[1], b[1])
+    x1 = max(a[0] + a[2], b[0] + b[2])
+    y1 = max(a[1] + a[3], b[1] + b[3])
+    return [x0, y0, x1 - x0, y1 - y0]
+
+
+def _touching(a, b):
+    """ Whether the rects `a` and `b` overlap or share an edge"""
+    return (
+        a[0] <= b[0] + b[2] and b[0] <= a[0] + a[2] and
+        a[1] <= b[1] + b[3] and b[1] <= a[1] + a[3]
+    )
+
+
+def merge_rects(rects, width, height):
+    """ Clips all `rects` to the view and merges overlapping or adjacent ones
+    into their bounding rect. Returns a list of disjoint [x, y, w, h]."""
+    merged = []
+    for rect in rects:
+        rect = clip_rect(rect, width, height)
+        if not rect:
+            continue
+        i = 0
+        while i < len(merged):
+            if _touching(merged[i], rect):
+                # The union may touch rects we already checked: start over
+                rect = union_rect(merged.pop(i), rect)
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    if MAX_DIRTY_RECTS < len(merged):
+        rect = merged[0]
+        for other in merged[1:]:
+            rect = union_rect(rect, other)
+        merged = [rect]
+    return merged
+
+
+def rects_area(rects):
+    return sum(rect[2] * rect[3] for rect in rects)
+
+
+def extract_rect(view, width, rect):
+    """ Returns the BGRA pixels of `rect` out of the full frame `view` (with
+    `width` pixels per row) as one contiguous buffer."""
+    x, y, w, h = rect
+    stride = width * 4
+    if w == width:
+        # Whole rows are contiguous in the paint buffer already
+        return view[y * stride:(y + h) * stride]
+    row = w * 4
+    out = bytearray(row * h)
+    src = y * stride + x * 4
+    for dst in range(0, row * h, row):
+        out[dst:dst + row] = view[src:src + row]
+        src += stride
+    return out
+
+
+def upload(texture, view, width, height, dirty_rects, merged=False):
+    """ Blits the parts of the full frame `view` given by `dirty_rects` into
+    `texture`. Falls back to uploading the whole frame, if the dirty area
+    covers most of the view. The BGRA pixels are converted, if `texture` is
+    not a BGRA texture. Pass `merged=True` if `dirty_rects` come from
+    `merge_rects()` already. Returns the number of bytes uploaded."""
+    if texture.colorfmt == "bgra":
+        convert = None
+        colorfmt = "bgra"
+    else:
+        convert = bgra_to_rgba
+        colorfmt = "rgba"
+    if not dirty_rects:
+        rects = [[0, 0, width, height]]
+    elif merged:
+        rects = dirty_rects
+    else:
+        rects = merge_rects(dirty_rects, width, height)
+    area = rects_area(rects)
+    if FULL_UPLOAD_RATIO * width * height <= area:
+        if convert:
+            view = convert(view)
+        texture.blit_buffer(view, colorfmt=colorfmt, bufferfmt="ubyte")
+        return width * height * 4
+    for rect in rects:
+        pixels = extract_rect(view, width, rect)
+        if convert:
+            pixels = convert(pixels)
+        texture.blit_buffer(
+            pixels,
+            size=(rect[2], rect[3]),
+            pos=(rect[0], rect[1]),
+            colorfmt=colorfmt,
+            bufferfmt="ubyte",
+        )
+    return area * 4
+
+
+def copy_rect(dst, src, width, rect):
+    """ Copies `rect` from the full frame `src` to the same place in the full
+    frame `dst` (both with `width` pixels per row)."""
+    x, y, w, h = rect
+    stride = width * 4
+    if w == width:
+        dst[y * stride:(y + h) * stride] = src[y * stride:(y + h) * stride]
+        return
+    row = w * 4
+    offset = y * stride + x * 4
+    for _ in range(h):
+        dst[offset:offset + row] = src[offset:offset + row]
+        offset += stride
+
+
+class CEFFrameCoalescer:
+    """ Keeps a copy of the latest paint of a texture and the union of the
+    regions that changed since the last upload, so that several paints
+    between two Kivy frames result in a single upload."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buffer = None
+        self.width = 0
+        self.height = 0
+        self.rects = []
+        self.paints = 0
+        self.since = None
+
+    def record(self, view, width, height, rects, paint_time):
+        """ Copies the parts `rects` of the paint `view` into the buffer.
+        `rects` come from `merge_rects()`, `paint_time` is when CEF painted.
+        Returns the number of pending paints dropped because of a resize."""
+        dropped = 0
+        if self.buffer is None or (width, height) != (self.width, self.height):
+            dropped = self.discard()
+            # The buffer always mirrors the whole frame, so that falling back
+            # to a full upload stays correct
+            self.buffer = bytearray(view)
+            self.width = width
+            self.height = height
+        else:
+            for rect in rects:
+                copy_rect(self.buffer, view, width, rect)
+        if self.rects:
+            self.rects = merge_rects(self.rects + rects, width, height)
+        else:
+            self.rects = list(rects)
+        if not self.paints:
+            self.since = paint_time
+        self.paints += 1
+        return dropped
+
+    def discard(self):
+        """ Forgets the pending paints. Returns how many were pending."""
+        paints = self.paints
+        self.rects = []
+        self.paints = 0
+        self.since = None
+        return paints
+
+    def flush(self, texture):
+        """ Uploads the pending changes to `texture`.
+        Returns the number of paints uploaded and the number of bytes."""
+        if not self.paints:
+            return 0, 0
+        nbytes = upload(
+            texture, memoryview(self.buffer), self.width, self.height,
+            self.rects, merged=True)
+        return self.discard(), nbytes
+
+
+class CEFTexturePool:
+    """ Keeps textures that are not displayed anymore, so the next texture of
+    the same size can be reused instead of being allocated (e.g. when a
+    widget is resized back and forth)."""
+
+    def __init__(self, max_textures=4):
+        self.max_textures = max_textures
+        self.hits = 0
+        self.misses = 0
+        self._textures = []
+
+    def acquire(self, size):
+        size = tuple(size)
+        colorfmt = texture_colorfmt()
+        for i, texture in enumerate(self._textures):
+            if tuple(texture.size) == size and texture.colorfmt == colorfmt:
+                self.hits += 1
+                return self._textures.pop(i)
+        self.misses += 1
+        return create_texture(size)
+
+    def release(self, texture):
+        if texture is None or texture in self._textures:
+            return
+        self._textures.append(texture)
+        if self.max_textures < len(self._textures):
+            del self._textures[:-self.max_textures]
+
+    def clear(self):
+        del self._textures[:]
+
+
+texture_pool = CEFTexturePool()
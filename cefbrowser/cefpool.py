@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Browser Pool.
+Creating a browser blocks the UI thread until CEF set it up, and it takes a
+while more until its renderer process painted for the first time. A
+CEFBrowserPool creates browsers at about:blank ahead of time, so a new
+CEFBrowser can adopt one of them:
+
+    pool = CEFBrowserPool(size=2)
+    browser = pool.create_browser("http://kivy.org")
+    # which is the same as
+    browser = CEFBrowser("http://kivy.org", browser_pool=pool)
+    # or, taking the browser from the pool right away even if lazy
+    browser = CEFBrowser("http://kivy.org", browser=pool.acquire())
+
+The pool refills itself one browser at a time, while the UI is idle.
+'''
+
+import time
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from .cefbrowser import CEFBrowser
+from .cefpython import cefpython, cefpython_pump
+
+
+class CEFPooledBrowser:
+    """ An idle browser in the pool"""
+
+    def __init__(self, browser, created, creation_time):
+        self.browser = browser
+        self.created = created
+        """When CreateBrowserSync() was called"""
+        self.creation_time = creation_time
+        """Seconds CreateBrowserSync() blocked"""
+        self.first_paint = 0
+        """When it painted for the first time (0 if not yet)"""
+
+
+class CEFBrowserPoolHandler:
+    """ The client handler of the idle browsers: A tiny view whose first
+    paint is recorded"""
+    view_size = (16, 16)
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def GetRootScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetViewRect(self, browser, rect_out):  # noqa: N802
+        rect_out.extend([0, 0, self.view_size[0], self.view_size[1]])
+        return True
+
+    def GetScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetScreenPoint(  # noqa: N802
+        self,
+        browser,
+        view_x,
+        view_y,
+        screen_coordinates_out,
+    ):
+        return False
+
+    def OnPaint(  # noqa: N802
+        self,
+        browser,
+        element_type,
+        dirty_rects,
+        paint_buffer,
+        width,
+        height,
+    ):
+        entry = self.pool._find(browser)
+        if entry and not entry.first_paint:
+            entry.first_paint = time.time()
+            browser.WasHidden(True)  # Ready, no more paints needed
+        return True
+
+    def OnBeforePopup(self, browser, *largs):  # noqa: N802
+        return True  # Block popups
+
+
+class CEFBrowserPool:
+    """ Keeps `size` idle browsers ready to be adopted by CEFBrowsers"""
+
+    def __init__(self, size=2, refill_delay=.5):
+        self.size = size
+        self.refill_delay = refill_delay
+        """Seconds to wait after an `acquire()` before refilling, so the
+        refill does not compete with the new browser loading"""
+        self.hits = 0
+        self.misses = 0
+        self.time_saved = 0
+        """Seconds the adopting CEFBrowsers did not wait for (creating the
+        browser and its first paint)"""
+        self._idle = []
+        self._handler = CEFBrowserPoolHandler(self)
+        self._refill_event = None
+        if not CEFBrowser._cefpython_initializer:
+            CEFBrowser.initialize_cefpython()
+        self._schedule_refill(0)
+
+    @property
+    def hit_rate(self):
+        return float(self.hits) / max(1, self.hits + self.misses)
+
+    def acquire(self):
+        """ Returns an idle browser (to be passed as `browser=` to
+        CEFBrowser) or None if the pool is empty"""
+        self._schedule_refill(self.refill_delay)
+        if not self._idle:
+            self.misses += 1
+            return None
+        entry = self._idle.pop(0)
+        self.hits += 1
+        # Since `created` was taken before CreateBrowserSync(), this
+        # includes the `creation_time`
+        if entry.first_paint:
+            saved = entry.first_paint - entry.created
+        else:
+            saved = time.time() - entry.created
+        self.time_saved += saved
+        Logger.debug(
+            "CEFBrowser: Pool hit (saved %.3fs): %s", saved, self.stats())
+        return entry.browser
+
+    def create_browser(self, url="", **dargs):
+        """ Returns a new CEFBrowser, which takes its CEF browser from the
+        pool (if there is an idle one at the time it is created)"""
+        return CEFBrowser(url, browser_pool=self, **dargs)
+
+    def close(self):
+        """ Closes the idle browsers and stops refilling"""
+        if self._refill_event:
+            self._refill_event.cancel()
+            self._refill_event = None
+        self.size = 0
+        for entry in self._idle:
+            entry.browser.CloseBrowser(True)
+        del self._idle[:]
+
+    def stats(self):
+        return {
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "time_saved": self.time_saved,
+            "time_saved_avg": self.time_saved / max(1, self.hits),
+        }
+
+    def _find(self, browser):
+        for entry in self._idle:
+            if entry.browser is browser:
+                return entry
+        return None
+
+    def _schedule_refill(self, delay):
+        if self._refill_event:
+            self._refill_event.cancel()
+        self._refill_event = Clock.schedule_once(self._refill, delay)
+
+    def _refill(self, *largs):
+        """ Creates one browser per call, to keep the frames short"""
+        self._refill_event = None
+        if self.size <= len(self._idle):
+            return
+        if not CEFBrowser._cefpython_initialized:
+            # See CEFBrowser.initialize_async()
+            self._schedule_refill(self.refill_delay)
+            return
+        begin = time.time()
+        window_info = cefpython.WindowInfo()
+        window_info.SetAsOffscreen(0)
+        browser = cefpython.CreateBrowserSync(
+            window_info,
+            {"windowless_frame_rate": int(CEFBrowser.frame_rate.defaultvalue)},
+            navigateUrl="about:blank",
+        )
+        browser.SetClientHandler(self._handler)
+        browser.WasResized()
+        self._idle.append(
+            CEFPooledBrowser(browser, begin, time.time() - begin))
+        cefpython_pump.schedule_work()
+        if len(self._idle) < self.size:
+            self._schedule_refill(self.refill_delay)
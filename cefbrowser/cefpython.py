@@ -3,7 +3,7 @@
 
 """
 This library provides functions to import and initialize cefpython found in
-PYTHONPATH.
+PYTHONPATH. cefpython3 is imported on first use, as importing it takes long.
 """
 
 import atexit
@@ -11,31 +11,157 @@ import os
 import signal
 import sys
 import tempfile
+import threading
+import time
 
 import kivy
-from kivy.app import App
 from kivy.clock import Clock
 from kivy.logger import Logger
 kivy.require("1.8.0")
 
 
-# Try import from package (PYTHONPATH)
-try:
-    from cefpython3 import cefpython
-    Logger.info("CEFLoader: cefpython3 imported from package")
-except ImportError:
-    Logger.critical("CEFLoader: Failed to import cefpython")
-    raise Exception("Failed to import cefpython")
+class CEFPythonLoader:
+    """ Stands in for the cefpython3 module and imports it when one of its
+    attributes is used for the first time. Attributes are looked up on the
+    module only once."""
 
+    def __init__(self):
+        object.__setattr__(self, "_module", None)
+
+    def _load(self):
+        # Try import from package (PYTHONPATH)
+        try:
+            from cefpython3 import cefpython as module
+            Logger.info("CEFLoader: cefpython3 imported from package")
+        except ImportError:
+            Logger.critical("CEFLoader: Failed to import cefpython")
+            raise Exception("Failed to import cefpython")
+        object.__setattr__(self, "_module", module)
+        return module
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, name):
+        value = getattr(self._module or self._load(), name)
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self._module or self._load(), name, value)
+        object.__setattr__(self, name, value)
+
+
+cefpython = CEFPythonLoader()
 cefpython_loop_event = None
 
 
-def cefpython_initialize(cef_browser_cls):
-    global cefpython_loop_event
-    if cefpython_loop_event:
-        Logger.warning(
-            "CEFLoader: Attempt to initialize CEFPython another time")
-        return
+class CEFMessagePump:
+    """ Calls cefpython.MessageLoopWork() from the Kivy clock, but only as
+    often as needed: Every frame while work was requested recently (input,
+    paints) or a browser is loading, and at `idle_interval` otherwise.
+    `schedule_work()` follows the semantics of CEF's OnScheduleMessagePumpWork,
+    so it can be hooked up directly wherever CEF reports pending work. Work
+    requested before `start()` (or after `stop()`) is ignored, e.g. when the
+    browsers run in a host process (see cefremote)."""
+    busy_interval = 0
+    """Interval of the pump while busy (0: every frame)"""
+    idle_interval = 0.1
+    """Interval of the pump while all browsers are idle"""
+    busy_timeout = 0.5
+    """How long (in seconds) the pump stays busy after work was requested"""
+
+    def __init__(self):
+        self._started = False
+        self._event = None
+        self._due = 0
+        self._busy_until = 0
+        self._loading = set()
+        self._pumps = 0
+        self._busy_pumps = 0
+        self._work_total = 0
+        self._work_max = 0
+        self._interval = self.idle_interval
+
+    @property
+    def is_busy(self):
+        return bool(self._loading) or time.time() < self._busy_until
+
+    def start(self):
+        self._started = True
+        self.schedule_work()
+        return self._event
+
+    def stop(self):
+        self._started = False
+        if self._event:
+            self._event.cancel()
+            self._event = None
+
+    def schedule_work(self, delay_ms=0):
+        """ Requests a call to MessageLoopWork() in `delay_ms` milliseconds
+        and keeps the pump busy for a while."""
+        now = time.time()
+        self._busy_until = max(self._busy_until, now + self.busy_timeout)
+        self._schedule(delay_ms / 1000.)
+
+    def set_loading(self, key, is_loading):
+        """ Keeps the pump busy while the browser `key` is loading"""
+        if is_loading:
+            self._loading.add(key)
+            self.schedule_work()
+        else:
+            self._loading.discard(key)
+
+    def _schedule(self, delay):
+        if not self._started:
+            return  # CEF is not initialized (yet) or shut down
+        due = time.time() + delay
+        if self._event and self._due <= due:
+            return  # Work is already scheduled earlier
+        if self._event:
+            self._event.cancel()
+        self._due = due
+        self._interval = delay
+        self._event = Clock.schedule_once(self._work, delay)
+
+    def _work(self, *largs):
+        self._event = None
+        begin = time.time()
+        try:
+            cefpython.MessageLoopWork()
+        except Exception as e:
+            print("EXCEPTION IN CEF LOOP", e)
+        duration = time.time() - begin
+        busy = self.is_busy
+        self._pumps += 1
+        self._busy_pumps += busy
+        self._work_total += duration
+        self._work_max = max(self._work_max, duration)
+        if not self._event:
+            self._schedule(self.busy_interval if busy else self.idle_interval)
+
+    def stats(self):
+        """ Returns a dict with timing statistics of the pump"""
+        return {
+            "pumps": self._pumps,
+            "busy_pumps": self._busy_pumps,
+            "idle_pumps": self._pumps - self._busy_pumps,
+            "work_avg": self._work_total / max(1, self._pumps),
+            "work_max": self._work_max,
+            "interval": self._interval,
+            "busy": self.is_busy,
+        }
+
+
+cefpython_pump = CEFMessagePump()
+
+
+def cefpython_settings(cef_browser_cls):
+    """ Returns the settings for cefpython.Initialize() as configured on
+    `cef_browser_cls` (see `CEFBrowser.update_settings`, `set_data_path`,
+    ...) and the path for cookies. Creates the directories."""
     try:
         md = cefpython.GetModuleDirectory()
     except Exception as e:
@@ -45,13 +171,6 @@ def cefpython_initialize(cef_browser_cls):
     sd = tempfile.gettempdir()
     Logger.debug("CEFLoader: Storage Directory: %s", sd)
 
-    def cef_loop(*largs):
-        try:
-            cefpython.MessageLoopWork()
-        except Exception as e:
-            print("EXCEPTION IN CEF LOOP", e)
-    cefpython_loop_event = Clock.schedule_interval(cef_loop, 0.01)
-
     default_settings = {
         # "debug": True,
         # "log_severity": cefpython.LOGSEVERITY_INFO,
@@ -93,6 +212,22 @@ def cefpython_initialize(cef_browser_cls):
     if not os.path.isdir(logs_path):
         os.makedirs(logs_path, 0o0700)
     default_settings["log_file"] = os.path.join(logs_path, "cefpython.log")
+    return default_settings, cookies_path
+
+
+def cefpython_start(cef_browser_cls, prepared=None, timings=None):
+    """ Initializes CEF with the settings and command line switches of
+    `cef_browser_cls` (or the result of `cefpython_settings()` given as
+    `prepared`). Pumping its message loop is up to the caller. The seconds
+    the phases took are added to the dict `timings`."""
+    if timings is None:
+        timings = {}
+    begin = time.time()
+    default_settings, cookies_path = \
+        prepared or cefpython_settings(cef_browser_cls)
+    if not prepared:
+        timings["settings"] = time.time() - begin
+        begin = time.time()
 
     try:
         cefpython.Initialize(
@@ -107,6 +242,8 @@ def cefpython_initialize(cef_browser_cls):
         except Exception as err:
             raise Exception(
                 "CEFLoader: Failed to initialize cefpython %s" % (err, ))
+    timings["initialize"] = time.time() - begin
+    begin = time.time()
 
     try:
         cookie_manager = cefpython.CookieManager.GetGlobalManager()
@@ -114,11 +251,117 @@ def cefpython_initialize(cef_browser_cls):
         cef_browser_cls._cookie_manager = cookie_manager
     except Exception as e:
         Logger.warning("CEFLoader: Failed to set up cookie manager: %s" % e)
+    timings["cookies"] = time.time() - begin
+
+
+class CEFInitializer:
+    """ Initializes CEF for `cef_browser_cls`, either at once (`run()`) or
+    overlapped with building the UI (`start()`): Then cefpython3 is imported
+    and the settings (and their directories) are prepared on a background
+    thread, and CEF is initialized on the main thread in the next frame.
+    `timings` holds the seconds each phase took."""
+
+    def __init__(self, cef_browser_cls):
+        self.cef_browser_cls = cef_browser_cls
+        self.done = False
+        self.timings = {}
+        """The phases: "import", "settings", "initialize", "cookies" and
+        "total" (from creating the initializer until done)"""
+        self._created = time.time()
+        self._callbacks = []
+        self._thread = None
+        self._prepared = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and not self.done
+
+    def start(self, callback=None):
+        """ Starts initializing in the background. Calls `callback()` on the
+        main thread when done."""
+        self._add_callback(callback)
+        if not self._thread and not self.done:
+            self._thread = threading.Thread(
+                target=self._prepare, name="CEFInitializer")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def run(self, callback=None):
+        """ Initializes now (waiting for the background thread if it was
+        started), calling `callback()` when done"""
+        self._add_callback(callback)
+        if self.done:
+            return
+        if self._thread:
+            self._thread.join()
+        else:
+            self._prepare(schedule=False)
+        self._finish()
+
+    def _add_callback(self, callback):
+        if not callback:
+            return
+        if self.done:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def _prepare(self, schedule=True):
+        try:
+            begin = time.time()
+            if not cefpython.is_loaded:
+                cefpython._load()
+            self.timings["import"] = time.time() - begin
+            begin = time.time()
+            self._prepared = cefpython_settings(self.cef_browser_cls)
+            self.timings["settings"] = time.time() - begin
+        except Exception as err:
+            self._prepared = err
+        if schedule:
+            Clock.schedule_once(self._finish)
+
+    def _finish(self, *largs):
+        global cefpython_loop_event
+        if self.done:
+            return
+        if isinstance(self._prepared, Exception):
+            raise self._prepared
+        self.done = True
+        if cefpython_loop_event:
+            Logger.warning(
+                "CEFLoader: Attempt to initialize CEFPython another time")
+        else:
+            cefpython_loop_event = cefpython_pump.start()
+            cefpython_start(
+                self.cef_browser_cls, self._prepared, self.timings)
+            _register_shutdown()
+        self.timings["total"] = time.time() - self._created
+        Logger.info("CEFLoader: Initialized (%s)", ", ".join(
+            "%s %.3fs" % item for item in sorted(self.timings.items())))
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+def cefpython_initialize(cef_browser_cls):
+    """ Initializes CEF at once and returns the CEFInitializer (see its
+    `timings`)"""
+    initializer = CEFInitializer(cef_browser_cls)
+    initializer.run()
+    return initializer
+
+
+def _register_shutdown():
 
     def cefpython_shutdown(*largs):
+        from kivy.app import App
         print("CEFPYTHON SHUTDOWN", largs, App.get_running_app())
+        Logger.debug("CEFLoader: Message pump: %s", cefpython_pump.stats())
+        cefpython_pump.stop()
         cefpython.Shutdown()
-        App.get_running_app().stop()
+        app = App.get_running_app()
+        if app:
+            app.stop()
 
     def cefpython_exit(*largs):
         cefpython_shutdown()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Session Recorder.
+Records the paints of a CEFBrowser into a local file. The UI thread only
+copies each paint into a bounded queue; a background thread encodes them. If
+the encoder falls behind, paints are dropped instead of blocking the UI.
+
+Formats:
+- "raw": The BGRA frames as painted, one after the other, plus a sidecar
+  file (`path`.txt) with "timestamp width height" per frame.
+- "y4m": YUV4MPEG2 (4:4:4, full range) at a constant `fps`. Needs Pillow.
+- "mjpeg": Concatenated JPEGs at a constant `fps`. Needs Pillow.
+For the constant-rate formats, the timestamps of the paints decide how often
+each frame is repeated, so the video plays back in real time. A repeated frame
+is encoded once.
+`stop()` does not wait for the encoder: It finishes the file in the
+background and passes the `summary()` to a callback.
+'''
+
+import io
+import queue
+import threading
+import time
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from .cefstats import CEFRingBuffer
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+FORMATS = ("raw", "y4m", "mjpeg")
+
+
+def format_from_path(path):
+    """ Guesses the format from the extension of `path`"""
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension == "y4m":
+        return "y4m"
+    if extension in ("mjpeg", "mjpg"):
+        return "mjpeg"
+    return "raw"
+
+
+class CEFRecorder:
+    """ Records the paints it gets via `record()` into the file at `path`"""
+
+    def __init__(self, path, format=None, fps=25, queue_size=8,
+                 jpeg_quality=80):
+        self.path = path
+        self.format = format or format_from_path(path)
+        if self.format not in FORMATS:
+            raise ValueError("Unknown recording format %r" % self.format)
+        if self.format != "raw" and Image is None:
+            raise ValueError("Recording %s needs Pillow" % self.format)
+        self.fps = fps
+        self.jpeg_quality = jpeg_quality
+        self.paints = 0
+        """Paints handed to `record()`"""
+        self.dropped = 0
+        """Paints dropped, because the queue was full"""
+        self.encoded = 0
+        """Frames written to the file (constant-rate formats repeat frames)"""
+        self.ui_costs = CEFRingBuffer()
+        """Seconds `record()` took on the UI thread"""
+        self.error = None
+        """The exception that stopped the encoding (later paints are
+        dropped)"""
+        self._queue = queue.Queue(queue_size)
+        self._file = open(path, "wb")
+        self._index = None
+        if self.format == "raw":
+            self._index = open(path + ".txt", "w")
+        self._size = None
+        self._start = None
+        self._last = None
+        self._last_frame = None
+        self._stop_time = None
+        self._stopping = threading.Event()
+        self._callbacks = []
+        self._thread = threading.Thread(
+            target=self._run, name="CEFRecorder %s" % path)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self, view, width, height, timestamp):
+        """ Queues a copy of the BGRA frame `view` (called on the UI
+        thread). Returns False if the paint was dropped."""
+        begin = time.time()
+        self.paints += 1
+        queued = False
+        if self.error is None and not self._stopping.is_set() and \
+                not self._queue.full():  # Don't copy paints that get dropped
+            try:
+                self._queue.put_nowait(
+                    (bytes(view), width, height, timestamp))
+                queued = True
+            except queue.Full:
+                pass
+        if not queued:
+            self.dropped += 1
+        self.ui_costs.append(time.time() - begin)
+        return queued
+
+    @property
+    def is_finished(self):
+        """ Whether the file is closed (after `stop()` or an error)"""
+        return not self._thread.is_alive()
+
+    def stop(self, callback=None):
+        """ Stops recording without waiting: The queued frames are encoded
+        and the file is closed in the background, then `callback(summary)`
+        is called on the main thread. The last frame is held until now."""
+        if callback:
+            self._callbacks.append(callback)
+        if self._stopping.is_set():
+            return
+        self._stop_time = time.time()
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(None)  # Wakes up the encoder
+        except queue.Full:
+            pass  # It stops when the queue is empty
+
+    def wait(self, timeout=None):
+        """ Waits for the encoder to finish after `stop()`. Returns
+        `is_finished`."""
+        self._thread.join(timeout)
+        return self.is_finished
+
+    def summary(self, percents=(50, 90, 99)):
+        return {
+            "format": self.format,
+            "paints": self.paints,
+            "dropped": self.dropped,
+            "encoded": self.encoded,
+            "ui_cost": self.ui_costs.percentiles(percents),
+        }
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=.1)
+                except queue.Empty:
+                    if self._stopping.is_set():
+                        break
+                    continue
+                if item is None:
+                    break
+                self._encode(*item)
+            if self._last is not None:
+                # Hold the last frame until stop() (at least once)
+                self._hold(max(self._slot(self._stop_time), self.encoded + 1))
+        except Exception as err:
+            self.error = err
+            Logger.error("CEFBrowser: Recording %s failed: %s", self.path, err)
+        finally:
+            self._file.close()
+            if self._index:
+                self._index.close()
+            Logger.debug(
+                "CEFBrowser: Recorded %s: %s", self.path, self.summary())
+            Clock.schedule_once(self._finished)
+
+    def _finished(self, *largs):
+        summary = self.summary()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(summary)
+
+    def _encode(self, data, width, height, timestamp):
+        if self.format == "raw":
+            self._file.write(data)
+            self._index.write("%f %i %i\n" % (timestamp, width, height))
+            self.encoded += 1
+            return
+        if self._start is None:
+            self._start = timestamp
+            self._size = (width, height)
+            if self.format == "y4m":
+                self._file.write((
+                    "YUV4MPEG2 W%i H%i F%i:1 Ip A1:1 C444 XCOLORRANGE=FULL\n"
+                    % (width, height, self.fps)).encode("ascii"))
+        elif self._last is not None:
+            # Hold the previous frame until this paint happened
+            self._hold(self._slot(timestamp))
+        self._last = (data, width, height, timestamp)
+        self._last_frame = None
+
+    def _slot(self, timestamp):
+        """ The number of frames from the first paint until `timestamp`"""
+        return int((timestamp - self._start) * self.fps)
+
+    def _hold(self, slot):
+        """ Repeats the last frame until `slot` frames are written, encoding
+        it only once"""
+        if slot <= self.encoded:
+            return
+        if self._last_frame is None:
+            self._last_frame = self._encode_frame(*self._last[:3])
+        for _ in range(slot - self.encoded):
+            self._file.write(self._last_frame)
+            self.encoded += 1
+
+    def _encode_frame(self, data, width, height):
+        """ Returns the frame as written to the file"""
+        image = Image.frombuffer(
+            "RGBA", (width, height), data, "raw", "BGRA", 0, 1)
+        if (width, height) != self._size:
+            image = image.resize(self._size)
+        output = io.BytesIO()
+        if self.format == "y4m":
+            output.write(b"FRAME\n")
+            for plane in image.convert("YCbCr").split():
+                output.write(plane.tobytes())
+        else:
+            image.convert("RGB").save(
+                output, "JPEG", quality=self.jpeg_quality)
+        return output.getvalue()
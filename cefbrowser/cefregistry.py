@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Browser Registry.
+Maps the CEF browsers (by `GetIdentifier()`) to their CEFBrowser widgets
+through weak references, so the registry never keeps a widget alive. CEF
+calls back for browsers whose widget is gone (e.g. while closing); `get()`
+returns None for them instead of raising.
+
+A widget that is garbage collected while its CEF browser is still
+registered leaked that browser (and its renderer process): The registry
+logs it, counts it in `orphaned` and closes the CEF browser.
+'''
+
+from functools import partial
+import sys
+import time
+import weakref
+
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+
+class CEFBrowserRegistry:
+    """ The CEF browsers and their widgets"""
+    popup_timeout = 60
+    """How long (in seconds) a popup may take to be created after its opener
+    allowed it"""
+
+    def __init__(self, close_orphans=True):
+        self.close_orphans = close_orphans
+        self.registered = 0
+        self.unregistered = 0
+        self.misses = 0
+        """Lookups for browsers without a (live) widget"""
+        self.orphaned = 0
+        """Widgets collected without their browser being unregistered"""
+        self._entries = {}
+        """identifier -> (weak reference to the widget, CEF browser)"""
+        self._popups = {}
+        """window handle -> (weak reference to the opener, when)"""
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, browser):
+        return self.get(browser, False) is not None
+
+    def __iter__(self):
+        """ Iterates over the live widgets"""
+        for ref, browser in list(self._entries.values()):
+            widget = ref()
+            if widget is not None:
+                yield widget
+
+    def register(self, browser, widget):
+        identifier = browser.GetIdentifier()
+        self._entries[identifier] = (
+            weakref.ref(widget, partial(self._on_collected, identifier)),
+            browser)
+        self.registered += 1
+
+    def unregister(self, browser):
+        """ Removes `browser` and returns its widget (or None)"""
+        entry = self._entries.pop(browser.GetIdentifier(), None)
+        if entry is None:
+            return None
+        self.unregistered += 1
+        return entry[0]()
+
+    def get(self, browser, count_miss=True):
+        """ Returns the widget of `browser` or None"""
+        entry = self._entries.get(browser.GetIdentifier())
+        widget = entry[0]() if entry else None
+        if widget is None and count_miss:
+            self.misses += 1
+        return widget
+
+    def add_popup(self, window_handle, opener):
+        """ Remembers the widget that allowed the popup to be created with
+        `window_handle`"""
+        now = time.time()
+        for handle, (ref, when) in list(self._popups.items()):
+            if self.popup_timeout < now - when:
+                del self._popups[handle]
+        self._popups[window_handle] = (weakref.ref(opener), now)
+
+    def pop_popup(self, window_handle):
+        """ Returns the (live) widget that opened the popup with
+        `window_handle` or None"""
+        entry = self._popups.pop(window_handle, None)
+        return entry[0]() if entry else None
+
+    def stats(self):
+        """ Diagnostics: `live` should stay equal to the number of open
+        browsers, `orphaned` at 0"""
+        return {
+            "live": len(self._entries),
+            "registered": self.registered,
+            "unregistered": self.unregistered,
+            "misses": self.misses,
+            "orphaned": self.orphaned,
+            "pending_popups": len(self._popups),
+        }
+
+    def _on_collected(self, identifier, ref):
+        entry = self._entries.get(identifier)
+        if entry is None or entry[0] is not ref or sys.is_finalizing():
+            return  # Not registered (anymore) or exiting anyway
+        del self._entries[identifier]
+        self.orphaned += 1
+        Logger.warning(
+            "CEFBrowser: Widget of browser %i was collected without closing "
+            "the browser", identifier)
+        if self.close_orphans:
+            # Not from within the garbage collection
+            Clock.schedule_once(
+                lambda dt: entry[1].CloseBrowser(True))
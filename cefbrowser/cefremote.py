@@ -0,0 +1,956 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Remote Host.
+In-process, the CEF message loop, all ClientHandler callbacks, the JavaScript
+bindings and Kivy share one thread (and the GIL): A slow page stalls the UI.
+A CEFRemoteHost runs CEF in a host process instead. The host owns the CEF
+browsers, writes their paints into shared memory (see cefshm) and sends the
+callbacks over a socket. In the Kivy process, a CEFRemoteBrowser stands in
+for each CEF browser, so the CEFBrowser widget works as usual: Input,
+navigation and `js.*` calls are sent to the host.
+
+    host = CEFRemoteHost()
+    browser = host.create_browser("http://kivy.org")
+    # which is the same as
+    browser = CEFBrowser("http://kivy.org", browser_pool=host)
+
+Configure CEFBrowser (`update_settings()`, `set_data_path()`, ...) before
+creating the host. cefpython3 is imported in the Kivy process for its
+constants, but not initialized.
+
+The host answers the callbacks that must return right away itself: Popups
+are blocked there and opened as new remote browsers if the `popup_policy`
+allows them (without `window.opener`), HTML5 drags are not started,
+certificate errors are not ignored. JavaScript dialogs and authentication
+are answered asynchronously, like in-process.
+
+Run `python tests/remote.py` to compare latency and throughput with the
+in-process mode.
+'''
+
+from collections import deque
+from functools import partial
+import os
+import socket
+import subprocess
+import sys
+import time
+
+if __name__ == '__main__':
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+
+from kivy.clock import Clock  # noqa: E402
+from kivy.logger import Logger  # noqa: E402
+
+from .cefpaint import paint_buffer_view  # noqa: E402
+from .cefpython import cefpython, cefpython_start  # noqa: E402
+from .cefshm import CEFFrameRingReader, CEFFrameRingWriter, \
+    default_path  # noqa: E402
+from .cefstats import CEFRingBuffer  # noqa: E402
+
+
+class CEFRemoteRef:
+    """ A frame or a callback object of the host process, as sent to the
+    Kivy process"""
+
+    def __init__(self, kind, identifier, info=None):
+        self.kind = kind
+        self.identifier = identifier
+        self.info = info
+
+
+# The Kivy process
+
+class CEFRemotePaintBuffer:
+    """ A frame in shared memory, passed to ClientHandler.OnPaint like the
+    paint buffer of CEF"""
+
+    def __init__(self, pixels):
+        self.pixels = pixels
+
+    def GetString(self, mode="bgra", origin="top-left"):  # noqa: N802
+        return self.pixels
+
+
+class CEFRemoteFrame:
+    """ Stands in for a frame of a remote browser. Methods are called in the
+    host process (without returning their result)."""
+
+    def __init__(self, browser, key, info=None):
+        self.browser = browser
+        self.key = key
+        """The identifier of the frame, "main" or "focused\""""
+        self.info = info or {}
+
+    def __eq__(self, other):
+        return isinstance(other, CEFRemoteFrame) and \
+            other.browser is self.browser and other.key == self.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.browser), self.key))
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            return partial(self.browser._send_frame_call, self.key, name)
+        raise AttributeError(name)
+
+    def GetIdentifier(self):  # noqa: N802
+        return self.info.get("identifier")
+
+    def GetName(self):  # noqa: N802
+        return self.info.get("name", "")
+
+    def GetUrl(self):  # noqa: N802
+        if self.key == "main":
+            return self.browser.url
+        return self.info.get("url", "")
+
+    def IsMain(self):  # noqa: N802
+        return self.key == "main"
+
+
+class CEFRemoteCallback:
+    """ Stands in for a callback object of the host process (e.g. of a
+    JavaScript dialog or a JavaScript function passed to Python). Only its
+    first call is delivered."""
+
+    def __init__(self, host, identifier):
+        self.host = host
+        self.identifier = identifier
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            return partial(self.host.send, "callback", self.identifier, name)
+        raise AttributeError(name)
+
+
+class CEFRemoteBrowser:
+    """ Stands in for a CEF browser of the host process. Method calls are
+    sent to the host (without returning their result); the callbacks of the
+    host are passed on to the client handler."""
+    is_remote = True
+
+    def __init__(self, host, identifier, settings=None):
+        self.host = host
+        self.identifier = identifier
+        self.settings = settings or {}
+        self.url = ""
+        self.handler = None
+        self.functions = {}
+        """The JavaScript bindings"""
+        self.is_created = False
+        """Whether the host was asked to create the browser (on the first
+        `WasResized()`, when the view size is known)"""
+        self._pending = []
+        self._readers = {}
+        """The frame rings (by element type)"""
+        self._full = set()
+        """The element types whose next paint must be uploaded in full"""
+        self._main_frame = CEFRemoteFrame(self, "main")
+        self._focused_frame = CEFRemoteFrame(self, "focused")
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            return partial(self._send_call, name)
+        raise AttributeError(name)
+
+    def _send(self, *message):
+        if self.is_created:
+            self.host.send(message[0], self.identifier, *message[1:])
+        else:
+            self._pending.append(message)
+
+    def _send_call(self, name, *largs, **dargs):
+        self._send("call", name, largs, dargs)
+
+    def _send_frame_call(self, key, name, *largs):
+        self._send("frame_call", key, name, largs)
+
+    def GetIdentifier(self):  # noqa: N802
+        # Negative, so they never collide with the ones of in-process
+        # browsers in the registry
+        return -self.identifier
+
+    def GetUrl(self):  # noqa: N802
+        return self.url
+
+    def GetMainFrame(self):  # noqa: N802
+        return self._main_frame
+
+    def GetFocusedFrame(self):  # noqa: N802
+        return self._focused_frame
+
+    def GetWindowHandle(self):  # noqa: N802
+        return 0
+
+    def IsPopup(self):  # noqa: N802
+        return False
+
+    def Navigate(self, url):  # noqa: N802
+        self.url = url
+        if self.is_created:
+            self._send_call("Navigate", url)
+
+    def SetClientHandler(self, handler):  # noqa: N802
+        self.handler = handler
+
+    def SetJavascriptBindings(self, bindings):  # noqa: N802
+        self.functions = dict(bindings.GetFunctions())
+        self._send("bindings", sorted(self.functions))
+
+    def WasResized(self):  # noqa: N802
+        rect = []
+        if self.handler:
+            self.handler.GetViewRect(self, rect)
+        rect = rect or [0, 0, 1, 1]
+        if self.is_created:
+            self._send("resize", rect)
+            return
+        self.is_created = True
+        self.host.send(
+            "create", self.identifier, self.url, rect, self.settings)
+        pending, self._pending = self._pending, []
+        for message in pending:
+            self._send(*message)
+
+    def _decode(self, value):
+        if isinstance(value, CEFRemoteRef):
+            if value.kind == "frame":
+                key = "main" if value.info.get("is_main") else \
+                    value.identifier
+                return CEFRemoteFrame(self, key, value.info)
+            return CEFRemoteCallback(self.host, value.identifier)
+        if isinstance(value, list):
+            return [self._decode(v) for v in value]
+        if isinstance(value, dict):
+            return dict((k, self._decode(v)) for k, v in value.items())
+        return value
+
+    def _open_ring(self, element_type, path):
+        self._close_ring(element_type)
+        try:
+            self._readers[element_type] = CEFFrameRingReader(
+                path, writable=True)
+        except (IOError, OSError, ValueError):
+            return  # Replaced meanwhile, the next ring is on its way
+        self._full.add(element_type)
+
+    def _close_ring(self, element_type, unlink=False):
+        reader = self._readers.pop(element_type, None)
+        if reader is None:
+            return
+        try:
+            reader.close()
+        except BufferError:
+            pass  # A frame is still referenced, the mapping goes with it
+        if unlink:
+            try:
+                os.unlink(reader.path)
+            except OSError:
+                pass
+
+    def _paint(self, element_type):
+        """ Passes the newest frame in the ring (and the dirty rects of the
+        frames skipped to get there) on to the client handler"""
+        reader = self._readers.get(element_type)
+        if reader is None or self.handler is None:
+            return
+        lost = reader.lost
+        frame = None
+        rects = []
+        while True:
+            next_frame = reader.read()
+            if next_frame is None:
+                break
+            if frame is not None:
+                if (frame.width, frame.height) != \
+                        (next_frame.width, next_frame.height):
+                    self._full.add(element_type)
+                frame.release()
+            frame = next_frame
+            rects.extend(frame.dirty_rects)
+        if frame is None:
+            return
+        self.host.frames += 1
+        self.host.lost_frames += reader.lost - lost
+        if reader.lost != lost or element_type in self._full:
+            rects = [[0, 0, frame.width, frame.height]]
+        self._full.discard(element_type)
+        try:
+            self.handler.OnPaint(
+                self, element_type, rects, CEFRemotePaintBuffer(frame.pixels),
+                frame.width, frame.height)
+        finally:
+            if not frame.is_valid():
+                # Overwritten while uploading, upload the next one in full
+                self.host.torn_frames += 1
+                self._full.add(element_type)
+            try:
+                frame.release()
+            except BufferError:
+                pass
+
+
+class CEFRemoteHost:
+    """ Starts a host process running CEF and creates the browsers in it.
+    Pass it as the `browser_pool` of CEFBrowser (see `create_browser()`).
+    `command` starts the host process (the file descriptor of the socket is
+    appended as `--fd`)."""
+    is_remote = True
+
+    def __init__(self, command=None):
+        self.command = command or [sys.executable, "-m", __name__]
+        self.browsers = {}
+        """The CEFRemoteBrowsers (by identifier)"""
+        self.pid = None
+        self.is_running = False
+        self.timings = {}
+        """The phases of initializing CEF in the host (see
+        CEFInitializer.timings)"""
+        self.messages_sent = 0
+        self.messages_received = 0
+        self.frames = 0
+        self.lost_frames = 0
+        """Frames overwritten in the ring before they could be read"""
+        self.torn_frames = 0
+        """Frames overwritten while being uploaded"""
+        self.round_trips = CEFRingBuffer()
+        """Seconds `ping()` took to come back"""
+        self._next_identifier = 1
+        self._queue = deque()
+        self._scheduled = False
+        self._paints = set()
+        self._connection = None
+        self._process = None
+        self._thread = None
+        self.start()
+
+    def start(self):
+        import threading
+        from multiprocessing.connection import Connection
+        from .cefbrowser import CEFBrowser
+        ours, theirs = socket.socketpair()
+        env = dict(os.environ, KIVY_NO_ARGS="1")
+        package_path = os.path.dirname(
+            os.path.dirname(os.path.realpath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(
+            [package_path] + [p for p in [env.get("PYTHONPATH")] if p])
+        self._process = subprocess.Popen(
+            self.command + ["--fd", str(theirs.fileno())],
+            pass_fds=[theirs.fileno()], env=env)
+        theirs.close()
+        self.pid = self._process.pid
+        self._connection = Connection(ours.detach())
+        self.is_running = True
+        self.send("initialize", {
+            "settings": CEFBrowser._settings,
+            "switches": CEFBrowser._command_line_switches,
+            "caches_path": CEFBrowser._caches_path,
+            "cookies_path": CEFBrowser._cookies_path,
+            "logs_path": CEFBrowser._logs_path,
+        })
+        self._thread = threading.Thread(
+            target=self._receive, name="CEFRemoteHost")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self, timeout=5):
+        """ Closes all browsers and waits for the host process to exit"""
+        if self.is_running:
+            self.send("shutdown")
+        if self._process:
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                Logger.warning("CEFRemote: Killing the host process")
+                self._process.kill()
+                self._process.wait()
+        self._on_exit()
+
+    def acquire(self):
+        """ Returns a new browser (to be passed as `browser=` to
+        CEFBrowser), like CEFBrowserPool"""
+        from .cefbrowser import CEFBrowser
+        browser = CEFRemoteBrowser(
+            self, self._next_identifier,
+            {"windowless_frame_rate": int(CEFBrowser.frame_rate.defaultvalue)})
+        self.browsers[browser.identifier] = browser
+        self._next_identifier += 1
+        return browser
+
+    def create_browser(self, url="", **dargs):
+        """ Returns a new CEFBrowser whose CEF browser runs in the host"""
+        from .cefbrowser import CEFBrowser
+        return CEFBrowser(url, browser_pool=self, **dargs)
+
+    def delete_cookies(self, url=""):
+        self.send("delete_cookies", url)
+
+    def ping(self):
+        """ Measures the round trip to the host (see `round_trips`)"""
+        self.send("ping", time.time())
+
+    def send(self, *message):
+        if not self.is_running:
+            return
+        try:
+            self._connection.send(message)
+            self.messages_sent += 1
+        except (OSError, EOFError):
+            pass  # The host exited, see _on_exit()
+
+    def stats(self):
+        return {
+            "pid": self.pid,
+            "running": self.is_running,
+            "browsers": len(self.browsers),
+            "messages_sent": self.messages_sent,
+            "messages_received": self.messages_received,
+            "frames": self.frames,
+            "lost_frames": self.lost_frames,
+            "torn_frames": self.torn_frames,
+            "round_trip": self.round_trips.percentiles((50, 90, 99)),
+        }
+
+    def _receive(self):
+        """ Queues the messages of the host (on a background thread), so
+        they are handled in the next frame"""
+        while True:
+            try:
+                message = self._connection.recv()
+            except (EOFError, OSError):
+                message = ("exit", )
+            self._queue.append(message)
+            # _process_messages() resets the flag before it drains the queue
+            if not self._scheduled:
+                self._scheduled = True
+                Clock.schedule_once(self._process_messages)
+            if message[0] == "exit":
+                return
+
+    def _process_messages(self, *largs):
+        self._scheduled = False
+        while self._queue:
+            message = self._queue.popleft()
+            self.messages_received += 1
+            try:
+                getattr(self, "_on_" + message[0])(*message[1:])
+            except Exception as err:
+                Logger.exception(
+                    "CEFRemote: Handling %s failed: %s", message[0], err)
+        # Only the newest frame of each browser is uploaded
+        paints, self._paints = self._paints, set()
+        for identifier, element_type in paints:
+            browser = self.browsers.get(identifier)
+            if browser:
+                browser._paint(element_type)
+
+    def _on_initialized(self, pid, timings):
+        self.timings = timings
+        Logger.info("CEFRemote: Host %i initialized (%s)", pid, ", ".join(
+            "%s %.3fs" % item for item in sorted(timings.items())))
+
+    def _on_ring(self, identifier, element_type, path):
+        browser = self.browsers.get(identifier)
+        if browser:
+            browser._open_ring(element_type, path)
+
+    def _on_paint(self, identifier, element_type):
+        self._paints.add((identifier, element_type))
+
+    def _on_event(self, identifier, name, args):
+        browser = self.browsers.get(identifier)
+        if not browser or not browser.handler:
+            return
+        args = browser._decode(args)
+        if name == "OnAddressChange" and args[0].IsMain():
+            # Before the widget compares its url to GetUrl()
+            browser.url = args[1]
+        getattr(browser.handler, name)(browser, *args)
+
+    def _on_js(self, identifier, name, args):
+        browser = self.browsers.get(identifier)
+        function = browser and browser.functions.get(name)
+        if function:
+            function(*browser._decode(args))
+
+    def _on_popup(self, identifier, target_url):
+        browser = self.browsers.get(identifier)
+        handler = browser and browser.handler
+        bw = handler.registry.get(browser) if handler else None
+        if bw is not None and handler._allow_popup(bw, target_url):
+            handler._show_popup(bw, self.create_browser(target_url))
+
+    def _on_closed(self, identifier):
+        browser = self.browsers.pop(identifier, None)
+        if browser:
+            for element_type in list(browser._readers):
+                browser._close_ring(element_type)
+
+    def _on_pong(self, timestamp):
+        self.round_trips.append(time.time() - timestamp)
+
+    def _on_exit(self):
+        if not self.is_running:
+            return
+        self.is_running = False
+        if self._process and self._process.poll() is None:
+            Logger.error("CEFRemote: Lost the connection to the host")
+        elif self._process and self._process.returncode:
+            Logger.error(
+                "CEFRemote: The host process exited with %i",
+                self._process.returncode)
+        self._connection.close()
+        # Close the widgets like CEF would, and clean up after the host
+        for identifier, browser in list(self.browsers.items()):
+            if browser.handler:
+                browser.handler.DoClose(browser)
+            for element_type in list(browser._readers):
+                browser._close_ring(element_type, unlink=True)
+        self.browsers.clear()
+
+
+# The host process
+
+class CEFRemoteServerBrowser:
+    """ A CEF browser in the host process"""
+
+    def __init__(self, identifier, browser, rect):
+        self.identifier = identifier
+        self.browser = browser
+        self.rect = rect
+        self.bindings = None
+        self.writers = {}
+        """The frame rings (by element type)"""
+        self._rings = 0
+
+    def writer(self, element_type, width, height):
+        """ Returns the ring for paints of `width` x `height` pixels and
+        whether it is a new one"""
+        writer = self.writers.get(element_type)
+        if writer and width <= writer.max_width and \
+                height <= writer.max_height:
+            return writer, False
+        if writer:
+            # A reader that mapped it keeps the memory until it switches
+            writer.close()
+        self._rings += 1
+        writer = self.writers[element_type] = CEFFrameRingWriter(
+            default_path("remote-%i-%i-%i" % (
+                self.identifier, element_type, self._rings)),
+            (width, height), slots=3)
+        return writer, True
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+
+class CEFRemoteServerHandler:
+    """ The client handler of the browsers in the host process: Answers the
+    callbacks that need a result right away and sends the others to the
+    Kivy process"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def _forward(self, name, browser, *largs):
+        entry = self.server.find(browser)
+        if entry:
+            self.server.send(
+                "event", entry.identifier, name,
+                self.server.encode(largs, entry.identifier))
+
+    def GetRootScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetViewRect(self, browser, rect_out):  # noqa: N802
+        entry = self.server.find(browser)
+        rect_out.extend(entry.rect if entry else [0, 0, 1, 1])
+        return True
+
+    def GetScreenRect(self, browser, rect_out):  # noqa: N802
+        return False
+
+    def GetScreenPoint(  # noqa: N802
+        self,
+        browser,
+        view_x,
+        view_y,
+        screen_coordinates_out,
+    ):
+        return False
+
+    def OnPaint(  # noqa: N802
+        self,
+        browser,
+        element_type,
+        dirty_rects,
+        paint_buffer,
+        width,
+        height,
+    ):
+        entry = self.server.find(browser)
+        if entry is None:
+            return True
+        writer, is_new = entry.writer(element_type, width, height)
+        if is_new:
+            self.server.send(
+                "ring", entry.identifier, element_type, writer.path)
+        view = paint_buffer_view(paint_buffer, width, height)
+        if writer.write(view, width, height, dirty_rects):
+            self.server.send("paint", entry.identifier, element_type)
+        return True
+
+    def OnPopupShow(self, browser, show):  # noqa: N802
+        self._forward("OnPopupShow", browser, show)
+
+    def OnPopupSize(self, browser, rect_out):  # noqa: N802
+        self._forward("OnPopupSize", browser, list(rect_out))
+
+    def OnAddressChange(self, browser, frame, url):  # noqa: N802
+        self._forward("OnAddressChange", browser, frame, url)
+
+    def OnTitleChange(self, browser, title):  # noqa: N802
+        self._forward("OnTitleChange", browser, title)
+
+    def OnStatusMessage(self, browser, value):  # noqa: N802
+        self._forward("OnStatusMessage", browser, value)
+
+    def OnConsoleMessage(self, browser, message, source, line):  # noqa: N802
+        self._forward("OnConsoleMessage", browser, message, source, line)
+        return True
+
+    def OnGotFocus(self, browser):  # noqa: N802
+        self._forward("OnGotFocus", browser)
+
+    def OnTakeFocus(self, browser, next_component):  # noqa: N802
+        self._forward("OnTakeFocus", browser, next_component)
+
+    def OnJavascriptDialog(  # noqa: N802
+        self,
+        browser,
+        origin_url,
+        dialog_type,
+        message_text,
+        default_prompt_text,
+        callback,
+        suppress_message_out,
+    ):
+        self._forward(
+            "OnJavascriptDialog", browser, origin_url, dialog_type,
+            message_text, default_prompt_text, callback, [])
+        return True
+
+    def OnBeforeUnloadJavascriptDialog(  # noqa: N802
+        self,
+        browser,
+        message_text,
+        is_reload,
+        callback,
+    ):
+        self._forward(
+            "OnBeforeUnloadJavascriptDialog", browser, message_text,
+            is_reload, callback)
+        return True
+
+    def OnResetJavascriptDialogState(self, browser):  # noqa: N802
+        self._forward("OnResetJavascriptDialogState", browser)
+
+    def OnBeforePopup(  # noqa: N802
+        self,
+        browser,
+        frame,
+        target_url,
+        target_frame_name,
+        target_disposition,
+        user_gesture,
+        popup_features,
+        window_info_out,
+        client,
+        browser_settings_out,
+        no_javascript_access_out,
+    ):
+        entry = self.server.find(browser)
+        if entry:
+            self.server.send("popup", entry.identifier, target_url)
+        return True
+
+    def DoClose(self, browser):  # noqa: N802
+        self._forward("DoClose", browser)
+        return False
+
+    def OnBeforeClose(self, browser):  # noqa: N802
+        self.server.remove(browser)
+
+    def OnLoadingStateChange(  # noqa: N802
+        self,
+        browser,
+        is_loading,
+        can_go_back,
+        can_go_forward,
+    ):
+        entry = self.server.find(browser)
+        if entry and entry.bindings and not is_loading:
+            # Navigating loses the bindings (see CEFBrowserJSProxy)
+            entry.bindings.Rebind()
+        self._forward(
+            "OnLoadingStateChange", browser, is_loading, can_go_back,
+            can_go_forward)
+
+    def OnLoadStart(self, browser, frame):  # noqa: N802
+        self._forward("OnLoadStart", browser, frame)
+
+    def OnLoadEnd(self, browser, frame, http_code):  # noqa: N802
+        self._forward("OnLoadEnd", browser, frame, http_code)
+
+    def OnLoadError(  # noqa: N802
+        self,
+        browser,
+        frame,
+        error_code,
+        error_text_out,
+        failed_url,
+    ):
+        self._forward(
+            "OnLoadError", browser, frame, error_code, error_text_out,
+            failed_url)
+
+    def StartDragging(  # noqa: N802
+        self,
+        browser,
+        drag_data,
+        allowed_ops,
+        x,
+        y,
+    ):
+        return False
+
+    def OnBeforeBrowse(  # noqa: N802
+        self,
+        browser,
+        frame,
+        request,
+        is_redirect,
+    ):
+        self._forward("OnBeforeBrowse", browser, frame, None, is_redirect)
+        return False
+
+    def GetAuthCredentials(  # noqa: N802
+        self,
+        browser,
+        frame,
+        is_proxy,
+        host,
+        port,
+        realm,
+        scheme,
+        callback,
+    ):
+        self._forward(
+            "GetAuthCredentials", browser, frame, is_proxy, host, port,
+            realm, scheme, callback)
+        return True
+
+    def OnRendererProcessTerminated(self, browser, status):  # noqa: N802
+        self._forward("OnRendererProcessTerminated", browser, status)
+
+
+class CEFRemoteServer:
+    """ Runs in the host process: Creates the CEF browsers and serves the
+    messages of the CEFRemoteHost on `connection` until it disconnects"""
+    poll_interval = 0.005
+    """How long to wait for messages between two MessageLoopWork()"""
+    _settings = {}
+    _command_line_switches = {}
+    _caches_path = None
+    _cookies_path = None
+    _logs_path = None
+    _cookie_manager = None
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.handler = CEFRemoteServerHandler(self)
+        self.browsers = {}
+        """The CEFRemoteServerBrowsers (by the identifier in the Kivy
+        process)"""
+        self.is_initialized = False
+        self.is_running = False
+        self._by_cef_identifier = {}
+        self._creating = None
+        self._callbacks = {}
+        self._next_callback = 1
+
+    def serve(self):
+        self.is_running = True
+        try:
+            while self.is_running:
+                while self.is_running and self.connection.poll(0):
+                    message = self.connection.recv()
+                    try:
+                        getattr(self, "_on_" + message[0])(*message[1:])
+                    except Exception as err:
+                        Logger.exception(
+                            "CEFRemote: Handling %s failed: %s",
+                            message[0], err)
+                if self.is_initialized:
+                    cefpython.MessageLoopWork()
+                self.connection.poll(self.poll_interval)
+        except (EOFError, OSError):
+            Logger.info("CEFRemote: The Kivy process disconnected")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        for entry in list(self.browsers.values()):
+            entry.browser.CloseBrowser(True)
+            entry.close()
+        self.browsers.clear()
+        if self.is_initialized:
+            cefpython.Shutdown()
+            self.is_initialized = False
+
+    def send(self, *message):
+        try:
+            self.connection.send(message)
+        except (EOFError, OSError):
+            self.is_running = False
+
+    def find(self, browser):
+        """ Returns the CEFRemoteServerBrowser of `browser` or None"""
+        entry = self._by_cef_identifier.get(browser.GetIdentifier())
+        return entry or self._creating
+
+    def remove(self, browser):
+        entry = self._by_cef_identifier.pop(browser.GetIdentifier(), None)
+        if entry is None:
+            return
+        self.browsers.pop(entry.identifier, None)
+        entry.close()
+        for callback in [key for key, value in self._callbacks.items()
+                         if value[0] == entry.identifier]:
+            del self._callbacks[callback]
+        self.send("closed", entry.identifier)
+
+    def encode(self, value, identifier=None):
+        """ Returns `value` as it can be sent: Frames and callback objects
+        are replaced by CEFRemoteRefs"""
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self.encode(v, identifier) for v in value]
+        if isinstance(value, dict):
+            return dict(
+                (k, self.encode(v, identifier)) for k, v in value.items())
+        if hasattr(value, "IsMain"):
+            return CEFRemoteRef("frame", value.GetIdentifier(), {
+                "identifier": value.GetIdentifier(),
+                "is_main": value.IsMain(),
+                "name": value.GetName(),
+                "url": value.GetUrl(),
+            })
+        self._next_callback += 1
+        self._callbacks[self._next_callback] = (identifier, value)
+        return CEFRemoteRef("callback", self._next_callback)
+
+    def _on_initialize(self, options):
+        self._settings = options["settings"]
+        self._command_line_switches = options["switches"]
+        self._caches_path = options["caches_path"]
+        self._cookies_path = options["cookies_path"]
+        self._logs_path = options["logs_path"]
+        timings = {}
+        begin = time.time()
+        cefpython_start(self, timings=timings)
+        timings["total"] = time.time() - begin
+        self.is_initialized = True
+        self.send("initialized", os.getpid(), timings)
+
+    def _on_create(self, identifier, url, rect, settings):
+        window_info = cefpython.WindowInfo()
+        window_info.SetAsOffscreen(0)
+        entry = self._creating = CEFRemoteServerBrowser(identifier, None, rect)
+        try:
+            entry.browser = cefpython.CreateBrowserSync(
+                window_info, settings, navigateUrl=url)
+        finally:
+            self._creating = None
+        self.browsers[identifier] = entry
+        self._by_cef_identifier[entry.browser.GetIdentifier()] = entry
+        entry.browser.SetClientHandler(self.handler)
+        entry.browser.WasResized()
+
+    def _on_resize(self, identifier, rect):
+        entry = self.browsers.get(identifier)
+        if entry:
+            entry.rect = rect
+            entry.browser.WasResized()
+
+    def _on_call(self, identifier, name, largs, dargs):
+        entry = self.browsers.get(identifier)
+        if entry:
+            getattr(entry.browser, name)(*largs, **dargs)
+
+    def _on_frame_call(self, identifier, key, name, largs):
+        entry = self.browsers.get(identifier)
+        if not entry:
+            return
+        if key == "main":
+            frame = entry.browser.GetMainFrame()
+        elif key == "focused":
+            frame = entry.browser.GetFocusedFrame()
+        else:
+            frame = entry.browser.GetFrameByIdentifier(key)
+        if frame:
+            getattr(frame, name)(*largs)
+
+    def _on_bindings(self, identifier, names):
+        entry = self.browsers.get(identifier)
+        if not entry:
+            return
+        entry.bindings = cefpython.JavascriptBindings(
+            bindToFrames=True, bindToPopups=True)
+        for name in names:
+            entry.bindings.SetFunction(
+                name, partial(self._call_js_function, identifier, name))
+        entry.browser.SetJavascriptBindings(entry.bindings)
+
+    def _call_js_function(self, identifier, name, *largs):
+        self.send("js", identifier, name, self.encode(largs, identifier))
+
+    def _on_callback(self, callback, name, *largs):
+        entry = self._callbacks.pop(callback, None)
+        if entry:
+            getattr(entry[1], name)(*largs)
+
+    def _on_delete_cookies(self, url):
+        cookie_manager = cefpython.CookieManager.GetGlobalManager()
+        if cookie_manager:
+            cookie_manager.DeleteCookies(url, "")
+
+    def _on_ping(self, timestamp):
+        self.send("pong", timestamp)
+
+    def _on_shutdown(self):
+        self.is_running = False
+
+
+def main(argv):
+    import argparse
+    from multiprocessing.connection import Connection
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--fd", type=int, required=True,
+        help="file descriptor of the socket to the Kivy process")
+    args = parser.parse_args(argv)
+    CEFRemoteServer(Connection(args.fd)).serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
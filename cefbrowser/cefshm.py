@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Shared Memory Frame Export.
+The paints of a CEFBrowser can be published into a ring buffer in a
+memory-mapped file (under /dev/shm), so other processes can record or
+monitor what is shown without touching the GPU of the Kivy process.
+
+Layout of the file:
+- Header: magic, version, number of slots, slot size, maximum frame size and
+  the sequence number of the last completed frame.
+- Slots: Each slot has a header (sequence numbers written before and after
+  the pixels, timestamp, frame size and dirty rects) followed by the BGRA
+  pixels of the frame (top-left origin, 4 bytes per pixel, no padding).
+
+A frame is valid as long as the sequence number written before its pixels
+(`seq_start`) still equals the one written after them (`seq_end`). The
+writer never blocks: A reader that falls behind by more than the number of
+slots loses frames, which it reports in `lost`.
+'''
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+MAGIC = b"CEFRING1"
+VERSION = 1
+MAX_RECTS = 16
+"""More dirty rects are exported as their bounding rect"""
+
+_HEADER = struct.Struct("<8sIIQIIQ")
+_HEADER_SIZE = 64
+_WRITE_SEQ_OFFSET = struct.calcsize("<8sIIQII")
+_SLOT = struct.Struct("<QQdIII" + "I" * 4 * MAX_RECTS)
+_SLOT_HEADER_SIZE = (_SLOT.size + 63) // 64 * 64
+_SEQ_END_OFFSET = 8
+
+
+def default_path(name):
+    """ Returns a path for the ring named `name` in shared memory"""
+    directory = "/dev/shm"
+    if not os.path.isdir(directory):
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, "cefbrowser-%i-%s" % (os.getpid(), name))
+
+
+class CEFFrameRingWriter:
+    """ Writes frames into the ring buffer file at `path`, which is created
+    for frames of up to `max_size` (width, height) pixels."""
+
+    def __init__(self, path, max_size, slots=4):
+        self.path = path
+        self.slots = slots
+        self.max_width, self.max_height = [int(v) for v in max_size]
+        self.capacity = self.max_width * self.max_height * 4
+        self.slot_size = (
+            (_SLOT_HEADER_SIZE + self.capacity + 63) // 64 * 64)
+        self.sequence = 0
+        self.skipped = 0
+        """Frames not written, because they exceeded `max_size`"""
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, _HEADER_SIZE + slots * self.slot_size)
+            self._mm = mmap.mmap(fd, _HEADER_SIZE + slots * self.slot_size)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(
+            self._mm, 0, MAGIC, VERSION, slots, self.slot_size,
+            self.max_width, self.max_height, 0)
+
+    def write(self, view, width, height, dirty_rects, timestamp=None):
+        """ Copies the BGRA frame `view` into the next slot. Returns the
+        sequence number of the frame or None if it was skipped."""
+        nbytes = width * height * 4
+        if self._mm is None:
+            return None
+        if self.capacity < nbytes:
+            self.skipped += 1
+            return None
+        sequence = self.sequence + 1
+        offset = _HEADER_SIZE + (sequence - 1) % self.slots * self.slot_size
+        rects = list(dirty_rects or [[0, 0, width, height]])
+        if MAX_RECTS < len(rects):
+            x0 = min(r[0] for r in rects)
+            y0 = min(r[1] for r in rects)
+            x1 = max(r[0] + r[2] for r in rects)
+            y1 = max(r[1] + r[3] for r in rects)
+            rects = [[x0, y0, x1 - x0, y1 - y0]]
+        flat = [0] * (4 * MAX_RECTS)
+        for i, rect in enumerate(rects):
+            flat[i * 4:i * 4 + 4] = [int(v) for v in rect]
+        # seq_end still holds the old sequence: readers see an invalid slot
+        _SLOT.pack_into(
+            self._mm, offset, sequence,
+            struct.unpack_from("<Q", self._mm, offset + _SEQ_END_OFFSET)[0],
+            timestamp or time.time(), width, height, len(rects), *flat)
+        pixels = offset + _SLOT_HEADER_SIZE
+        self._mm[pixels:pixels + nbytes] = view
+        struct.pack_into("<Q", self._mm, offset + _SEQ_END_OFFSET, sequence)
+        struct.pack_into("<Q", self._mm, _WRITE_SEQ_OFFSET, sequence)
+        self.sequence = sequence
+        return sequence
+
+    def close(self, unlink=True):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if unlink:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class CEFSharedFrame:
+    """ A frame in the ring. `pixels` is a read-only memoryview into the
+    shared memory (no copy), valid as long as `is_valid()` returns True.
+    Call `release()` when done with it."""
+
+    def __init__(self, reader, sequence, offset, timestamp, width, height,
+                 dirty_rects):
+        self._reader = reader
+        self._offset = offset
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.dirty_rects = dirty_rects
+        self.shape = (height, width, 4)
+        self.strides = (width * 4, 4, 1)
+        start = offset + _SLOT_HEADER_SIZE
+        self.pixels = reader._view[start:start + width * height * 4]
+
+    def is_valid(self):
+        """ Whether the writer has not started to overwrite the frame yet"""
+        return self._reader._seq_start(self._offset) == self.sequence
+
+    def release(self):
+        if self.pixels is not None:
+            self.pixels.release()
+            self.pixels = None
+
+
+class CEFFrameRingReader:
+    """ Reads the frames another process writes into the ring at `path`.
+    Kivy's `Texture.blit_buffer()` takes writable buffers only: With
+    `writable=True`, the pixels can be uploaded straight from the shared
+    memory (the reader must not write to them nevertheless)."""
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        with open(path, "r+b" if writable else "rb") as f:
+            self._mm = mmap.mmap(
+                f.fileno(), 0,
+                access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        (magic, version, self.slots, self.slot_size, self.max_width,
+         self.max_height, _) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a CEFBrowser frame ring" % path)
+        self.next_sequence = None
+        self.lost = 0
+        """Frames overwritten before they could be read"""
+
+    @property
+    def latest_sequence(self):
+        return struct.unpack_from("<Q", self._mm, _WRITE_SEQ_OFFSET)[0]
+
+    @property
+    def lag(self):
+        """ How many written frames have not been read yet"""
+        if self.next_sequence is None:
+            return min(1, self.latest_sequence)
+        return max(0, self.latest_sequence - self.next_sequence + 1)
+
+    def _seq_start(self, offset):
+        return struct.unpack_from("<Q", self._mm, offset)[0]
+
+    def _frame(self, sequence):
+        offset = _HEADER_SIZE + (sequence - 1) % self.slots * self.slot_size
+        values = _SLOT.unpack_from(self._mm, offset)
+        seq_start, seq_end, timestamp, width, height, n_rects = values[:6]
+        if seq_start != sequence or seq_end != sequence:
+            return None
+        flat = values[6:]
+        rects = [list(flat[i * 4:i * 4 + 4]) for i in range(n_rects)]
+        frame = CEFSharedFrame(
+            self, sequence, offset, timestamp, width, height, rects)
+        if not frame.is_valid():  # Overwritten while reading the header
+            frame.release()
+            return None
+        return frame
+
+    def read(self):
+        """ Returns the next frame or None if there is no new one. Frames
+        overwritten in the meantime are skipped and counted in `lost`."""
+        while True:
+            latest = self.latest_sequence
+            if not latest:
+                return None
+            if self.next_sequence is None:
+                self.next_sequence = latest
+            if latest < self.next_sequence:
+                return None
+            oldest = max(1, latest - self.slots + 1)
+            if self.next_sequence < oldest:
+                self.lost += oldest - self.next_sequence
+                self.next_sequence = oldest
+            frame = self._frame(self.next_sequence)
+            self.next_sequence += 1
+            if frame is not None:
+                return frame
+            self.lost += 1
+
+    def read_latest(self):
+        """ Returns the newest frame, skipping (and counting) older ones"""
+        latest = self.latest_sequence
+        if self.next_sequence is not None and self.next_sequence < latest:
+            self.lost += latest - self.next_sequence
+            self.next_sequence = latest
+        return self.read()
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
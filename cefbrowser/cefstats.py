@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Frame Statistics.
+Every CEFBrowser keeps statistics about its paints and texture uploads. The
+samples are kept in fixed-size ring buffers, so recording them is cheap and
+the current values can be read as Kivy properties at any time.
+'''
+
+from array import array
+
+from kivy.event import EventDispatcher
+from kivy.properties import NumericProperty
+
+
+class CEFRingBuffer:
+    """ Keeps the last `size` samples"""
+
+    def __init__(self, size=120):
+        self._values = array("d", [0.0]) * size
+        self._size = size
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    def clear(self):
+        self._index = 0
+        self._count = 0
+
+    def first(self):
+        """ The oldest sample (or 0 if empty)"""
+        if not self._count:
+            return 0
+        return self._values[(self._index - self._count) % self._size]
+
+    def last(self):
+        """ The newest sample (or 0 if empty)"""
+        if not self._count:
+            return 0
+        return self._values[(self._index - 1) % self._size]
+
+    def values(self):
+        """ All samples from oldest to newest"""
+        start = (self._index - self._count) % self._size
+        if start + self._count <= self._size:
+            return list(self._values[start:start + self._count])
+        return list(self._values[start:]) + \
+            list(self._values[:self._index])
+
+    def mean(self):
+        if not self._count:
+            return 0
+        return sum(self.values()) / self._count
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """ Returns a dict mapping each of `percents` to the sample at that
+        percentile (nearest rank)"""
+        values = sorted(self.values())
+        if not values:
+            return dict((p, 0) for p in percents)
+        n = len(values)
+        return dict(
+            (p, values[min(n - 1, max(0, int(round(p / 100. * n)) - 1))])
+            for p in percents
+        )
+
+
+class CEFFrameStatistics(EventDispatcher):
+    """ Frame statistics of one CEFBrowser"""
+    paint_fps = NumericProperty(0)
+    """Paints per second over the last `size` paints"""
+    paint_latency = NumericProperty(0)
+    """Seconds from the (oldest) paint to the end of its upload"""
+    upload_duration = NumericProperty(0)
+    """Seconds spent in the last texture upload"""
+    bytes_uploaded = NumericProperty(0)
+    """Total bytes uploaded to the GPU"""
+    dirty_ratio = NumericProperty(0)
+    """Part (0 to 1) of the view that changed in the last paint"""
+    paints = NumericProperty(0)
+    """Total number of paints"""
+    uploads = NumericProperty(0)
+    """Total number of texture uploads"""
+    scroll_fps = NumericProperty(0)
+    """Wheel events per second while scrolling (incl. flinging)"""
+    scrolls = NumericProperty(0)
+    """Total number of wheel events"""
+    scroll_gap = .25
+    """Wheel events further apart (in seconds) belong to different gestures,
+    the gap does not count as a scroll interval"""
+
+    def __init__(self, size=120, **kwargs):
+        super(CEFFrameStatistics, self).__init__(**kwargs)
+        self.paint_times = CEFRingBuffer(size)
+        self.latencies = CEFRingBuffer(size)
+        self.upload_durations = CEFRingBuffer(size)
+        self.upload_sizes = CEFRingBuffer(size)
+        self.dirty_ratios = CEFRingBuffer(size)
+        self.scroll_times = CEFRingBuffer(size)
+        self.scroll_intervals = CEFRingBuffer(size)
+
+    def record_paint(self, timestamp, dirty_ratio):
+        self.paint_times.append(timestamp)
+        self.dirty_ratios.append(dirty_ratio)
+        self.paints += 1
+        self.dirty_ratio = dirty_ratio
+        span = timestamp - self.paint_times.first()
+        if 0 < span:
+            self.paint_fps = (len(self.paint_times) - 1) / span
+
+    def record_upload(self, paint_time, begin, end, nbytes):
+        self.latencies.append(end - paint_time)
+        self.upload_durations.append(end - begin)
+        self.upload_sizes.append(nbytes)
+        self.uploads += 1
+        self.paint_latency = end - paint_time
+        self.upload_duration = end - begin
+        self.bytes_uploaded += nbytes
+
+    def record_scroll(self, timestamp):
+        if self.scroll_times:
+            interval = timestamp - self.scroll_times.last()
+            if interval < self.scroll_gap:
+                self.scroll_intervals.append(interval)
+        self.scroll_times.append(timestamp)
+        self.scrolls += 1
+        mean = self.scroll_intervals.mean()
+        if 0 < mean:
+            self.scroll_fps = 1. / mean
+
+    def reset(self):
+        for ring in (
+            self.paint_times, self.latencies, self.upload_durations,
+            self.upload_sizes, self.dirty_ratios, self.scroll_times,
+            self.scroll_intervals,
+        ):
+            ring.clear()
+        self.paint_fps = self.paint_latency = self.upload_duration = 0
+        self.bytes_uploaded = self.dirty_ratio = 0
+        self.paints = self.uploads = 0
+        self.scroll_fps = self.scrolls = 0
+
+    def summary(self, percents=(50, 90, 99)):
+        """ Returns a dict with the current values and percentiles of the
+        recorded samples"""
+        return {
+            "paint_fps": self.paint_fps,
+            "paints": self.paints,
+            "uploads": self.uploads,
+            "bytes_uploaded": self.bytes_uploaded,
+            "paint_latency": self.latencies.percentiles(percents),
+            "upload_duration": self.upload_durations.percentiles(percents),
+            "upload_size": self.upload_sizes.percentiles(percents),
+            "dirty_ratio": self.dirty_ratios.percentiles(percents),
+            "scroll_fps": self.scroll_fps,
+            "scrolls": self.scrolls,
+            "scroll_interval": self.scroll_intervals.percentiles(percents),
+        }
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+'''
+Cef Thumbnails.
+Small snapshots of browsers, e.g. for a tab overview. They are downscaled
+from a paint of CEF as it happens (see `CEFBrowser.on_paint`), not read back
+from the GPU, and no full-size copy of the frame is kept. They are refreshed
+at most `max_rate` times per second per browser and only when the browser
+painted; if it didn't paint when a refresh is due, CEF is asked to repaint.
+The pixels are kept in a LRU cache limited to `budget` bytes; small textures
+are created from them on demand.
+'''
+
+from collections import OrderedDict
+from functools import partial
+import math
+import time
+
+from kivy.clock import Clock
+
+from .cefcapture import load_numpy
+from .cefpaint import create_texture, upload
+
+
+def downscale(frame, factor):
+    """ Shrinks the BGRA `frame` (shape (height, width, 4), see `capture()`)
+    by the integer `factor`. With NumPy, every pixel of the thumbnail is the
+    mean of a `factor` x `factor` box, else the pixel in its center.
+    Returns the pixels, width and height."""
+    height, width = frame.shape[:2]
+    tw, th = max(1, width // factor), max(1, height // factor)
+    if factor <= 1:
+        return bytes(frame), width, height
+    numpy = load_numpy()
+    if numpy is not None:
+        boxes = numpy.asarray(frame)[:th * factor, :tw * factor].reshape(
+            th, factor, tw, factor, 4)
+        mean = boxes.sum(axis=(1, 3), dtype=numpy.uint32) // (factor * factor)
+        return mean.astype(numpy.uint8).tobytes(), tw, th
+    flat = memoryview(frame).cast("B")
+    stride = width * 4
+    row = tw * 4
+    center = factor // 2
+    out = bytearray(row * th)
+    for y in range(th):
+        offset = (y * factor + center) * stride + center * 4
+        source = bytes(flat[offset:offset + tw * factor * 4])
+        for channel in range(4):
+            out[y * row + channel:(y + 1) * row:4] = \
+                source[channel::factor * 4][:tw]
+    return bytes(out), tw, th
+
+
+class CEFThumbnail:
+    """ The cached thumbnail of a browser"""
+
+    def __init__(self, pixels, width, height, timestamp):
+        self.pixels = pixels
+        self.width = width
+        self.height = height
+        self.timestamp = timestamp
+        """When the thumbnail was made"""
+        self.texture = None
+
+    @property
+    def nbytes(self):
+        return len(self.pixels)
+
+
+class CEFThumbnailCache:
+    """ Thumbnails of up to `size` (width, height) of the `track`ed
+    browsers"""
+
+    def __init__(self, size=(256, 160), budget=8 * 1024 * 1024, max_rate=1.):
+        self.size = size
+        self.budget = budget
+        """Maximum bytes of all thumbnails (textures take as much again on
+        the GPU)"""
+        self.max_rate = max_rate
+        """Maximum refreshes per second per browser"""
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tracked = {}
+
+    def track(self, browser):
+        """ Keeps the thumbnail of `browser` up to date"""
+        if browser in self._tracked:
+            return
+        self._tracked[browser] = {"last": 0, "event": None, "dirty": True}
+        browser.bind(on_paint=self._on_paint)
+        self._schedule(browser)
+
+    def untrack(self, browser):
+        state = self._tracked.pop(browser, None)
+        if not state:
+            return
+        browser.unbind(on_paint=self._on_paint)
+        if state["event"]:
+            state["event"].cancel()
+        self._evict(browser)
+
+    def get(self, browser):
+        """ Returns the thumbnail texture of `browser` or None if there is
+        none yet"""
+        entry = self._entries.get(browser)
+        if not entry:
+            self.misses += 1
+            self._schedule(browser)
+            return None
+        self.hits += 1
+        self._entries.move_to_end(browser)
+        if not entry.texture:
+            entry.texture = create_texture((entry.width, entry.height))
+            upload(entry.texture, entry.pixels, entry.width, entry.height,
+                   [[0, 0, entry.width, entry.height]])
+        return entry.texture
+
+    def clear(self):
+        for browser in list(self._entries):
+            self._evict(browser)
+
+    def stats(self):
+        return {
+            "thumbnails": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "evictions": self.evictions,
+        }
+
+    def _delay(self, state):
+        """ Seconds until a refresh is due"""
+        return max(0, state["last"] + 1. / self.max_rate - time.time())
+
+    def _on_paint(self, browser, view, width, height, dirty_rects,
+                  timestamp):
+        state = self._tracked.get(browser)
+        if not state:
+            return
+        if self._delay(state):
+            state["dirty"] = True
+            self._schedule(browser)
+            return
+        # The view is only valid during the paint, downscale it right away
+        self._refresh(
+            browser, memoryview(view).cast("B", (height, width, 4)))
+
+    def _schedule(self, browser):
+        """ Asks `browser` to repaint once a refresh is due, unless it
+        painted (and was refreshed) by then"""
+        state = self._tracked.get(browser)
+        if not state or state["event"]:
+            return
+        state["event"] = Clock.schedule_once(
+            partial(self._request_paint, browser), self._delay(state))
+
+    def _request_paint(self, browser, *largs):
+        state = self._tracked.get(browser)
+        if not state:
+            return
+        state["event"] = None
+        if browser in self._entries and not state["dirty"]:
+            return  # Refreshed by a paint in the meantime
+        if self._delay(state):
+            self._schedule(browser)
+            return
+        browser.invalidate()
+
+    def _refresh(self, browser, frame):
+        state = self._tracked[browser]
+        state["last"] = time.time()
+        state["dirty"] = False
+        height, width = frame.shape[:2]
+        factor = max(1, int(math.ceil(max(
+            float(width) / self.size[0], float(height) / self.size[1]))))
+        pixels, tw, th = downscale(frame, factor)
+        self._evict(browser, count=False)
+        self._entries[browser] = CEFThumbnail(pixels, tw, th, state["last"])
+        self.nbytes += len(pixels)
+        self.refreshes += 1
+        while self.budget < self.nbytes and 1 < len(self._entries):
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, browser, count=True):
+        entry = self._entries.pop(browser, None)
+        if entry:
+            self.nbytes -= entry.nbytes
+            self.evictions += count
@@ -13,9 +13,16 @@ from kivy.app import App
 from kivy.clock import Clock
 from kivy.core.window import Window
 from kivy.garden.cefpython import CEFBrowser
+from kivy.garden.cefpython.cefbrowser.cefhibernation import \
+    CEFHibernationManager
+from kivy.garden.cefpython.cefbrowser.cefmemory import CEFMemoryMonitor
+from kivy.garden.cefpython.cefbrowser.cefpool import CEFBrowserPool
+from kivy.garden.cefpython.cefbrowser.cefthumbnail import CEFThumbnailCache
 from kivy.properties import StringProperty
+from kivy.uix.behaviors import ButtonBehavior
 from kivy.uix.button import Button
 from kivy.uix.gridlayout import GridLayout
+from kivy.uix.image import Image
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.textinput import TextInput
 from kivy.uix.togglebutton import ToggleButton
@@ -52,7 +59,10 @@ class TabbedCEFBrowserTab(GridLayout):
         self.bind(text=self._on_text)
         if cef_browser:
             self.__cef_browser = cef_browser
-            self.__configure_cef_browser()
+        else:
+            self.__cef_browser = tabbed_cef_browser._pool.create_browser(
+                url, lazy=True)
+        self.__configure_cef_browser()
 
     def _on_toggle_state(self, toggle_button, new_state):
         if new_state == "down":
@@ -70,17 +80,19 @@ class TabbedCEFBrowserTab(GridLayout):
         self.__toggle_button.trigger_action()
 
     def close(self, *largs):
-        self.cef_browser._browser.CloseBrowser()
+        if self.cef_browser.is_created:
+            self.cef_browser._browser.CloseBrowser()
+        else:  # Never shown, there is no CEF browser to close
+            self._close_tab_handler(self.cef_browser)
 
     @property
     def cef_browser(self):
-        if not self.__cef_browser:
-            self.__cef_browser = CEFBrowser(self.url)
-            self.__configure_cef_browser()
         return self.__cef_browser
 
     def __configure_cef_browser(self):
         self.__cef_browser.popup_policy = CEFBrowser.always_allow_popups
+        self.__cef_browser.frame_rate_policy = \
+            CEFBrowser.throttled_frame_rate
         self.__cef_browser.popup_handler = self._popup_new_tab_handler
         self.__cef_browser.close_handler = self._close_tab_handler
         self.__cef_browser.bind(url=self.setter("url"))
@@ -88,12 +100,18 @@ class TabbedCEFBrowserTab(GridLayout):
         self.__cef_browser.bind(on_load_start=self._on_load_start)
         self.__cef_browser.bind(on_load_end=self._on_load_end)
         self.__cef_browser.bind(on_load_error=self._on_load_end)
+        self.__tabbed_cef_browser._thumbnails.track(self.__cef_browser)
+        self.__tabbed_cef_browser._hibernation.track(self.__cef_browser)
+        self.__tabbed_cef_browser._memory.track(self.__cef_browser)
 
     def _popup_new_tab_handler(self, browser, popup_browser):
         self.__tabbed_cef_browser.add_tab(TabbedCEFBrowserTab(
             self.__tabbed_cef_browser, cef_browser=popup_browser))
 
     def _close_tab_handler(self, browser, *largs):
+        self.__tabbed_cef_browser._thumbnails.untrack(browser)
+        self.__tabbed_cef_browser._hibernation.untrack(browser)
+        self.__tabbed_cef_browser._memory.untrack(browser)
         self.__tabbed_cef_browser.remove_tab(self)
 
     def _on_load_start(self, browser, *largs):
@@ -109,9 +127,18 @@ class TabbedCEFBrowserTab(GridLayout):
             not self.__tabbed_cef_browser._current_browser.can_go_forward
 
 
+class TabbedCEFBrowserThumbnail(ButtonBehavior, Image):
+    pass
+
+
 class TabbedCEFBrowser(GridLayout):
     def __init__(self, urls=["http://www.rentouch.ch"], *largs, **dargs):
         super(TabbedCEFBrowser, self).__init__(cols=1, *largs, **dargs)
+        self._thumbnails = CEFThumbnailCache()
+        self._pool = CEFBrowserPool(size=1)
+        self._hibernation = CEFHibernationManager(max_active=4)
+        self._memory = CEFMemoryMonitor(browser_limit=1 << 30)
+        self._memory.bind(on_browser_limit=self._on_memory_limit)
         gl = GridLayout(rows=1, size_hint=(1, None), height=controls_size)
         self.current_tab = None
         self.__tab_bar_scroll = ScrollView(size_hint=(1, 1))
@@ -152,10 +179,16 @@ class TabbedCEFBrowser(GridLayout):
             text="Go", font_size=controls_size/2, size_hint=(None, 1),
             width=controls_size)
         self._load_button.bind(on_press=self._on_load_button)
+        self._overview_button = Button(
+            text="#", font_size=controls_size/2, size_hint=(None, 1),
+            width=controls_size)
+        self._overview_button.bind(on_press=self._on_overview_press)
+        self._overview = None
         self.__control_bar_grid.add_widget(self._back_button)
         self.__control_bar_grid.add_widget(self._forward_button)
         self.__control_bar_grid.add_widget(self._url_input)
         self.__control_bar_grid.add_widget(self._load_button)
+        self.__control_bar_grid.add_widget(self._overview_button)
         self._current_browser = CEFBrowser()
         self.add_widget(gl)
         self.add_widget(self.__control_bar_grid)
@@ -198,6 +231,37 @@ class TabbedCEFBrowser(GridLayout):
         else:
             self._current_browser.reload()
 
+    def _on_memory_limit(self, monitor, browser, rss):
+        if not browser.parent:  # Only discard tabs in the background
+            browser.hibernate(self._hibernation.snapshot_factor)
+
+    def _on_overview_press(self, overview_button):
+        if self._overview:
+            self._hide_overview()
+            return
+        self._overview = GridLayout(cols=5, spacing=5, padding=5)
+        for tab in reversed(self.tabs):
+            texture = self._thumbnails.get(tab.cef_browser)
+            if texture:
+                item = TabbedCEFBrowserThumbnail(texture=texture)
+            else:
+                item = Button(text=tab.text)
+            item.bind(on_press=functools.partial(self._on_overview_tab, tab))
+            self._overview.add_widget(item)
+        self.remove_widget(self._current_browser)
+        self.add_widget(self._overview)
+
+    def _on_overview_tab(self, tab, item):
+        self._hide_overview()
+        if tab != self.current_tab:
+            tab.select()
+
+    def _hide_overview(self):
+        if self._overview:
+            self.remove_widget(self._overview)
+            self._overview = None
+            self.add_widget(self._current_browser)
+
     def select_first_tab(self):
         for tab in self.__tab_bar_grid.children:
             tab.select()
@@ -226,6 +290,7 @@ class TabbedCEFBrowser(GridLayout):
                 tmp = tmp.last_tab
             new_tab.last_tab = ct
             self.current_tab = new_tab
+        self._hide_overview()
         try:
             self._current_browser.unbind(url=self._url_input_set_text)
         except:
@@ -256,6 +321,8 @@ if __name__ == '__main__':
             tb.height -= 100
 
         def build(self):
+            # Overlap initializing CEF with building the tabs
+            CEFBrowser.initialize_async()
             Clock.schedule_once(self.timeout, 15)
             self.tb = TabbedCEFBrowser(
                 urls=[
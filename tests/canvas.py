@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Regression test: The canvas of CEFBrowser and CEFBrowserPopup is built once.
+Realigning (moving, resizing) must only mutate the existing instructions, so
+the number of instructions stays constant. Runs without CEF (see
+performance.py for running it headless).
+"""
+
+import os
+import sys
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.core.window import Window  # noqa: E402,F401
+
+from cefbrowser import cefbrowser  # noqa: E402
+
+REALIGNS = 5000
+
+
+def instruction_counts(bw):
+    return len(bw.canvas.children), len(bw._popup.canvas.children)
+
+
+if __name__ == '__main__':
+    bw = cefbrowser.CEFBrowser(size=(320, 240))
+    bw._realign()
+    before = instruction_counts(bw)
+    for i in range(REALIGNS):
+        bw.pos = (i % 50, i % 30)
+        bw.size = (320 + i % 7, 240 + i % 5)
+        bw._realign()
+        bw._popup.rpos = (i % 11, i % 13)
+        bw._popup.view_size = (100 + i % 3, 50 + i % 3)
+        bw._popup.size = bw._popup.view_size
+    after = instruction_counts(bw)
+    print("Canvas instructions (browser, popup): before %s, after %s "
+          "%i realigns" % (before, after, REALIGNS))
+    if before != after:
+        print("FAIL: The canvas instruction list grows on realign")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Regression test of the shared-memory frame ring (cefshm): A reader in another
+process sees the frames a CEFBrowser exports, in order, and reports the ones
+it lost by falling behind. Runs without CEF (see performance.py for running
+it headless).
+"""
+
+import os
+import subprocess
+import sys
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.core.window import Window  # noqa: E402,F401
+
+from cefbrowser import cefbrowser  # noqa: E402
+
+SLOTS = 4
+
+READER = """
+import sys
+sys.path.insert(0, %(repository)r)
+from cefbrowser.cefshm import CEFFrameRingReader
+reader = CEFFrameRingReader(%(path)r)
+reader.next_sequence = 1
+frames = []
+while True:
+    frame = reader.read()
+    if frame is None:
+        break
+    frames.append((frame.sequence, frame.pixels[0], frame.shape))
+    frame.release()
+reader.close()
+print((frames, reader.lost, "cefbrowser.cefbrowser" in sys.modules))
+"""
+
+
+def paint(bw, paint_buffer, i):
+    paint_buffer.data[0] = i
+    bw._browser.paint(paint_buffer, [[0, 0, 8, 8]])
+
+
+if __name__ == '__main__':
+    bw = cefbrowser.CEFBrowser(size=(64, 48))
+    bw._realign()
+    path = bw.export_frames(slots=SLOTS)
+    paint_buffer = synthetic.SyntheticPaintBuffer(64, 48)
+    for i in range(1, 11):
+        paint(bw, paint_buffer, i)
+    output = subprocess.check_output([sys.executable, "-c", READER % {
+        "repository": os.path.dirname(os.path.dirname(
+            os.path.realpath(__file__))),
+        "path": path,
+    }])
+    frames, lost, imported_browser = eval(output)
+    bw.stop_export()
+    expected = [(i, i, (48, 64, 4)) for i in range(11 - SLOTS, 11)]
+    print("Frames read: %s, lost: %i" % (frames, lost))
+    if frames != expected or lost != 10 - SLOTS:
+        print("FAIL: Expected %s and %i lost" % (expected, 10 - SLOTS))
+        sys.exit(1)
+    if imported_browser:
+        print("FAIL: The reader imported CEFBrowser")
+        sys.exit(1)
+    if os.path.exists(path):
+        print("FAIL: %s was not removed" % path)
+        sys.exit(1)
+    print("OK")
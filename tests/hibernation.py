@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Test: The CEFHibernationManager closes the CEF browsers of the browsers that
+are not displayed, beyond `max_active` and after `idle_timeout`. Hibernated
+browsers show a snapshot and keep their url, title and history; they are
+recreated when displayed again. The snapshot is taken from a paint CEF is
+asked for when hibernating, the browsers don't capture their paints.
+Runs without CEF (see synthetic.py).
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+from kivy.core.window import Window  # noqa: E402
+from kivy.uix.widget import Widget  # noqa: E402
+
+from cefbrowser import cefbrowser  # noqa: E402
+from cefbrowser.cefhibernation import CEFHibernationManager  # noqa: E402
+
+TABS = 6
+MAX_ACTIVE = 2
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def paint_snapshots(tabs):
+    """ Paints the tabs asked to repaint (as CEF would), shown to CEF for
+    it although not displayed"""
+    for bw in tabs:
+        if not bw._browser:
+            continue
+        calls = [call[0] for call in bw._browser.calls]
+        if "Invalidate" not in calls:
+            continue
+        check(calls[calls.index("Invalidate") - 1] == "WasHidden" and
+              bw._browser.calls[calls.index("Invalidate") - 1][1] ==
+              (False,), "Hidden tab not shown for the snapshot")
+        del bw._browser.calls[:]
+        bw._browser.paint(synthetic.SyntheticPaintBuffer(320, 240), None)
+        check(bw._browser.calls[-1] == ("WasHidden", (True,), {}),
+              "Tab not hidden again after the snapshot")
+    Clock.tick()
+
+
+if __name__ == '__main__':
+    root = Widget()
+    Window.add_widget(root)
+    manager = CEFHibernationManager(
+        max_active=MAX_ACTIVE, idle_timeout=3600, snapshot_factor=2)
+    tabs = []
+    for i in range(TABS):
+        bw = cefbrowser.CEFBrowser("http://example.com/%i" % i,
+                                   size=(320, 240))
+        manager.track(bw)
+        bw._browser.paint(synthetic.SyntheticPaintBuffer(320, 240), None)
+        bw.url = "http://example.com/%i/next" % i
+        bw.title = "Tab %i" % i
+        tabs.append(bw)
+    root.add_widget(tabs[-1])
+    manager.check()
+    paint_snapshots(tabs)
+    stats = manager.stats()
+    print("After opening %i tabs: %s" % (TABS, stats))
+    check(stats["active"] == MAX_ACTIVE, "Too many active tabs")
+    check(tabs[-1].is_created, "The displayed tab was hibernated")
+    bw = tabs[0]
+    check(bw.is_hibernated and not bw.is_created, "The oldest tab is active")
+    check(tuple(bw._texture.size) == (160, 120), "No snapshot shown")
+    check(stats["texture_bytes_per_tab"] == 160 * 120 * 4,
+          "Snapshot size not accounted")
+    check(0 < stats["bytes_per_tab"] < 4096, "Hibernated state too large")
+    check(all(tab.capture_mode == "off" and not tab._capture
+              for tab in tabs), "Paints captured for the snapshots")
+
+    root.remove_widget(tabs[-1])
+    root.add_widget(bw)
+    check(bw.is_created and not bw.is_hibernated, "Not woken when displayed")
+    check(bw._browser.url == "http://example.com/0/next", "URL lost")
+    check(bw.title == "Tab 0", "Title lost")
+    bw._browser.handler.OnLoadingStateChange(bw._browser, False, False, False)
+    check(bw.can_go_back, "History lost")
+    bw.go_back()
+    check(bw._browser.url == "http://example.com/0", "Going back failed")
+    bw._browser.handler.OnLoadingStateChange(bw._browser, False, True, False)
+    check(not bw.can_go_back and bw.can_go_forward,
+          "History not used after waking")
+
+    # Without a paint, the tabs are hibernated after the snapshot_timeout
+    manager.idle_timeout = 0
+    manager.snapshot_timeout = 0.05
+    time.sleep(0.01)
+    manager.check()
+    end = time.time() + 1
+    while manager._snapshots and time.time() < end:
+        Clock.tick()
+    stats = manager.stats()
+    print("After the idle timeout: %s" % stats)
+    check(stats["active"] == 1 and bw.is_created, "Idle tabs not hibernated")
+    check(stats["wakes"] == 1, "Wakes not counted")
+    print("OK")
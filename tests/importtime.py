@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Import-time benchmark and regression test. Imports the cefbrowser package
+and its modules in fresh interpreters with `python -X importtime`, prints
+the slowest imports of each and checks that importing has no side effects:
+cefpython3 is not imported, cefbrowser.kv is not loaded and no dialogs are
+created until they are used. CEF is not needed (nor used).
+
+    SDL_VIDEODRIVER=offscreen python tests/importtime.py --top 15
+
+With `--budget` (milliseconds), it fails if an import takes longer.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+MODULES = ["cefbrowser", "cefbrowser.cefpaint", "cefbrowser.cefbrowser"]
+PROBE = """
+import sys
+import %s
+builder = sys.modules.get("kivy.lang.builder")
+state = {
+    "cefpython3": "cefpython3" in sys.modules,
+    "kv": builder is not None and any(
+        f.endswith("cefbrowser.kv") for f in builder.Builder.files),
+    "dialogs": False,
+}
+if "cefbrowser.cefbrowser" in sys.modules:
+    cls = sys.modules["cefbrowser.cefbrowser"].CEFBrowser
+    state["dialogs"] = not isinstance(
+        cls.__dict__["_js_alert"],
+        sys.modules["cefbrowser.cefbrowser"].CEFBrowserDialog)
+print("STATE " + __import__("json").dumps(state))
+"""
+
+
+def measure(module):
+    """ Returns the import times (name, self, cumulative in microseconds)
+    of importing `module` and the side effects found"""
+    env = dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1")
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE % module],
+        cwd=REPOSITORY, env=env, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        times.append((fields[2].strip(), int(fields[0]), int(fields[1])))
+    state = None
+    for line in process.stdout.splitlines():
+        if line.startswith("STATE "):
+            state = json.loads(line[len("STATE "):])
+    if process.returncode or state is None:
+        print(process.stderr[-2000:])
+        raise RuntimeError("Importing %s failed" % module)
+    return times, state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget", type=float, help="milliseconds")
+    args = parser.parse_args()
+    failed = False
+    for module in MODULES:
+        times, state = measure(module)
+        total = [t for t in times if t[0] == module][0][2]
+        print("%s: %.1f ms, side effects: %s" % (
+            module, total / 1000., state))
+        for name, own, cumulative in sorted(
+                times, key=lambda t: t[1], reverse=True)[:args.top]:
+            print("    %8.1f ms self %8.1f ms cumulative  %s" % (
+                own / 1000., cumulative / 1000., name))
+        if any(state.values()):
+            print("FAIL: Importing %s has side effects" % module)
+            failed = True
+        if args.budget and args.budget < total / 1000.:
+            print("FAIL: Importing %s takes longer than %.1f ms" % (
+                module, args.budget))
+            failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
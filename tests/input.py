@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Benchmark and regression test of the input coalescing: A touchscreen
+reporting several motion events per Kivy frame drags across the browser,
+with `input_coalescing` off and on. Prints the rate of the events received
+from Kivy and sent to CEF and checks that at most one move is sent per frame
+while the down and up events are sent right away and in order. Then it
+scrolls with two fingers and checks that one wheel event is sent per frame,
+nothing is lost and the scrolling goes on (slowing down) after the fingers
+are lifted. Touches and keys on a browser still waiting for
+`initialize_async()` must be ignored. Runs without CEF (see synthetic.py).
+
+    SDL_VIDEODRIVER=offscreen python tests/input.py --events-per-frame 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+from kivy.core.window import Window  # noqa: E402
+from kivy.input.motionevent import MotionEvent  # noqa: E402
+
+from cefbrowser import cefbrowser  # noqa: E402
+
+SIZE = (400, 300)
+INPUT_EVENTS = ("SendMouseMoveEvent", "SendMouseClickEvent",
+                "SendMouseWheelEvent")
+
+
+class SyntheticTouch(MotionEvent):
+    def __init__(self, uid, pos):
+        super(SyntheticTouch, self).__init__("synthetic", uid, pos)
+
+    def depack(self, args):
+        self.sx, self.sy = args[0] / Window.width, args[1] / Window.height
+        self.is_touch = True
+        super(SyntheticTouch, self).depack(args)
+
+    def move_to(self, pos):
+        self.px, self.py = self.pos
+        self.x, self.y = self.pos = pos
+        self.dx, self.dy = self.x - self.px, self.y - self.py
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def dispatch(bw, name, touch):
+    """ Dispatches like Kivy: Moves and up events go to the widget that
+    grabbed the touch"""
+    grabbed = name != "on_touch_down"
+    if grabbed and bw not in [ref() for ref in touch.grab_list]:
+        return
+    touch.grab_current = bw if grabbed else None
+    getattr(bw, name)(touch)
+    touch.grab_current = None
+
+
+def drag(bw, frames, events_per_frame):
+    """ Drags a touch across the browser, returns the input events sent to
+    CEF (name, args, keyword args)"""
+    browser = bw._browser
+    del browser.calls[:]
+    touch = SyntheticTouch(1, (10, 10))
+    touch.scale_for_screen(Window.width, Window.height)
+    dispatch(bw, "on_touch_down", touch)
+    for frame in range(frames):
+        for i in range(events_per_frame):
+            step = frame * events_per_frame + i + 1
+            touch.move_to((10 + 8 * step, 10 + 4 * step))
+            dispatch(bw, "on_touch_move", touch)
+        Clock.tick()
+    # Events not flushed yet must be sent before the up event
+    touch.move_to((touch.x + 1, touch.y + 1))
+    dispatch(bw, "on_touch_move", touch)
+    dispatch(bw, "on_touch_up", touch)
+    Clock.tick()
+    return [call for call in browser.calls if call[0] in INPUT_EVENTS]
+
+
+def scroll(bw, frames, events_per_frame):
+    """ Scrolls up with two fingers, 6 pixels per motion event of each
+    touch. Returns the wheel events (dx, dy) sent while scrolling and those
+    sent after lifting the fingers."""
+    browser = bw._browser
+    del browser.calls[:]
+    touches = [SyntheticTouch(2, (100, 100)), SyntheticTouch(3, (140, 100))]
+    for touch in touches:
+        touch.scale_for_screen(Window.width, Window.height)
+        dispatch(bw, "on_touch_down", touch)
+    for frame in range(frames):
+        for i in range(events_per_frame):
+            for touch in touches:
+                touch.move_to((touch.x, touch.y + 6))
+                dispatch(bw, "on_touch_move", touch)
+        Clock.tick()
+    Clock.tick()
+    scrolled = len(browser.calls)
+    for touch in touches:
+        dispatch(bw, "on_touch_up", touch)
+    end = time.time() + 5
+    while bw.scroller.is_flinging and time.time() < end:
+        Clock.tick()
+    Clock.tick()
+    wheels = [call[1][2:] for call in browser.calls
+              if call[0] == "SendMouseWheelEvent"]
+    during = len([call for call in browser.calls[:scrolled]
+                  if call[0] == "SendMouseWheelEvent"])
+    return wheels[:during], wheels[during:]
+
+
+def touch_placeholder():
+    """ Touches and types on a browser created while cefpython is
+    initialized asynchronously, before its CEF browser exists"""
+    cefbrowser.CEFBrowser.initialize_async()
+    bw = cefbrowser.CEFBrowser("http://example.com/", size=SIZE,
+                               size_hint=(None, None))
+    Window.add_widget(bw)
+    check(not bw._browser, "Created the CEF browser before the "
+          "initialization finished")
+    touch = SyntheticTouch(4, (10, 10))
+    touch.scale_for_screen(Window.width, Window.height)
+    dispatch(bw, "on_touch_down", touch)
+    check(not touch.grab_list, "Grabbed a touch without CEF browser")
+    touch.move_to((20, 20))
+    dispatch(bw, "on_touch_move", touch)
+    dispatch(bw, "on_touch_up", touch)
+    bw.focus = True
+    bw.keyboard_on_key_down(Window, (97, "a"), "a", [])
+    bw.keyboard_on_textinput(Window, "a")
+    bw.keyboard_on_key_up(Window, (97, "a"))
+    bw.focus = False
+    end = time.time() + 5
+    while not bw._browser and time.time() < end:
+        Clock.tick()
+    check(bw._browser, "No CEF browser after the initialization")
+    check(not [call for call in bw._browser.calls
+               if call[0] in INPUT_EVENTS + ("SendKeyEvent", )],
+          "Input sent from before the CEF browser was created")
+    Window.remove_widget(bw)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--events-per-frame", type=int, default=4)
+    args = parser.parse_args()
+
+    touch_placeholder()
+    bw = cefbrowser.CEFBrowser("http://example.com/", size=SIZE,
+                               size_hint=(None, None))
+    Window.add_widget(bw)
+    Clock.tick()
+    moves = args.frames * args.events_per_frame + 1
+    results = {}
+    for coalescing in (False, True):
+        bw.input_coalescing = coalescing
+        bw.input_stats.reset()
+        events = drag(bw, args.frames, args.events_per_frame)
+        stats = bw.input_stats.stats()
+        results[coalescing] = events
+        print("input_coalescing=%-5s received %4i sent %4i merged %4i "
+              "(%.0f/s received, %.0f/s sent)" % (
+                  coalescing, stats["received"], stats["sent"],
+                  stats["merged"], stats["received_rate"],
+                  stats["sent_rate"]))
+        names = [call[0] for call in events]
+        check(names[0] == "SendMouseClickEvent" and
+              not events[0][2]["mouseUp"],
+              "The drag does not start with a mouse down")
+        check(names[-1] == "SendMouseClickEvent" and events[-1][2]["mouseUp"],
+              "The drag does not end with a mouse up")
+        check(names.count("SendMouseClickEvent") == 2, "Clicks lost")
+        check(stats["pending"] == 0, "Events left pending")
+    uncoalesced = results[False]
+    coalesced = results[True]
+    check(len(uncoalesced) - 2 == moves - 1,
+          "Without coalescing every move is sent")
+    check(len(coalesced) - 2 <= args.frames + 1,
+          "More than one move sent per frame")
+    # The last position before the up event is not lost
+    check(coalesced[-2] == uncoalesced[-2], "Last move lost")
+
+    frames = 30
+    bw.kinetic_scrolling = False
+    bw.input_coalescing = False
+    wheels, flung = scroll(bw, frames, args.events_per_frame)
+    print("Scrolling without input_coalescing: %i wheel events in %i "
+          "frames" % (len(wheels), frames))
+    bw.input_coalescing = True
+    wheels, flung = scroll(bw, frames, args.events_per_frame)
+    print("Scrolling: %i wheel events in %i frames, %i after lifting the "
+          "fingers" % (len(wheels), frames, len(flung)))
+    check(len(wheels) <= frames + 1, "More than one wheel event per frame")
+    # Moving the second touch as well starts the scrolling
+    scrolled = sum(dy for dx, dy in wheels)
+    check(-scrolled == 6 * (frames * args.events_per_frame * 2 - 1),
+          "Scrolled distance lost")
+    check(not flung, "Scrolled on without kinetic_scrolling")
+    bw.kinetic_scrolling = True
+    bw.stats.reset()
+    wheels, flung = scroll(bw, frames, args.events_per_frame)
+    stats = bw.stats.summary()
+    print("Kinetic scrolling: %i wheel events after lifting the fingers "
+          "(%i px), %.0f wheel events/s, interval p50 %.1f ms p99 %.1f ms" % (
+              len(flung), -sum(dy for dx, dy in flung), stats["scroll_fps"],
+              stats["scroll_interval"][50] * 1000,
+              stats["scroll_interval"][99] * 1000))
+    check(flung and all(dy < 0 for dx, dy in flung), "No fling")
+    check(abs(flung[-1][1]) < abs(flung[0][1]), "The fling did not slow down")
+    check(not bw.scroller.is_flinging, "The fling did not stop")
+    check(stats["scrolls"] == len(wheels) + len(flung) and
+          0 < stats["scroll_fps"], "Scrolling not in the frame statistics")
+    print("OK")
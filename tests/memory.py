@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Test: The CEFMemoryMonitor attributes renderer processes to browsers in the
+order they started loading, samples their memory and dispatches its events
+when a limit is crossed. Fake renderer processes (sleeping Python
+interpreters with a --type=renderer argument) stand in for CEF's. Linux only.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+from kivy.core.window import Window  # noqa: E402,F401
+
+from cefbrowser import cefbrowser  # noqa: E402
+from cefbrowser.cefmemory import CEFMemoryMonitor  # noqa: E402
+
+RENDERER = [sys.executable, "-c", "import time; time.sleep(60)",
+            "--type=renderer"]
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def wait_for_sample(monitor, processes):
+    samples = monitor.samples
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        Clock.tick()
+        if samples < monitor.samples and \
+                monitor.renderer_processes == processes:
+            return
+        time.sleep(0.02)
+    check(False, "No sample with %i renderer processes" % processes)
+
+
+if __name__ == '__main__':
+    if not os.path.isdir("/proc/self"):
+        print("SKIP: No /proc")
+        sys.exit(0)
+    exceeded = []
+    monitor = CEFMemoryMonitor(interval=0.05, browser_limit=1)
+    monitor.bind(
+        on_browser_limit=lambda m, browser, rss: exceeded.append(browser))
+    browsers = [cefbrowser.CEFBrowser("http://example.com/%i" % i)
+                for i in range(2)]
+    processes = []
+    try:
+        for browser in browsers:
+            monitor.track(browser)
+            processes.append(subprocess.Popen(RENDERER))
+            wait_for_sample(monitor, len(processes))
+        print("Sampled: %s" % monitor.stats())
+        for browser, process in zip(browsers, processes):
+            check(browser.renderer_pids == [process.pid],
+                  "Renderer process attributed to the wrong browser")
+            check(browser.renderer_rss > 0, "No RSS sampled")
+        check(monitor.total_rss == sum(b.renderer_rss for b in browsers),
+              "Totals don't match")
+        check(exceeded == browsers, "Browser limit events: %s" % exceeded)
+        wait_for_sample(monitor, 2)
+        check(len(exceeded) == 2, "Limit event dispatched repeatedly")
+        processes.pop(0).kill()
+        wait_for_sample(monitor, 1)
+        check(browsers[0].renderer_rss == 0, "Exited renderer still counted")
+    finally:
+        monitor.stop()
+        for process in processes:
+            process.kill()
+    print("OK")
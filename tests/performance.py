@@ -2,78 +2,170 @@
 # -*- coding: UTF-8 -*-
 
 """
+Benchmark of the OnPaint -> texture pipeline. Synthetic paint buffers are fed
+through `ClientHandler.OnPaint` into `CEFBrowser` textures for a matrix of
+resolutions, dirty-rect patterns, browser counts and texture formats ("bgra"
+is uploaded natively, "rgba" needs the pixels to be converted). Throughput
+and latency percentiles are written as JSON. The latency of a paint lasts
+until it is uploaded to the texture, with `frame_coalescing` that is at the
+end of the frame.
+
+No CEF and no GPU are needed. On a headless Linux box, use SDL's offscreen
+driver with Mesa's software rasterizer:
+
+    SDL_VIDEODRIVER=offscreen LIBGL_ALWAYS_SOFTWARE=1 \\
+        python tests/performance.py --json bench.json
 """
 
-if False:
-    from kivy.app import App
-    from kivy.garden.cefpython import CEFBrowser
-
-    if __name__ == '__main__':
-        class PerformanceTesterApp(App):
-            def build(self):
-                CEFBrowser.update_command_line_switches({
-                    "enable-media-stream": "",
-                })
-                return CEFBrowser(url="http://youtube.com")
-                # http://cdn.peerjs.com/demo/videochat/
-                # http://www.craftymind.com/factory/html5video/CanvasVideo.html
-                # http://peacekeeper.futuremark.com/
-
-        PerformanceTesterApp().run()
-
-if True:
-    from kivy.app import App
-    from kivy.clock import Clock
-    from kivy.graphics import Color, Rectangle
-    from kivy.graphics.texture import Texture
-    from kivy.uix.widget import Widget
-
-    import time
-    import random
-
-    if __name__ == '__main__':
-        global w, r
-        w = Widget()
-        with w.canvas:
-            Color(1, 1, 1)
-            r = Rectangle(pos=w.pos, size=w.size)
-
-        class PerformanceTesterApp(App):
-            def build(self):
-                return w
-
-        w.mv = None
-
-        texture_size_hint = 1
-
-        def update(*largs):
-            global r, w
-            print("BEF", w, r.texture, r.texture.width, r.texture.height)
-            half = int(
-                w.size[0] * w.size[1] * texture_size_hint *
-                texture_size_hint / 2,
-            )
-            if not w.mv:
-                r.texture = Texture.create(
-                    size=(
-                        w.size[0]*texture_size_hint,
-                        w.size[1]*texture_size_hint,
-                    ),
-                    colorfmt="rgba", bufferfmt="ubyte")
-                w.ba = bytearray([255, 0, 0] * half + [0, 255, 0] * half)
-                w.mv = memoryview(w.ba)
-            else:
-                for i in range(
-                    random.randint(0, half*3),
-                    random.randint(half * 3, 2 * half * 3),
-                ):
-                    w.ba[i] = 255
-            beg = time.time()
-            r.texture.blit_buffer(w.mv)
-            print(time.time() - beg)
-            r.size = w.size
-            print("AFT", w, r.texture, r.texture.width, r.texture.height)
-
-        Clock.schedule_interval(update, 2)
-
-        PerformanceTesterApp().run()
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.config import Config  # noqa: E402
+Config.set("graphics", "maxfps", "0")
+
+import kivy  # noqa: E402
+from kivy.core.window import Window  # noqa: E402,F401
+from kivy.graphics import opengl  # noqa: E402
+
+from cefbrowser import cefbrowser, cefpaint  # noqa: E402
+from cefbrowser.cefstats import CEFRingBuffer  # noqa: E402
+
+PATTERNS = {
+    "full": lambda w, h, i, rnd: [[0, 0, w, h]],
+    "caret": lambda w, h, i, rnd: [[w // 3, h // 3, 2, 20]],
+    "ticker": lambda w, h, i, rnd: [[0, h - 40, w, 40]],
+    "scattered": lambda w, h, i, rnd: [
+        [rnd.randrange(0, w - 32), rnd.randrange(0, h - 32), 32, 32]
+        for _ in range(12)
+    ],
+}
+
+
+def parse_resolution(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def run_case(resolution, pattern, n_browsers, coalescing, texture_colorfmt,
+             frames, paints_per_frame):
+    width, height = resolution
+    cefpaint._texture_colorfmt = texture_colorfmt
+    rnd = random.Random(0)
+    paint_buffer = synthetic.SyntheticPaintBuffer(width, height)
+    browsers = []
+    for _ in range(n_browsers):
+        bw = cefbrowser.CEFBrowser(size=(width, height))
+        bw.frame_coalescing = coalescing
+        bw._realign()  # Textures must match the paints right away
+        browsers.append(bw)
+    latencies = CEFRingBuffer(frames * n_browsers * paints_per_frame)
+    opengl.glFinish()
+    begin = time.time()
+    for i in range(frames):
+        for bw in browsers:
+            pending = []
+            for _ in range(paints_per_frame):
+                dirty_rects = PATTERNS[pattern](width, height, i, rnd)
+                pending.append(time.time())
+                bw._browser.paint(paint_buffer, dirty_rects)
+                if not coalescing:
+                    latencies.append(time.time() - pending.pop())
+            if coalescing:
+                bw._flush_paints()
+                uploaded = time.time()
+                for paint_begin in pending:
+                    latencies.append(uploaded - paint_begin)
+        opengl.glFinish()
+    seconds = time.time() - begin
+    uploaded = sum(bw.stats.bytes_uploaded for bw in browsers)
+    paints = frames * n_browsers * paints_per_frame
+    for bw in browsers:
+        cefbrowser.client_handler.DoClose(bw._browser)
+    return {
+        "resolution": "%ix%i" % resolution,
+        "pattern": pattern,
+        "browsers": n_browsers,
+        "coalescing": coalescing,
+        "texture_colorfmt": texture_colorfmt,
+        "paints_per_frame": paints_per_frame,
+        "frames": frames,
+        "paints": paints,
+        "seconds": seconds,
+        "frames_per_second": frames * n_browsers / seconds,
+        "paints_per_second": paints / seconds,
+        "bytes_uploaded": uploaded,
+        "mb_per_second": uploaded / seconds / 1e6,
+        "paint_latency": latencies.percentiles((50, 90, 99)),
+        "coalesced_frames": sum(bw.coalesced_frames for bw in browsers),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--resolutions", default="640x480,1280x720,1920x1080")
+    parser.add_argument("--patterns", default=",".join(sorted(PATTERNS)))
+    parser.add_argument("--browsers", default="1,4")
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument(
+        "--paints-per-frame", type=int, default=1,
+        help="paints CEF delivers between two Kivy frames")
+    parser.add_argument(
+        "--coalescing", choices=("off", "on", "both"), default="both")
+    parser.add_argument("--texture-formats", default="bgra,rgba")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    coalescing = {
+        "off": [False], "on": [True], "both": [False, True],
+    }[args.coalescing]
+    native_colorfmt = cefpaint.texture_colorfmt()
+    results = []
+    for resolution in args.resolutions.split(","):
+        for pattern in args.patterns.split(","):
+            for n_browsers in args.browsers.split(","):
+                for coalesce in coalescing:
+                    for colorfmt in args.texture_formats.split(","):
+                        result = run_case(
+                            parse_resolution(resolution), pattern,
+                            int(n_browsers), coalesce, colorfmt,
+                            args.frames, args.paints_per_frame)
+                        print(
+                            "%(resolution)10s %(pattern)10s %(browsers)2i "
+                            "coalescing=%(coalescing)-5s "
+                            "%(texture_colorfmt)s "
+                            "%(frames_per_second)8.1f frames/s "
+                            "%(mb_per_second)8.1f MB/s" % result)
+                        results.append(result)
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "kivy": kivy.__version__,
+            "gl_vendor": opengl.glGetString(opengl.GL_VENDOR).decode(),
+            "gl_renderer": opengl.glGetString(opengl.GL_RENDERER).decode(),
+            "gl_version": opengl.glGetString(opengl.GL_VERSION).decode(),
+            "native_texture_colorfmt": native_colorfmt,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Test: The CEFBrowserPool creates idle browsers ahead of time, a CEFBrowser
+adopts one of them and the time saved is what the adopting browser did not
+wait for: creating the CEF browser and its first paint, each counted once.
+CreateBrowserSync() is made to block for `CREATION_TIME`. Runs without CEF
+(see synthetic.py).
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+cefpython = synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+
+from cefbrowser.cefpool import CEFBrowserPool  # noqa: E402
+
+CREATION_TIME = .1
+PAINT_DELAY = .05
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def create_browser_sync(*largs, **dargs):
+    time.sleep(CREATION_TIME)
+    return synthetic._create_browser_sync(*largs, **dargs)
+
+
+if __name__ == '__main__':
+    cefpython.CreateBrowserSync = create_browser_sync
+    pool = CEFBrowserPool(size=1, refill_delay=3600)
+    end = time.time() + 5
+    while not pool._idle and time.time() < end:
+        Clock.tick()
+    check(pool._idle, "Pool not filled")
+    entry = pool._idle[0]
+    check(CREATION_TIME <= entry.creation_time, "Creation time not measured")
+    time.sleep(PAINT_DELAY)
+    entry.browser.paint(synthetic.SyntheticPaintBuffer(16, 16), None)
+    check(entry.first_paint, "First paint not recorded")
+    check(pool.create_browser("http://example.com/")._browser is
+          entry.browser, "Pooled browser not adopted")
+    stats = pool.stats()
+    print("Pool: %s" % stats)
+    check(stats["hits"] == 1 and stats["misses"] == 0, "Hit not counted")
+    check(CREATION_TIME + PAINT_DELAY <= stats["time_saved"] <
+          2 * CREATION_TIME + PAINT_DELAY,
+          "Time saved does not count the creation once")
+    check(pool.acquire() is None and pool.stats()["misses"] == 1,
+          "Miss not counted")
+    pool.close()
+    print("OK")
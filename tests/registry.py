@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Regression test: Opening and closing browsers doesn't accumulate entries in
+the browser registry, late callbacks for closed browsers are ignored, and a
+widget dropped without closing its browser is reported and its browser
+closed. Runs without CEF (see synthetic.py).
+"""
+
+import gc
+import os
+import sys
+import weakref
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+from kivy.core.window import Window  # noqa: E402,F401
+
+from cefbrowser import cefbrowser  # noqa: E402
+
+BROWSERS = 200
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    registry = cefbrowser.client_handler.registry
+    handler = cefbrowser.client_handler
+    widgets = []
+    for i in range(BROWSERS):
+        bw = cefbrowser.CEFBrowser("http://example.com/%i" % i)
+        browser = bw._browser
+        widgets.append(weakref.ref(bw))
+        check(registry.get(browser) is bw, "Widget not registered")
+        handler.DoClose(browser)
+        # Late callbacks must neither raise nor resurrect the widget
+        handler.OnLoadingStateChange(browser, False, False, False)
+        handler.OnTitleChange(browser, "Late")
+        check(handler.OnPaint(
+            browser, 0, None, synthetic.SyntheticPaintBuffer(8, 8), 8, 8),
+            "Late paint not ignored")
+        del bw
+    gc.collect()
+    stats = registry.stats()
+    print("After opening and closing %i browsers: %s" % (BROWSERS, stats))
+    check(stats["live"] == 0, "Closed browsers are still registered")
+    check(not any(ref() for ref in widgets), "Closed browsers are alive")
+    check(stats["misses"] == 3 * BROWSERS, "Late callbacks not counted")
+
+    bw = cefbrowser.CEFBrowser("http://example.com/orphan")
+    browser = bw._browser
+    del bw
+    gc.collect()
+    Clock.tick()
+    stats = registry.stats()
+    print("After dropping a browser: %s" % stats)
+    check(stats["live"] == 0 and stats["orphaned"] == 1,
+          "Orphaned browser not detected")
+    check(browser.calls[-1][0] == "CloseBrowser",
+          "Orphaned browser not closed")
+    print("OK")
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Benchmark and regression test of the remote host (cefremote). The same
+synthetic pages are shown in-process and through a host process, comparing
+the latency from a click to its paint, the frames per second of an animation
+and how long Kivy frames take while a page blocks the message loop. Also
+checks that navigation, paints, resizing, `js.*` calls and bindings, closing
+and a crashing host work. Runs without CEF (see synthetic.py).
+
+    SDL_VIDEODRIVER=offscreen python tests/remote.py --json remote.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+cefpython = synthetic.install()
+
+ANIMATION = "synthetic://animation"
+STALL = "synthetic://stall"
+STATIC = "synthetic://static"
+
+
+class SyntheticPages:
+    """ Makes the synthetic browsers behave like pages on MessageLoopWork():
+    They load when navigated, paint when resized or clicked, pass the
+    JavaScript they execute to the binding "echo" and close. The ANIMATION
+    paints at 60 fps, the STALL as well, but it blocks the message loop for
+    `stall` seconds each time (like a slow script)."""
+    frame_interval = 1 / 60.
+    stall = 0.05
+
+    def __init__(self, module):
+        self.browsers = []
+        self._buffers = {}
+        self._create_browser_sync = module.CreateBrowserSync
+        module.CreateBrowserSync = self.create_browser_sync
+        module.MessageLoopWork = self.work
+
+    def create_browser_sync(self, *largs, **dargs):
+        browser = self._create_browser_sync(*largs, **dargs)
+        browser.page = {
+            "url": None, "size": None, "calls": 0, "scripts": 0, "painted": 0}
+        self.browsers.append(browser)
+        return browser
+
+    def work(self):
+        now = time.time()
+        for browser in list(self.browsers):
+            if browser.handler:
+                self._work(browser, now)
+
+    def _work(self, browser, now):
+        page = browser.page
+        handler = browser.handler
+        calls = browser.calls[page["calls"]:]
+        page["calls"] = len(browser.calls)
+        names = [call[0] for call in calls]
+        if "CloseBrowser" in names:
+            self.browsers.remove(browser)
+            handler.DoClose(browser)
+            handler.OnBeforeClose(browser)
+            return
+        paint = "SendMouseClickEvent" in names
+        if page["url"] != browser.url:
+            page["url"] = browser.url
+            frame = browser.main_frame
+            handler.OnLoadingStateChange(browser, True, False, False)
+            handler.OnLoadStart(browser, frame)
+            handler.OnAddressChange(browser, frame, browser.url)
+            handler.OnTitleChange(browser, "Title of " + browser.url)
+            handler.OnLoadEnd(browser, frame, 200)
+            handler.OnLoadingStateChange(browser, False, False, False)
+            paint = True
+        bindings = [call[1][0] for call in browser.calls
+                    if call[0] == "SetJavascriptBindings"]
+        echo = bindings[-1].functions.get("echo") if bindings else None
+        scripts = browser.main_frame.scripts[page["scripts"]:]
+        page["scripts"] = len(browser.main_frame.scripts)
+        for script in scripts:
+            if echo:
+                echo(script)
+        rect = []
+        handler.GetViewRect(browser, rect)
+        size = (rect[2], rect[3])
+        if size != page["size"]:
+            page["size"] = size
+            paint = True
+        if browser.url in (ANIMATION, STALL) and \
+                self.frame_interval <= now - page["painted"]:
+            paint = True
+        if browser.url == STALL:
+            time.sleep(self.stall)
+        if paint:
+            page["painted"] = now
+            if size not in self._buffers:
+                self._buffers[size] = synthetic.SyntheticPaintBuffer(*size)
+            browser.paint(self._buffers[size], [[0, 0, size[0], size[1]]])
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def host_main(argv):
+    """ The host process, with synthetic pages"""
+    from cefbrowser import cefremote
+    SyntheticPages(cefpython)
+    return cefremote.main(argv)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=2.,
+                        help="duration of the animation and stall cases")
+    parser.add_argument("--clicks", type=int, default=30)
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+    resolution = tuple(int(v) for v in args.resolution.split("x"))
+
+    from kivy.config import Config
+    Config.set("graphics", "maxfps", "60")
+    from kivy.clock import Clock
+    from kivy.core.window import Window
+
+    from cefbrowser import cefbrowser
+    from cefbrowser.cefpython import cefpython_pump
+    from cefbrowser.cefremote import CEFRemoteHost
+    from cefbrowser.cefstats import CEFRingBuffer
+
+    SyntheticPages(cefpython)
+    command = [sys.executable, os.path.realpath(__file__), "--host"]
+
+    def wait_for(condition, timeout=10.):
+        end = time.time() + timeout
+        while not condition():
+            if end < time.time():
+                return False
+            Clock.tick()
+        return True
+
+    def run(seconds):
+        """ Returns the intervals of the Kivy frames for `seconds`"""
+        intervals = CEFRingBuffer(int(seconds * 200))
+        end = time.time() + seconds
+        last = time.time()
+        while time.time() < end:
+            Clock.tick()
+            now = time.time()
+            intervals.append(now - last)
+            last = now
+        return intervals
+
+    def open_browser(host, url, size):
+        if host:
+            bw = host.create_browser(url, size=size, size_hint=(None, None))
+        else:
+            bw = cefbrowser.CEFBrowser(
+                url, size=size, size_hint=(None, None))
+        bw.paints = []
+        bw.bind(on_paint=lambda bw, view, width, height, rects, t:
+                bw.paints.append((time.time(), width, height)))
+        Window.add_widget(bw)
+        bw._realign()  # Textures must match the paints right away
+        check(wait_for(lambda: bw.paints), "No first paint")
+        return bw
+
+    def close_browser(bw):
+        bw._browser.CloseBrowser(True)
+        cefpython_pump.schedule_work()
+        check(wait_for(lambda: not bw.parent), "Browser not closed")
+
+    def benchmark(host):
+        result = {"mode": "remote" if host else "in-process"}
+        bw = open_browser(host, STATIC, (640, 480))
+        latencies = CEFRingBuffer(args.clicks)
+        for i in range(args.clicks):
+            paints = len(bw.paints)
+            begin = time.time()
+            bw._browser.SendMouseClickEvent(10, 10, 0, False, 1)
+            cefpython_pump.schedule_work()
+            check(wait_for(lambda: paints < len(bw.paints)), "Click lost")
+            latencies.append(bw.paints[-1][0] - begin)
+            Clock.tick()
+        result["click_to_paint"] = latencies.percentiles((50, 90, 99))
+        close_browser(bw)
+        for name, url, size in [("animation", ANIMATION, resolution),
+                                ("stall", STALL, (640, 480))]:
+            bw = open_browser(host, url, size)
+            paints = len(bw.paints)
+            uploaded = bw.stats.bytes_uploaded
+            intervals = run(args.seconds)
+            result[name] = {
+                "frames_per_second":
+                    (len(bw.paints) - paints) / args.seconds,
+                "mb_per_second":
+                    (bw.stats.bytes_uploaded - uploaded) / args.seconds / 1e6,
+                "frame_interval": intervals.percentiles((50, 90, 99)),
+            }
+            close_browser(bw)
+        if host:
+            for i in range(args.clicks):
+                host.ping()
+                count = len(host.round_trips)
+                wait_for(lambda: count < len(host.round_trips))
+            result["host"] = host.stats()
+        return result
+
+    # Functional checks
+    host = CEFRemoteHost(command)
+    bw = open_browser(host, "http://example.com/", (320, 240))
+    check(wait_for(lambda: bw.title == "Title of http://example.com/"),
+          "Title not received")
+    check(not bw.is_loading, "Still loading")
+    check(bw.paints[-1][1:] == (320, 240), "Wrong paint size")
+    check(0 < bw.stats.bytes_uploaded, "Paints not uploaded")
+    bw.size = (400, 300)
+    bw._realign()
+    check(wait_for(lambda: bw.paints[-1][1:] == (400, 300)),
+          "Not repainted after resizing")
+    received = []
+    bw.js.bind(echo=received.append)
+    bw.js.foo(1, "a")
+    check(wait_for(lambda: 'foo(1, "a");' in received),
+          "js.* call or binding not forwarded")
+    bw.url = "http://example.com/next"
+    check(wait_for(lambda: bw.title == "Title of http://example.com/next"),
+          "Navigation not forwarded")
+    browser = bw._browser
+    paths = [reader.path for reader in browser._readers.values()]
+    check(paths and all(os.path.exists(path) for path in paths),
+          "No frame ring")
+    close_browser(bw)
+    check(wait_for(lambda: not host.browsers), "Host did not close browser")
+    check(not any(os.path.exists(path) for path in paths),
+          "Frame ring left behind")
+    check(not cefbrowser.client_handler.registry.get(browser, False),
+          "Closed browser still registered")
+    host.close()
+    check(host._process.returncode == 0, "Host did not exit cleanly")
+
+    # A crashing host closes its browsers
+    host = CEFRemoteHost(command)
+    bw = open_browser(host, STATIC, (320, 240))
+    paths = [reader.path for reader in bw._browser._readers.values()]
+    host._process.kill()
+    check(wait_for(lambda: not host.is_running and not bw.parent),
+          "Browser of a crashed host not closed")
+    check(not any(os.path.exists(path) for path in paths),
+          "Frame ring of a crashed host left behind")
+    print("Functional checks passed")
+
+    results = [benchmark(None)]
+    host = CEFRemoteHost(command)
+    results.append(benchmark(host))
+    host.close()
+    for result in results:
+        print(
+            "%(mode)-10s click->paint p50 %(p50).1f ms p90 %(p90).1f ms" % {
+                "mode": result["mode"],
+                "p50": result["click_to_paint"][50] * 1000,
+                "p90": result["click_to_paint"][90] * 1000})
+        for name in ("animation", "stall"):
+            case = result[name]
+            print(
+                "%-10s %-9s %5.1f fps %7.1f MB/s, Kivy frames p50 %.1f ms "
+                "p99 %.1f ms" % (
+                    "", name, case["frames_per_second"],
+                    case["mb_per_second"],
+                    case["frame_interval"][50] * 1000,
+                    case["frame_interval"][99] * 1000))
+        if "host" in result:
+            print("%-10s host %s" % ("", result["host"]))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    in_process, remote = results
+    check(remote["stall"]["frame_interval"][90] <
+          in_process["stall"]["frame_interval"][90],
+          "A slow page stalls Kivy in the remote mode as well")
+    print("OK")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["--host"]:
+        sys.exit(host_main(sys.argv[2:]))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Synthetic stand-in for cefpython3. It lets the benchmarks and regression
+tests drive the paint pipeline of cefbrowser (ClientHandler.OnPaint, texture
+uploads, canvas) without CEF. Call `install()` before importing cefbrowser.
+"""
+
+import ctypes
+import os
+import sys
+import types
+
+
+PET_VIEW = 0
+PET_POPUP = 1
+
+
+class SyntheticPaintBuffer:
+    """ A BGRA paint buffer like the one CEF passes to OnPaint"""
+
+    def __init__(self, width, height, fill=0x80):
+        self.width = width
+        self.height = height
+        self.data = bytearray([fill]) * (width * height * 4)
+        self._c_data = (ctypes.c_char * len(self.data)).from_buffer(self.data)
+
+    def GetIntPointer(self):  # noqa: N802
+        return ctypes.addressof(self._c_data)
+
+    def GetString(self, mode="bgra", origin="top-left"):  # noqa: N802
+        return bytes(self.data)
+
+
+class SyntheticFrame:
+    def __init__(self, browser):
+        self.browser = browser
+        self.scripts = []
+
+    def GetIdentifier(self):  # noqa: N802
+        return self.browser.identifier
+
+    def GetName(self):  # noqa: N802
+        return ""
+
+    def GetUrl(self):  # noqa: N802
+        return self.browser.url
+
+    def IsMain(self):  # noqa: N802
+        return True
+
+    def ExecuteJavascript(self, js_code):  # noqa: N802
+        self.scripts.append(js_code)
+
+
+class SyntheticBrowser:
+    """ Records every call of a method that is not implemented explicitly in
+    `calls` (name and arguments), e.g. the input events."""
+    _next_identifier = 1
+
+    def __init__(self, url="", settings=None):
+        self.identifier = SyntheticBrowser._next_identifier
+        SyntheticBrowser._next_identifier += 1
+        self.url = url
+        self.settings = settings or {}
+        self.handler = None
+        self.main_frame = SyntheticFrame(self)
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name[:1].isupper():
+            def record(*largs, **dargs):
+                self.calls.append((name, largs, dargs))
+            return record
+        raise AttributeError(name)
+
+    def GetIdentifier(self):  # noqa: N802
+        return self.identifier
+
+    def GetUrl(self):  # noqa: N802
+        return self.url
+
+    def GetMainFrame(self):  # noqa: N802
+        return self.main_frame
+
+    def GetFocusedFrame(self):  # noqa: N802
+        return self.main_frame
+
+    def GetWindowHandle(self):  # noqa: N802
+        return 0
+
+    def IsPopup(self):  # noqa: N802
+        return False
+
+    def Navigate(self, url):  # noqa: N802
+        self.url = url
+
+    def SetClientHandler(self, handler):  # noqa: N802
+        self.handler = handler
+
+    def paint(self, paint_buffer, dirty_rects, element_type=PET_VIEW):
+        """ Delivers `paint_buffer` to the client handler like CEF does"""
+        return self.handler.OnPaint(
+            self, element_type, dirty_rects, paint_buffer,
+            paint_buffer.width, paint_buffer.height)
+
+
+class SyntheticWindowInfo:
+    def SetAsOffscreen(self, handle):  # noqa: N802
+        self.handle = handle
+
+    def SetAsChild(self, handle, rect):  # noqa: N802
+        self.handle = handle
+
+
+class SyntheticJavascriptBindings:
+    def __init__(self, **dargs):
+        self.functions = {}
+
+    def SetFunction(self, name, function):  # noqa: N802
+        self.functions[name] = function
+
+    def GetFunctions(self):  # noqa: N802
+        return self.functions
+
+    def Rebind(self):  # noqa: N802
+        pass
+
+
+class SyntheticCookieManager:
+    @staticmethod
+    def GetGlobalManager():  # noqa: N802
+        return None
+
+
+def _create_browser_sync(window_info, settings, navigateUrl=""):  # noqa: N803
+    return SyntheticBrowser(navigateUrl, settings)
+
+
+def _module_getattr(name):
+    # All the cefpython constants not needed explicitly
+    if name.isupper():
+        return 0
+    raise AttributeError(name)
+
+
+def build_module():
+    cefpython = types.ModuleType("cefpython3.cefpython")
+    cefpython.__dict__.update({
+        "__getattr__": _module_getattr,
+        "PET_VIEW": PET_VIEW,
+        "PET_POPUP": PET_POPUP,
+        "DRAG_OPERATION_NONE": 0,
+        "DRAG_OPERATION_EVERY": 0xffffffff,
+        "EVENTFLAG_LEFT_MOUSE_BUTTON": 1 << 4,
+        "MOUSEBUTTON_LEFT": 0,
+        "MOUSEBUTTON_MIDDLE": 1,
+        "MOUSEBUTTON_RIGHT": 2,
+        "GetModuleDirectory": lambda: "",
+        "Initialize": lambda settings, switches=None: True,
+        "Shutdown": lambda: None,
+        "MessageLoopWork": lambda: None,
+        "SetGlobalClientCallback": lambda name, callback: None,
+        "CreateBrowserSync": _create_browser_sync,
+        "WindowInfo": SyntheticWindowInfo,
+        "JavascriptBindings": SyntheticJavascriptBindings,
+        "CookieManager": SyntheticCookieManager,
+    })
+    return cefpython
+
+
+def install():
+    """ Makes `from cefpython3 import cefpython` return the synthetic module
+    and the cefbrowser package importable from this repository."""
+    if "cefpython3" not in sys.modules:
+        package = types.ModuleType("cefpython3")
+        package.cefpython = build_module()
+        sys.modules["cefpython3"] = package
+        sys.modules["cefpython3.cefpython"] = package.cefpython
+    repository = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    if repository not in sys.path:
+        sys.path.insert(0, repository)
+    return sys.modules["cefpython3"].cefpython
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+"""
+Test: The CEFThumbnailCache downscales the paints of the tracked browsers
+as they happen, without enabling `capture_mode` (no full-size copy of the
+frames is kept). It refreshes at most `max_rate` times per second and asks
+a browser that did not paint when a refresh is due to repaint. Runs without
+CEF (see synthetic.py).
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault("KIVY_NO_ARGS", "1")
+os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+
+import synthetic  # noqa: E402
+
+synthetic.install()
+
+from kivy.clock import Clock  # noqa: E402
+
+from cefbrowser import cefbrowser  # noqa: E402
+from cefbrowser.cefthumbnail import CEFThumbnailCache  # noqa: E402
+
+SIZE = (640, 400)
+
+
+def check(condition, message):
+    if not condition:
+        print("FAIL: %s" % message)
+        sys.exit(1)
+
+
+def invalidations(bw):
+    return len([call for call in bw._browser.calls
+                if call[0] == "Invalidate"])
+
+
+if __name__ == '__main__':
+    cache = CEFThumbnailCache(size=(160, 100), max_rate=2.)
+    bw = cefbrowser.CEFBrowser("http://example.com/", size=SIZE)
+    cache.track(bw)
+    check(cache.get(bw) is None, "Thumbnail before the first paint")
+    buffer = synthetic.SyntheticPaintBuffer(*SIZE)
+    bw._browser.paint(buffer, None)
+    check(bw.capture_mode == "off" and bw._capture is None,
+          "Tracking enabled capturing the paints")
+    texture = cache.get(bw)
+    check(texture is not None and tuple(texture.size) == (160, 100),
+          "No thumbnail of the paint")
+    check(cache.stats()["bytes"] == 160 * 100 * 4, "Thumbnail not accounted")
+
+    # A paint before the refresh is due is not taken, CEF is asked to
+    # repaint when it is due instead
+    bw._browser.paint(buffer, None)
+    check(cache.stats()["refreshes"] == 1, "Refreshed faster than max_rate")
+    requested = invalidations(bw)
+    end = time.time() + 2
+    while invalidations(bw) == requested and time.time() < end:
+        Clock.tick()
+    check(requested < invalidations(bw), "No repaint requested")
+    bw._browser.paint(buffer, None)
+    check(cache.stats()["refreshes"] == 2, "Repaint not taken")
+
+    cache.untrack(bw)
+    check(cache.stats()["thumbnails"] == 0, "Thumbnail kept after untrack")
+    check(bw.capture_mode == "off", "capture_mode changed")
+    print("Thumbnails: %s" % cache.stats())
+    print("OK")